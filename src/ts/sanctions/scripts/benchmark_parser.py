@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+"""
+Benchmarks of parse_opensanctions.py on a synthetic FTM corpus, without network access.
+Generates a seeded corpus with a controlled mix of scripts and properties, times each stage
+of the parser on it, and saves the throughput and memory to a results file that can be
+compared with the results of another commit.
+"""
+
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Dict, Any, Iterator, Callable, Optional
+
+from parse_opensanctions import (
+    PARSER_VERSION,
+    CSVPersonWriter,
+    JSONPersonWriter,
+    NDJSONPersonWriter,
+    MRZPreimageWriter,
+    NameCache,
+    OpenSanctionsParser,
+    clean_name_for_mrz,
+    script_counts,
+    transliterate_to_latin,
+    write_persons,
+)
+from screening import ScreeningIndex
+
+# Name parts of each script the corpus draws from
+LATIN_FIRST_NAMES = ['John', 'Maria', 'José', 'Anne-Marie', 'François', 'Jürgen', 'Øystein', 'Zoë', 'Michael',
+                     'Ali', 'Fatima', 'Chen', "D'Arcy", 'Ngozi', 'Łukasz', 'Ewa', 'Søren', 'Ines']
+LATIN_LAST_NAMES = ['Smith', 'García', "O'Brien", 'Müller', 'Dupont', 'Nowak', 'Kowalski', 'Van der Berg',
+                    'Rossi', 'Nguyen', 'Al-Sayed', 'Popescu', 'Fernández', 'Østergaard', 'Ben Ali']
+CYRILLIC_FIRST_NAMES = ['Иван', 'Сергей', 'Ольга', 'Наталья', 'Алексей', 'Дмитрий', 'Юлия', 'Евгений',
+                        'Михаил', 'Татьяна', 'Андрей', 'Ксения']
+CYRILLIC_LAST_NAMES = ['Иванов', 'Петров', 'Смирнова', 'Кузнецов', 'Попов', 'Соколова', 'Лебедев',
+                       'Новиков', 'Фёдоров', 'Щербаков', 'Жуков', 'Яковлева']
+ARABIC_FIRST_NAMES = ['محمد', 'أحمد', 'فاطمة', 'علي', 'حسن', 'خديجة', 'عمر', 'يوسف', 'مريم', 'إبراهيم']
+ARABIC_LAST_NAMES = ['عبد الله', 'الحسن', 'المصري', 'القحطاني', 'الشمري', 'بن علي', 'الزهراني', 'حداد']
+
+NAME_PARTS = {
+    'latin': (LATIN_FIRST_NAMES, LATIN_LAST_NAMES),
+    'cyrillic': (CYRILLIC_FIRST_NAMES, CYRILLIC_LAST_NAMES),
+    'arabic': (ARABIC_FIRST_NAMES, ARABIC_LAST_NAMES),
+}
+
+COUNTRIES = ['ru', 'us', 'gb', 'fr', 'de', 'ir', 'sy', 'cn', 'ua', 'by', 'ae', 'eg', 'ng', 've', 'kp']
+DATASETS = ['us_ofac_sdn', 'eu_fsf', 'gb_hmt_sanctions', 'un_sc_sanctions', 'ch_seco_sanctions',
+            'interpol_red_notices', 'wd_peps', 'everypolitician', 'us_sam_exclusions', 'gb_coh_disqualified']
+TOPICS = ['sanction', 'debarment', 'wanted', 'crime', 'pep', 'poi', 'role.rca']
+OTHER_SCHEMAS = ['Company', 'Organization', 'LegalEntity', 'Vessel', 'Address', 'Sanction']
+
+# Stages benchmarked by default, in the order of the pipeline
+STAGES = ['script_detection', 'transliteration', 'extract_person_data', 'parse_file', 'writers', 'screening']
+
+
+class CorpusConfig:
+    """Mix of the synthetic corpus. The script shares are relative weights of the person names."""
+
+    def __init__(self, entities: int = 10000, seed: int = 1, latin: float = 0.6, cyrillic: float = 0.25,
+                 arabic: float = 0.15, person_ratio: float = 0.7, name_variants: int = 2,
+                 passport_ratio: float = 0.5, addresses: int = 2, datasets: int = 3):
+        self.entities = entities
+        self.seed = seed
+        self.latin = latin
+        self.cyrillic = cyrillic
+        self.arabic = arabic
+        self.person_ratio = person_ratio
+        self.name_variants = name_variants
+        self.passport_ratio = passport_ratio
+        self.addresses = addresses
+        self.datasets = datasets
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+def _variants(rng: random.Random, parts: List[str], max_count: int) -> List[str]:
+    return rng.sample(parts, rng.randint(1, max(1, min(max_count, len(parts)))))
+
+
+def _person(rng: random.Random, config: CorpusConfig, index: int) -> Dict[str, Any]:
+    script = rng.choices(['latin', 'cyrillic', 'arabic'], weights=[config.latin, config.cyrillic, config.arabic])[0]
+    first_names, last_names = NAME_PARTS[script]
+    first = _variants(rng, first_names, config.name_variants)
+    last = _variants(rng, last_names, config.name_variants)
+    properties = {
+        'name': [f"{first[0]} {last[0]}"],
+        'firstName': first,
+        'lastName': last,
+        'birthDate': [rng.choice([
+            f"{rng.randint(1940, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            f"{rng.randint(1940, 2005)}",
+        ])],
+        'nationality': rng.sample(COUNTRIES, rng.randint(0, 2)),
+        'topics': rng.sample(TOPICS, rng.randint(1, 2)),
+    }
+    if rng.random() < 0.3:
+        properties['middleName'] = _variants(rng, first_names, config.name_variants)
+    if rng.random() < 0.4:
+        # A Latin spelling of a non-Latin name, as many lists provide
+        properties['alias'] = [f"{rng.choice(LATIN_FIRST_NAMES)} {rng.choice(LATIN_LAST_NAMES)}"]
+    if rng.random() < config.passport_ratio:
+        properties['passportNumber'] = [
+            ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(rng.randint(6, 10)))
+            for _ in range(rng.randint(1, 2))
+        ]
+    if config.addresses:
+        properties['address'] = [
+            f"{rng.randint(1, 200)} Main Street, City {rng.randint(1, 500)}, {rng.choice(COUNTRIES).upper()}"
+            for _ in range(rng.randint(0, config.addresses))
+        ]
+    return {
+        'id': f"NK-{index:08d}",
+        'schema': 'Person',
+        'properties': properties,
+        'datasets': rng.sample(DATASETS, rng.randint(1, max(1, config.datasets))),
+    }
+
+
+def generate_entities(config: CorpusConfig) -> Iterator[Dict[str, Any]]:
+    """Yield the entities of the corpus. The same configuration always yields the same entities."""
+    rng = random.Random(config.seed)
+    for index in range(config.entities):
+        if rng.random() < config.person_ratio:
+            yield _person(rng, config, index)
+        else:
+            yield {
+                'id': f"NK-{index:08d}",
+                'schema': rng.choice(OTHER_SCHEMAS),
+                'properties': {'name': [f"{rng.choice(LATIN_LAST_NAMES)} Holdings {index}"],
+                               'country': rng.sample(COUNTRIES, 1)},
+                'datasets': rng.sample(DATASETS, 1),
+            }
+
+
+def write_corpus(config: CorpusConfig, output_file: str) -> int:
+    """Write the corpus as NDJSON, gzip compressed if the file name ends with .gz. Returns the file size."""
+    opener = gzip.open if output_file.endswith('.gz') else open
+    with opener(output_file, 'wt', encoding='utf-8') as f:
+        for entity in generate_entities(config):
+            f.write(json.dumps(entity, ensure_ascii=False) + '\n')
+    return os.path.getsize(output_file)
+
+
+def measure(run: Callable[[], Any], items: int, repeat: int, memory: bool) -> Dict[str, Any]:
+    """
+    Time a stage. The stages going through the name cache start each run with a new parser,
+    so with an empty name cache.
+
+    Returns:
+        The best and all run times, the throughput of the best run and, if measured,
+        the peak memory allocated during one more traced run
+    """
+    times = []
+    for _ in range(repeat):
+        # The messages of the parser are left out, only the progress of the benchmarks is printed
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    result = {
+        'items': items,
+        'seconds': min(times),
+        'runs': times,
+        'items_per_second': items / min(times) if min(times) > 0 else 0.0,
+        'peak_traced_bytes': None,
+    }
+    if memory:
+        # Tracing slows everything down, so the memory is measured in a run of its own
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run()
+        result['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(config: CorpusConfig, corpus_file: str, stages: List[str], repeat: int = 3,
+                   workers: int = 1, sample: int = 100000, memory: bool = True) -> Dict[str, Any]:
+    """
+    Benchmark the stages of the parser on a corpus written by write_corpus.
+    The stages on single names and entities run on the first `sample` entities, the
+    full file parse and the writers on the whole corpus. The screening queries the
+    index of the whole corpus with the persons of the sample, as listed and with their
+    first and last names swapped, which mostly don't match.
+    """
+    sample_entities = []
+    for entity in generate_entities(config):
+        if len(sample_entities) == sample:
+            break
+        sample_entities.append(entity)
+    names = [name for entity in sample_entities if entity['schema'] == 'Person'
+             for name in entity['properties']['name'] + entity['properties']['firstName'] + entity['properties']['lastName']]
+
+    results = {}
+    for stage in stages:
+        print(f"Benchmarking {stage}...")
+        if stage == 'script_detection':
+            results[stage] = measure(lambda: [script_counts(name) for name in names], len(names), repeat, memory)
+        elif stage == 'transliteration':
+            results[stage] = measure(lambda: [clean_name_for_mrz(transliterate_to_latin(name)) for name in names],
+                                     len(names), repeat, memory)
+        elif stage == 'extract_person_data':
+            def extract():
+                parser = OpenSanctionsParser()
+                return [parser.extract(entity) for entity in sample_entities]
+            results[stage] = measure(extract, len(sample_entities), repeat, memory)
+        elif stage == 'parse_file':
+            results[stage] = measure(lambda: OpenSanctionsParser(workers=workers).parse([corpus_file], merge=False),
+                                     config.entities, repeat, memory)
+        elif stage == 'writers':
+            persons = OpenSanctionsParser(workers=workers).parse([corpus_file], merge=False)
+            with tempfile.TemporaryDirectory() as output_dir:
+                def write():
+                    write_persons(persons, [
+                        CSVPersonWriter(os.path.join(output_dir, 'persons.csv')),
+                        JSONPersonWriter(os.path.join(output_dir, 'persons.json')),
+                        NDJSONPersonWriter(os.path.join(output_dir, 'persons.ndjson')),
+                        MRZPreimageWriter(os.path.join(output_dir, 'persons_mrz.bin')),
+                    ])
+                results[stage] = measure(write, len(persons), repeat, memory)
+        elif stage == 'screening':
+            index = ScreeningIndex()
+            for person in OpenSanctionsParser(workers=workers).parse([corpus_file], merge=False):
+                index.add(person.to_dict())
+            queries = []
+            for entity in sample_entities:
+                if entity['schema'] != 'Person':
+                    continue
+                properties = entity['properties']
+                query = {'first_name': properties['firstName'][0], 'last_name': properties['lastName'][0],
+                         'birth_date': properties['birthDate'][0],
+                         'passport_number': properties.get('passportNumber', [None])[0],
+                         'nationality': properties['nationality'][:1]}
+                queries.append(query)
+                queries.append({**query, 'first_name': query['last_name'], 'last_name': query['first_name']})
+
+            def screen():
+                index.name_cache = NameCache()
+                return index.screen(queries)
+            results[stage] = measure(screen, len(queries), repeat, memory)
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Commit of the working tree the benchmarks run from, if it is a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the throughput of each stage against a baseline results file."""
+    print(f"\nCompared to {baseline.get('commit') or 'the baseline'}:")
+    for stage, stage_results in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or not previous['items_per_second']:
+            print(f"  {stage}: no baseline")
+            continue
+        ratio = stage_results['items_per_second'] / previous['items_per_second']
+        print(f"  {stage}: {stage_results['items_per_second']:,.0f}/s vs {previous['items_per_second']:,.0f}/s "
+              f"({(ratio - 1) * 100:+.1f}%)")
+
+
+def main():
+    """Generate a synthetic corpus and benchmark the parser on it."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark parse_opensanctions.py on a seeded synthetic FTM corpus.'
+    )
+    parser.add_argument('--entities', type=int, default=10000, help='Number of entities in the corpus (default: 10000)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the corpus (default: 1)')
+    parser.add_argument('--latin', type=float, default=0.6, help='Weight of Latin person names (default: 0.6)')
+    parser.add_argument('--cyrillic', type=float, default=0.25, help='Weight of Cyrillic person names (default: 0.25)')
+    parser.add_argument('--arabic', type=float, default=0.15, help='Weight of Arabic person names (default: 0.15)')
+    parser.add_argument('--person-ratio', type=float, default=0.7,
+                        help='Share of Person entities, the others having other schemas (default: 0.7)')
+    parser.add_argument('--name-variants', type=int, default=2,
+                        help='Maximum number of variants of each name part of a person (default: 2)')
+    parser.add_argument('--passport-ratio', type=float, default=0.5,
+                        help='Share of persons with passport numbers (default: 0.5)')
+    parser.add_argument('--addresses', type=int, default=2, help='Maximum number of addresses per person (default: 2)')
+    parser.add_argument('--datasets', type=int, default=3, help='Maximum number of datasets per person (default: 3)')
+    parser.add_argument('--corpus', help='Write the corpus to this file, .gz for gzip, instead of a temporary file')
+    parser.add_argument('--generate-only', action='store_true', help='Only write the corpus given with --corpus')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='Stages to benchmark (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each stage, the best one is kept (default: 3)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes of the full file parse (default: 1)')
+    parser.add_argument('--sample', type=int, default=100000,
+                        help='Entities the name and entity stages run on (default: 100000)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run measuring the memory of each stage')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='Output JSON file of the results (default: benchmark_results.json)')
+    parser.add_argument('--compare', metavar='RESULTS_FILE', help='Results file of another commit to compare with')
+
+    args = parser.parse_args()
+    if args.generate_only and not args.corpus:
+        parser.error('--generate-only requires --corpus')
+
+    config = CorpusConfig(args.entities, args.seed, args.latin, args.cyrillic, args.arabic, args.person_ratio,
+                          args.name_variants, args.passport_ratio, args.addresses, args.datasets)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_file = args.corpus or os.path.join(temp_dir, 'entities.ftm.json')
+        start = time.perf_counter()
+        size = write_corpus(config, corpus_file)
+        print(f"Generated {config.entities:,} entities ({size / (1 << 20):,.1f} MB) in {time.perf_counter() - start:.1f}s")
+        if args.generate_only:
+            print(f"Corpus saved to {corpus_file}")
+            return
+
+        stages = run_benchmarks(config, corpus_file, args.stages, args.repeat, args.workers, args.sample,
+                                not args.no_memory)
+
+    results = {
+        'parser_version': PARSER_VERSION,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': config.to_dict(),
+        'corpus_bytes': size,
+        'repeat': args.repeat,
+        'workers': args.workers,
+        'stages': stages,
+    }
+    for stage, stage_results in stages.items():
+        memory = stage_results['peak_traced_bytes']
+        memory = f", peak {memory / (1 << 20):,.1f} MB traced" if memory is not None else ""
+        print(f"  {stage}: {stage_results['items_per_second']:,.0f} items/s "
+              f"({stage_results['items']:,} in {stage_results['seconds']:.3f}s{memory})")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Error reading file: {e}")
+            sys.exit(1)
+        print_comparison(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+"""
+Non-membership witnesses for the sanctions exclusion check.
+Loads a serialized sanctions tree once and answers batches of queries with the two
+adjacent leaves around each query and their sibling paths, as ordered_mt_non_membership
+in ordered_mt.nr expects them.
+"""
+
+import bisect
+import json
+import multiprocessing
+import sys
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+from ordered_mt import NODE_SIZE, OrderedMerkleTree, load_tree
+from poseidon2 import hash_leaves
+
+
+def format_field(value: int) -> str:
+    """Field element as a 0x-prefixed hex string, as in the Noir tests and Prover.toml files."""
+    return f"0x{value:064x}"
+
+
+class _SortedLeaves:
+    """
+    The leaves of a tree as a sequence of 32 bytes big-endian keys, read from the leaf level
+    buffer on demand. The byte order of the keys is their numeric order, so the leaves can
+    be binary searched in place, touching only the pages of the probed leaves.
+    """
+
+    def __init__(self, level):
+        self.level = level
+
+    def __len__(self) -> int:
+        return len(self.level) // NODE_SIZE
+
+    def __getitem__(self, index: int) -> bytes:
+        return bytes(self.level[index * NODE_SIZE:(index + 1) * NODE_SIZE])
+
+
+class NonMembershipWitnesses:
+    """
+    Answers non-membership queries over a sanctions tree.
+    The neighbors of a query are found by binary search over the sorted leaves,
+    and the sibling paths are read from the level buffers.
+    """
+
+    def __init__(self, tree: OrderedMerkleTree):
+        self.tree = tree
+        # The leaves of the tree are sorted, the 0 leaf at index 0 included
+        self.leaves = _SortedLeaves(tree.levels[0])
+
+    @classmethod
+    def load(cls, tree_file: str) -> 'NonMembershipWitnesses':
+        """Load a tree in the binary format, memory-mapped, or serialized as JSON by ordered_mt.py or generate.ts."""
+        return cls(load_tree(tree_file))
+
+    def inclusion_proof(self, index: int) -> Dict[str, Any]:
+        """SanctionsOrderedMerkleTreeInclusionProof of the leaf at an index."""
+        return {
+            'leaf': format_field(self.tree.leaf(index)),
+            'leaf_index': index,
+            'sibling_path': [format_field(node) for node in self.tree.sibling_path(index)],
+        }
+
+    def prove(self, value: int) -> Optional[Dict[str, Any]]:
+        """
+        SanctionsOrderedMerkleTreeProof that a value is not a leaf of the tree.
+
+        Returns:
+            The proof, or None if the value is a leaf or is above the largest leaf,
+            in which case there is no non-membership proof for it
+        """
+        key = value.to_bytes(NODE_SIZE, 'big')
+        index = bisect.bisect_left(self.leaves, key)
+        if index == len(self.leaves) or self.leaves[index] == key:
+            return None
+        return {
+            'left': self.inclusion_proof(index - 1),
+            'right': self.inclusion_proof(index),
+        }
+
+    def prove_batch(self, values: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """Non-membership proofs of several values, None for the values in the tree."""
+        return [self.prove(value) for value in values]
+
+
+def iter_queries(persons_file: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield the entry id, group and MRZ preimage of each query in the output of parse_opensanctions.py."""
+    from parse_opensanctions import MRZPreimages, iter_entities
+
+    for person in iter_entities(persons_file):
+        for group, row in MRZPreimages.iter_rows(person):
+            yield person['id'], group, row
+
+
+def main():
+    """Generate the non-membership witnesses of the entries of a parse_opensanctions.py output."""
+    import argparse
+    from parse_opensanctions import MRZPreimages
+
+    parser = argparse.ArgumentParser(
+        description='Generate the sanctions tree non-membership witnesses of the MRZ data of persons.'
+    )
+    parser.add_argument(
+        'tree_file',
+        help='Sanctions tree in the binary format or serialized as JSON, written by ordered_mt.py or generate.ts'
+    )
+    parser.add_argument(
+        'persons_file',
+        help='Persons JSON or NDJSON file written by parse_opensanctions.py'
+    )
+    parser.add_argument(
+        '--output',
+        default='witnesses.ndjson',
+        help='Output NDJSON file with one witness per query (default: witnesses.ndjson)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of processes used to hash the queries (default: number of CPUs)'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        witnesses = NonMembershipWitnesses.load(args.tree_file)
+        queries = list(iter_queries(args.persons_file))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+
+    print(f"Loaded a tree of {witnesses.tree.leaf_count:,} leaves, root {format_field(witnesses.tree.root)}")
+    print(f"Hashing {len(queries):,} queries with {args.workers} workers...")
+    values = hash_leaves([MRZPreimages.row_codes(row) for _, _, row in queries], args.workers)
+
+    members = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for (entry_id, group, row), value, proof in zip(queries, values, witnesses.prove_batch(values)):
+            members += proof is None
+            f.write(json.dumps({
+                'id': entry_id,
+                'group': group,
+                'preimage': row,
+                'leaf': format_field(value),
+                'proof': proof,
+            }, ensure_ascii=False) + '\n')
+
+    print(f"Queries without a non-membership proof: {members:,}")
+    print(f"Witnesses saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
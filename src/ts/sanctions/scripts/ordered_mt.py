@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+"""
+Ordered Merkle tree of the sanctions leaves, as verified by ordered_mt.nr.
+Builds the same tree as AsyncOrderedMT in generate.ts from the leaves hashed by poseidon2.py,
+with each level in a contiguous buffer and the levels hashed in parallel batches.
+"""
+
+import json
+import mmap
+import multiprocessing
+import struct
+import sys
+from typing import List, Dict
+
+from poseidon2 import poseidon2_hash
+
+# SANCTIONS_ORDERED_MERKLE_TREE_LEAF_DEPTH in types.nr
+TREE_DEPTH = 18
+
+# Size of a node in the level buffers, as a 32 bytes big-endian integer
+NODE_SIZE = 32
+
+# Node pairs hashed per task sent to the worker processes
+HASH_BATCH_SIZE = 4096
+
+# Header of the binary tree format: magic bytes, depth, leaf count and root,
+# followed by the node count of each level and the levels from the leaves up
+BINARY_MAGIC = b'ZKPOMT\x00\x01'
+BINARY_HEADER = struct.Struct('<8sIQ32s')
+BINARY_LEVEL_COUNT = struct.Struct('<Q')
+
+# Order in which generate.ts concatenates the groups of leaves
+LEAF_GROUPS = ['name', 'name_dob', 'name_yob', 'passport_country']
+
+
+def hash_pair(left: int, right: int) -> int:
+    """Hash of an inner node, as Poseidon2::hash([left, right], 2) in ordered_mt.nr."""
+    return poseidon2_hash([left, right], 2)
+
+
+def hash_level_batch(nodes: bytes) -> bytes:
+    """Hash consecutive pairs of nodes into their parents. Worker entry point of OrderedMerkleTree.build."""
+    parents = bytearray()
+    for offset in range(0, len(nodes), 2 * NODE_SIZE):
+        left = int.from_bytes(nodes[offset:offset + NODE_SIZE], 'big')
+        right = int.from_bytes(nodes[offset + NODE_SIZE:offset + 2 * NODE_SIZE], 'big')
+        parents += hash_pair(left, right).to_bytes(NODE_SIZE, 'big')
+    return bytes(parents)
+
+
+def zero_hashes(depth: int) -> List[int]:
+    """Root of an empty subtree of each height, the leaves of an empty subtree being 0."""
+    zeros = [0]
+    for _ in range(depth):
+        zeros.append(hash_pair(zeros[-1], zeros[-1]))
+    return zeros
+
+
+class OrderedMerkleTree:
+    """
+    Merkle tree of sorted leaves, preceded by a 0 leaf and padded with 0 leaves up to 2^depth,
+    so that two adjacent leaves prove the absence of any value between them.
+
+    Each level is a contiguous buffer of 32 bytes big-endian nodes holding only the
+    nodes over the actual leaves; the nodes past them are roots of empty subtrees.
+    The buffers are either in memory or views of a memory-mapped binary tree file.
+    """
+
+    def __init__(self, levels: List[bytearray], depth: int = TREE_DEPTH):
+        self.depth = depth
+        self.levels = levels
+        self.zeros = zero_hashes(depth)
+        self._mmap = None
+
+    @classmethod
+    def build(cls, leaves: List[int], depth: int = TREE_DEPTH, workers: int = 1) -> 'OrderedMerkleTree':
+        """
+        Sort the leaves and hash the tree over them.
+
+        Args:
+            leaves: Leaf values, in any order
+            depth: Depth of the tree
+            workers: Number of worker processes used to hash the levels
+
+        Returns:
+            The tree
+        """
+        leaves = [0] + sorted(leaves)
+        if len(leaves) > 1 << depth:
+            raise ValueError(f"{len(leaves):,} leaves don't fit in a tree of depth {depth}")
+        zeros = zero_hashes(depth)
+        levels = [bytearray(b''.join(leaf.to_bytes(NODE_SIZE, 'big') for leaf in leaves))]
+
+        pool = multiprocessing.Pool(processes=workers) if workers > 1 else None
+        try:
+            for height in range(depth):
+                nodes = levels[-1]
+                if len(nodes) // NODE_SIZE % 2:
+                    # The last node is paired with an empty subtree
+                    nodes = nodes + zeros[height].to_bytes(NODE_SIZE, 'big')
+                batch_bytes = 2 * NODE_SIZE * HASH_BATCH_SIZE
+                batches = [bytes(nodes[start:start + batch_bytes]) for start in range(0, len(nodes), batch_bytes)]
+                if pool is None or len(batches) <= 1:
+                    parents = map(hash_level_batch, batches)
+                else:
+                    # imap returns the results in submission order, i.e. node order
+                    parents = pool.imap(hash_level_batch, batches)
+                levels.append(bytearray(b''.join(parents)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return cls(levels, depth)
+
+    @property
+    def leaf_count(self) -> int:
+        """Number of leaves, including the 0 leaf at index 0."""
+        return len(self.levels[0]) // NODE_SIZE
+
+    @property
+    def root(self) -> int:
+        return self.node(self.depth, 0)
+
+    def node(self, height: int, index: int) -> int:
+        """Node at a height (0 for the leaves) and index, the root of an empty subtree past the leaves."""
+        level = self.levels[height]
+        offset = index * NODE_SIZE
+        if offset >= len(level):
+            return self.zeros[height]
+        return int.from_bytes(level[offset:offset + NODE_SIZE], 'big')
+
+    def leaf(self, index: int) -> int:
+        return self.node(0, index)
+
+    def sibling_path(self, index: int) -> List[int]:
+        """Siblings from the leaf up to the root, in the order ordered_mt_verify_inclusion consumes them."""
+        return [self.node(height, (index >> height) ^ 1) for height in range(self.depth)]
+
+    def serialize(self) -> List[List[str]]:
+        """The levels from the leaves up to the root, as decimal strings, like AsyncOrderedMT.serialize."""
+        return [
+            [str(int.from_bytes(level[offset:offset + NODE_SIZE], 'big')) for offset in range(0, len(level), NODE_SIZE)]
+            for level in self.levels
+        ]
+
+    @classmethod
+    def from_serialized(cls, serialized: List[List[str]]) -> 'OrderedMerkleTree':
+        """Load a tree from the output of serialize, or of AsyncOrderedMT.serialize."""
+        levels = [
+            bytearray(b''.join(int(node, 0).to_bytes(NODE_SIZE, 'big') for node in level))
+            for level in serialized
+        ]
+        return cls(levels, len(levels) - 1)
+
+    def write_binary(self, f):
+        """
+        Write the tree in the binary format: a header with the magic bytes, the depth, the leaf
+        count and the root, the uint64 node count of each level, then the nodes level by level
+        from the leaves up, as 32 bytes big-endian integers. The integers of the header are
+        little-endian.
+        """
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, self.depth, self.leaf_count, self.root.to_bytes(NODE_SIZE, 'big')))
+        for level in self.levels:
+            f.write(BINARY_LEVEL_COUNT.pack(len(level) // NODE_SIZE))
+        for level in self.levels:
+            f.write(level)
+
+    @classmethod
+    def open(cls, tree_file: str) -> 'OrderedMerkleTree':
+        """
+        Open a tree in the binary format without reading it: the levels are views of the
+        memory-mapped file, so looking a node up only touches the pages holding it.
+        """
+        with open(tree_file, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if len(view) < BINARY_HEADER.size or bytes(view[:len(BINARY_MAGIC)]) != BINARY_MAGIC:
+            view.release()
+            mapped.close()
+            raise ValueError(f"'{tree_file}' is not a binary sanctions tree")
+        _, depth, leaf_count, root = BINARY_HEADER.unpack_from(view)
+        offset = BINARY_HEADER.size
+        counts = []
+        for _ in range(depth + 1):
+            counts.append(BINARY_LEVEL_COUNT.unpack_from(view, offset)[0])
+            offset += BINARY_LEVEL_COUNT.size
+        levels = []
+        for count in counts:
+            levels.append(view[offset:offset + count * NODE_SIZE])
+            offset += count * NODE_SIZE
+        tree = cls(levels, depth)
+        tree._mmap = mapped
+        return tree
+
+    def close(self):
+        """Release the memory-mapped file of a tree opened with open."""
+        if self._mmap is not None:
+            for level in self.levels:
+                level.release()
+            self.levels = []
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_tree(tree_file: str) -> OrderedMerkleTree:
+    """Load a tree in the binary format, memory-mapped, or serialized as JSON."""
+    with open(tree_file, 'rb') as f:
+        is_binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if is_binary:
+        return OrderedMerkleTree.open(tree_file)
+    with open(tree_file, 'r', encoding='utf-8') as f:
+        return OrderedMerkleTree.from_serialized(json.load(f))
+
+
+def save_binary_tree(tree: OrderedMerkleTree, tree_file: str):
+    """Write a tree to a file in the binary format."""
+    with open(tree_file, 'wb') as f:
+        tree.write_binary(f)
+
+
+def load_leaves(leaves_file: str) -> List[int]:
+    """Load the leaves written by poseidon2.py, concatenating the groups in the order of generate.ts."""
+    with open(leaves_file, 'r', encoding='utf-8') as f:
+        groups: Dict[str, List[str]] = json.load(f)
+    return [int(leaf) for group in LEAF_GROUPS for leaf in groups.get(group, [])]
+
+
+def main():
+    """Build the sanctions tree from the leaves hashed by poseidon2.py, or convert a serialized tree."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Build the ordered Merkle tree of the sanctions leaves hashed by poseidon2.py.'
+    )
+    parser.add_argument(
+        'leaves_file',
+        nargs='?',
+        help='Leaves JSON file written by poseidon2.py'
+    )
+    parser.add_argument(
+        '--convert',
+        metavar='TREE_FILE',
+        help='Load a tree serialized as JSON, e.g. all_sanctions_tree.json, instead of building one from leaves'
+    )
+    parser.add_argument(
+        '--output',
+        help='Output JSON file for the serialized tree, in the format of AsyncOrderedMT.serialize'
+    )
+    parser.add_argument(
+        '--binary-output',
+        help='Output file for the tree in the compact binary format, which can be memory-mapped'
+    )
+    parser.add_argument(
+        '--depth',
+        type=int,
+        default=TREE_DEPTH,
+        help=f'Depth of the tree (default: {TREE_DEPTH})'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of processes used to hash the tree (default: number of CPUs)'
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='TREE_FILE',
+        help='Serialized tree built by generate.ts to cross-check the root against, exits with an error if they differ'
+    )
+
+    args = parser.parse_args()
+    if (args.leaves_file is None) == (args.convert is None):
+        parser.error('either a leaves file or --convert is required')
+
+    try:
+        if args.convert:
+            tree = load_tree(args.convert)
+        else:
+            leaves = load_leaves(args.leaves_file)
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+
+    if args.convert:
+        print(f"Loaded a tree of depth {tree.depth} over {tree.leaf_count:,} leaves from {args.convert}")
+    else:
+        print(f"Building a tree of depth {args.depth} over {len(leaves):,} leaves with {args.workers} workers...")
+        tree = OrderedMerkleTree.build(leaves, args.depth, args.workers)
+    print(f"Root: 0x{tree.root:064x}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(tree.serialize(), f, indent=2)
+        print(f"Tree saved to {args.output}")
+
+    if args.binary_output:
+        save_binary_tree(tree, args.binary_output)
+        print(f"Binary tree saved to {args.binary_output}")
+
+    if args.compare:
+        try:
+            other = load_tree(args.compare)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+            print(f"Error reading file: {e}")
+            sys.exit(1)
+        if other.root != tree.root:
+            print(f"Error: the root of {args.compare} is 0x{other.root:064x}")
+            sys.exit(1)
+        print(f"Root matches {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
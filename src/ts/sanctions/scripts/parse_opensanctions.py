@@ -5,41 +5,150 @@ Parse OpenSanctions entities.ftm.json file to extract persons with passport info
 Follow-the-Money (FTM) format parser.
 """
 
+import abc
 import json
 import csv
-from typing import List, Dict, Any, Optional, Tuple
+import errno
+import hashlib
+import itertools
+import math
+from collections import Counter, OrderedDict, deque
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterator, NamedTuple, TextIO
 from datetime import datetime
 import sys
 import os
+import glob
+import shutil
+import socket
+import socketserver
+import subprocess
+import threading
+import cProfile
+import time
+import tracemalloc
+import mmap
+import random
+import re
+import struct
+import multiprocessing
 import unicodedata
+import io
+import gzip
+import bz2
+import lzma
 
-# Global tracking for entities without Latin names
-entities_without_latin_names = []
+# zstd support is optional: the zstandard package, or the standard library from Python 3.14
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    from compression import zstd as stdlib_zstd
+except ImportError:
+    stdlib_zstd = None
 
-def is_latin(text: str) -> bool:
+# NumPy is only needed for the NumPy output of the MRZ preimages
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The peak memory of the profiling metrics is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Version of the extraction logic. Bump it whenever the entries produced for a
+# given entity change, so that state and caches from older runs are discarded
+PARSER_VERSION = '2'
+
+# Maximum number of full names generated from the name parts of one entity, 0 for no limit.
+# Every name becomes an entry, so this bounds what one entity can add to a run and to the trees
+DEFAULT_MAX_NAME_COMBINATIONS = 128
+
+# Script classes of the codepoint lookup table. Each class is stored as the
+# ordinal of a marker character so str.translate can map a whole name to its
+# classes in one pass, and str.count can then tally them
+SCRIPT_NOT_ALPHA = '.'
+SCRIPT_OTHER = 'o'
+SCRIPT_LATIN = 'l'
+SCRIPT_CYRILLIC = 'c'
+SCRIPT_ARABIC = 'a'
+
+ASCII_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+class ScriptCounts(NamedTuple):
+    """Number of alphabetic characters of a string, in total and per script."""
+    alpha: int
+    latin: int
+    cyrillic: int
+    arabic: int
+
+
+def classify_char(char: str) -> str:
+    """Return the script class of a single character."""
+    if not char.isalpha():
+        return SCRIPT_NOT_ALPHA
+    # Cyrillic Unicode block: U+0400–U+04FF
+    if '\u0400' <= char <= '\u04FF':
+        return SCRIPT_CYRILLIC
+    # Arabic Unicode block: U+0600–U+06FF
+    if '\u0600' <= char <= '\u06FF':
+        return SCRIPT_ARABIC
+    # Check if character is in Latin Unicode blocks
+    # This includes basic Latin (A-Z), Latin-1 Supplement (À-ÿ), Latin Extended-A, etc.
+    if 'LATIN' in unicodedata.name(char, '') or char in ASCII_LETTERS:
+        return SCRIPT_LATIN
+    return SCRIPT_OTHER
+
+
+def _build_script_table() -> bytes:
+    """Precompute the script class of every BMP codepoint (64 KiB)."""
+    return bytes(ord(classify_char(chr(codepoint))) for codepoint in range(0x10000))
+
+
+# Codepoints outside of the BMP are missing from the table, which makes
+# str.translate leave them untouched so they can be classified separately
+SCRIPT_TABLE = _build_script_table()
+
+
+def script_counts(text: str) -> ScriptCounts:
+    """Count the alphabetic characters of a string per script in a single pass."""
+    if not text:
+        return ScriptCounts(0, 0, 0, 0)
+    
+    classes = text.translate(SCRIPT_TABLE)
+    latin = classes.count(SCRIPT_LATIN)
+    cyrillic = classes.count(SCRIPT_CYRILLIC)
+    arabic = classes.count(SCRIPT_ARABIC)
+    alpha = len(classes) - classes.count(SCRIPT_NOT_ALPHA)
+    
+    if classes.isascii():
+        return ScriptCounts(alpha, latin, cyrillic, arabic)
+    
+    # Characters beyond the BMP were left as they are
+    for char in classes:
+        if char > '\uffff':
+            script = classify_char(char)
+            if script == SCRIPT_NOT_ALPHA:
+                alpha -= 1
+            elif script == SCRIPT_LATIN:
+                latin += 1
+    return ScriptCounts(alpha, latin, cyrillic, arabic)
+
+
+def is_latin(text: str, counts: Optional[ScriptCounts] = None) -> bool:
     """
     Check if a string contains primarily Latin characters.
     Returns True if the text is mostly Latin alphabet (including accented characters).
     """
-    if not text:
-        return False
-    
-    latin_count = 0
-    total_alpha = 0
-    
-    for char in text:
-        if char.isalpha():
-            total_alpha += 1
-            # Check if character is in Latin Unicode blocks
-            # This includes basic Latin (A-Z), Latin-1 Supplement (À-ÿ), Latin Extended-A, etc.
-            char_name = unicodedata.name(char, '')
-            if 'LATIN' in char_name or char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz':
-                latin_count += 1
+    if counts is None:
+        counts = script_counts(text)
     
     # Consider it Latin if more than 50% of alphabetic characters are Latin
-    if total_alpha == 0:
-        return False
-    return (latin_count / total_alpha) > 0.5
+    return counts.latin * 2 > counts.alpha
 
 # Removed select_latin_name function as we now create entries for all Latin names
 
@@ -267,72 +376,60 @@ ARABIC_TRANSLITERATION = {
     "\u06D3": "XBE",    # ۓ yeh barree with hamza above
 }
 
-def is_cyrillic(text: str) -> bool:
+# Apostrophes and quotes removed from names on top of the Latin transliteration
+# Including: ' ` ´ ʼ ʻ ʽ ʾ ʿ ˈ ˊ ˋ "
+MRZ_STRIPPED_CHARACTERS = "'`\u00B4\u02BC\u02BB\u02BD\u02BE\u02BF\u02C8\u02CA\u02CB\""
+
+# The transliteration tables compiled into str.translate tables, so that a name
+# is rewritten in a single pass instead of one str.replace scan per character.
+# None of the replacements produce characters that are themselves replaced,
+# so applying them all at once gives the same result as applying them in turn
+LATIN_TRANSLATION_TABLE = str.maketrans({
+    **LATIN_TRANSLITERATION,
+    **dict.fromkeys(MRZ_STRIPPED_CHARACTERS, ""),
+})
+
+CYRILLIC_TRANSLATION_TABLE = str.maketrans({
+    **CYRILLIC_TRANSLITERATION,
+    # Also handle lowercase
+    **{char.lower(): replacement.lower() for char, replacement in CYRILLIC_TRANSLITERATION.items()},
+})
+
+ARABIC_TRANSLATION_TABLE = str.maketrans(ARABIC_TRANSLITERATION)
+
+def is_cyrillic(text: str, counts: Optional[ScriptCounts] = None) -> bool:
     """Check if text contains any Cyrillic characters."""
-    if not text:
-        return False
-    
-    cyrillic_count = 0
-    total_alpha = 0
-    
-    for char in text:
-        if char.isalpha():
-            total_alpha += 1
-            # Cyrillic Unicode block: U+0400–U+04FF
-            if '\u0400' <= char <= '\u04FF':
-                cyrillic_count += 1
-    
-    if total_alpha == 0:
-        return False
-    return cyrillic_count > 0
+    if counts is None:
+        counts = script_counts(text)
+    return counts.cyrillic > 0
 
-def is_arabic(text: str) -> bool:
+def is_arabic(text: str, counts: Optional[ScriptCounts] = None) -> bool:
     """Check if text contains any Arabic characters."""
-    if not text:
-        return False
-    
-    arabic_count = 0
-    total_alpha = 0
-    
-    for char in text:
-        if char.isalpha():
-            total_alpha += 1
-            # Arabic Unicode block: U+0600–U+06FF
-            if '\u0600' <= char <= '\u06FF':
-                arabic_count += 1
-    
-    if total_alpha == 0:
-        return False
-    return arabic_count > 0
+    if counts is None:
+        counts = script_counts(text)
+    return counts.arabic > 0
 
 def transliterate_cyrillic(text: str) -> str:
     """Transliterate Cyrillic text to Latin using ICAO standards."""
     if not text:
         return text
     
-    result = text
-    for char, replacement in CYRILLIC_TRANSLITERATION.items():
-        result = result.replace(char, replacement)
-        # Also handle lowercase
-        result = result.replace(char.lower(), replacement.lower())
-    
-    return result
+    return text.translate(CYRILLIC_TRANSLATION_TABLE)
 
 def transliterate_arabic(text: str) -> str:
     """Transliterate Arabic text to Latin using ICAO standards."""
     if not text:
         return text
     
-    result = text
-    for char, replacement in ARABIC_TRANSLITERATION.items():
-        result = result.replace(char, replacement)
+    result = text.translate(ARABIC_TRANSLATION_TABLE)
     
     # TODO(md): make more robust
     # Handle teh marbuta at end of name components
     # This is a simplified approach - ideally would parse name components
-    result = result.replace("XTA ", "XAH ").replace("XTA-", "XAH-")
-    if result.endswith("XTA"):
-        result = result[:-3] + "XAH"
+    if "XTA" in result:
+        result = result.replace("XTA ", "XAH ").replace("XTA-", "XAH-")
+        if result.endswith("XTA"):
+            result = result[:-3] + "XAH"
     
     return result
 
@@ -346,17 +443,9 @@ def clean_name_for_mrz(name: str) -> str:
     if not name:
         return name
     
-    # Apply transliteration for special characters
-    cleaned = name
-    for char, replacement in LATIN_TRANSLITERATION.items():
-        cleaned = cleaned.replace(char, replacement)
-    
-    # Also remove various types of apostrophes and quotes not in the main transliteration
-    # Including: ' ' ` ´ ʼ ʻ ʽ ʾ ʿ ˈ ˊ ˋ " " "
-    cleaned = cleaned.replace("'", "").replace("'", "").replace("`", "").replace("´", "")
-    cleaned = cleaned.replace("ʼ", "").replace("ʻ", "").replace("ʽ", "")
-    cleaned = cleaned.replace("ʾ", "").replace("ʿ", "").replace("ˈ", "").replace("ˊ", "").replace("ˋ", "")
-    cleaned = cleaned.replace('"', "").replace('"', "").replace('"', "")
+    # Apply transliteration for special characters and remove the various
+    # types of apostrophes and quotes, all in one pass
+    cleaned = name.translate(LATIN_TRANSLATION_TABLE)
     
     # Remove any double spaces that might result
     cleaned = " ".join(cleaned.split())
@@ -366,26 +455,338 @@ def clean_name_for_mrz(name: str) -> str:
     
     return cleaned
 
-def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
+def transliterate_to_latin(text: str, counts: Optional[ScriptCounts] = None) -> str:
+    """Transliterate Cyrillic or Arabic text to Latin, other scripts are returned unchanged."""
+    if counts is None:
+        counts = script_counts(text)
+    if is_cyrillic(text, counts):
+        return transliterate_cyrillic(text)
+    if is_arabic(text, counts):
+        return transliterate_arabic(text)
+    # For other scripts, just clean and uppercase
+    return text
+
+# Fingerprint of the transliteration rules, used to invalidate anything derived from them
+TRANSLITERATION_TABLES_HASH = hashlib.sha256(json.dumps(
+    [LATIN_TRANSLITERATION, CYRILLIC_TRANSLITERATION, ARABIC_TRANSLITERATION, MRZ_STRIPPED_CHARACTERS],
+    sort_keys=True,
+).encode('utf-8')).hexdigest()
+
+DEFAULT_NAME_CACHE_SIZE = 1 << 18
+
+
+class NameCache:
+    """
+    Bounded LRU cache of normalized names.
+    The same name strings come up again and again across entities and
+    datasets (common surnames, persons listed by several authorities), so
+    the result of normalize_name is memoized with least recently used eviction.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_NAME_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # When set to a list, new entries are also recorded there so worker
+        # processes can hand them back to the parent's cache
+        self.journal: Optional[List[Tuple[str, Tuple[bool, str]]]] = None
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, name: str) -> Optional[Tuple[bool, str]]:
+        entry = self._entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(name)
+        return entry
+
+    def put(self, name: str, entry: Tuple[bool, str]):
+        if self.journal is not None:
+            self.journal.append((name, entry))
+        if self.max_size <= 0:
+            return
+        self._entries[name] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def resize(self, max_size: int):
+        """Change the size bound, evicting the least recently used entries if needed."""
+        self.max_size = max_size
+        while self._entries and len(self._entries) > max(max_size, 0):
+            self._entries.popitem(last=False)
+
+    def load(self, file_path: str) -> int:
+        """
+        Warm the cache from a file written by save().
+        Files written with other transliteration tables are ignored.
+        
+        Returns:
+            Number of entries loaded
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        if data.get('tables_hash') != TRANSLITERATION_TABLES_HASH:
+            return 0
+        loaded = 0
+        for name, latin, normalized in data.get('entries', []):
+            self.put(name, (latin, normalized))
+            loaded += 1
+        return loaded
+
+    def save(self, file_path: str):
+        """Persist the cache entries, least recently used first."""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'tables_hash': TRANSLITERATION_TABLES_HASH,
+                'entries': [[name, latin, normalized] for name, (latin, normalized) in self._entries.items()],
+            }, f, ensure_ascii=False)
+
+
+def normalize_name(name: str, cache: Optional[NameCache] = None,
+                   profiler: Optional['StageProfiler'] = None) -> Tuple[bool, str]:
+    """
+    Normalize a name for the MRZ, going through the name cache.
+    Latin names are cleaned directly while other names are transliterated first.
+    
+    Args:
+        name: Name as found in the FTM entity
+        cache: Name cache to go through, none by default
+        profiler: Stage profiler to time the normalization with
+        
+    Returns:
+        Tuple of whether the name is mostly Latin and its normalized form
+    """
+    if profiler is not None:
+        profiler.push('normalize')
+    entry = cache.get(name) if cache is not None else None
+    if entry is None:
+        counts = script_counts(name)
+        if is_latin(name, counts):
+            entry = (True, clean_name_for_mrz(name))
+        else:
+            entry = (False, clean_name_for_mrz(transliterate_to_latin(name, counts)))
+        if cache is not None:
+            cache.put(name, entry)
+    if profiler is not None:
+        profiler.pop()
+    return entry
+
+# Status flags of a person entry. Their order is the order in which the
+# statuses are listed in the output
+STATUS_SANCTIONED = 1 << 0
+STATUS_DEBARRED = 1 << 1
+STATUS_WANTED = 1 << 2
+STATUS_CRIME_RELATED = 1 << 3
+STATUS_PEP = 1 << 4
+STATUS_PERSON_OF_INTEREST = 1 << 5
+STATUS_INTERPOL_NOTICE = 1 << 6
+# PEP status derived from the datasets rather than the topics, listed after the Interpol notice
+STATUS_PEP_FROM_DATASET = 1 << 7
+STATUS_DISQUALIFIED = 1 << 8
+
+STATUS_NAMES = [
+    (STATUS_SANCTIONED, 'sanctioned'),
+    (STATUS_DEBARRED, 'debarred'),
+    (STATUS_WANTED, 'wanted'),
+    (STATUS_CRIME_RELATED, 'crime-related'),
+    (STATUS_PEP, 'pep'),
+    (STATUS_PERSON_OF_INTEREST, 'person-of-interest'),
+    (STATUS_INTERPOL_NOTICE, 'interpol-notice'),
+    (STATUS_PEP_FROM_DATASET, 'pep'),
+    (STATUS_DISQUALIFIED, 'disqualified'),
+]
+
+# Status names of every combination of flags
+STATUS_LISTS = [
+    tuple(dict.fromkeys(name for flag, name in STATUS_NAMES if flags & flag))
+    for flags in range(1 << len(STATUS_NAMES))
+]
+
+
+def status_flags(status_list: List[str]) -> int:
+    """Convert a list of status names back to flags."""
+    flags = 0
+    for status in status_list:
+        for flag, name in STATUS_NAMES:
+            if name == status:
+                # A PEP status not coming first is one derived from the datasets
+                if flag == STATUS_PEP and flags & (STATUS_PERSON_OF_INTEREST | STATUS_INTERPOL_NOTICE):
+                    flag = STATUS_PEP_FROM_DATASET
+                flags |= flag
+                break
+    return flags
+
+
+class CodeInterner:
+    """
+    Shares one tuple between all the entries having the same dataset, country
+    or nationality codes, which are repeated across millions of entries.
+    Each parser has its own, so it is released along with the parser.
+    """
+
+    def __init__(self):
+        self._tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tuples)
+
+    def intern(self, codes) -> Tuple[str, ...]:
+        """Return the shared tuple of a sequence of codes."""
+        key = tuple(codes)
+        return self._tuples.setdefault(key, key)
+
+
+class PersonEntry:
+    """
+    Compact representation of a person entry, one per Latin name variant of an entity.
+    The variants of an entity share the same tuples, the statuses are stored
+    as flags and the dataset and country codes as interned tuples. Entries are
+    converted to the dictionary shape of the output only when written.
+    """
+
+    __slots__ = ('id', 'name', 'is_latin_name', 'first_name', 'middle_name', 'second_name', 'last_name',
+                 'aliases', 'birth_dates', 'passports', 'nationality', 'status', 'countries', 'datasets')
+
+    def __init__(self, id: str, name: str, is_latin_name: bool, first_name: Tuple[str, ...],
+                 middle_name: Tuple[str, ...], second_name: Tuple[str, ...], last_name: Tuple[str, ...],
+                 aliases: Tuple[str, ...], birth_dates: Tuple[str, ...], passports: Tuple[str, ...],
+                 nationality: Tuple[str, ...], status: int, countries: Tuple[str, ...],
+                 datasets: Tuple[str, ...]):
+        self.id = id
+        self.name = name
+        self.is_latin_name = is_latin_name
+        self.first_name = first_name
+        self.middle_name = middle_name
+        self.second_name = second_name
+        self.last_name = last_name
+        self.aliases = aliases
+        self.birth_dates = birth_dates
+        self.passports = passports
+        self.nationality = nationality
+        self.status = status
+        self.countries = countries
+        self.datasets = datasets
+
+    @property
+    def birth_date(self) -> Optional[str]:
+        return self.birth_dates[0] if self.birth_dates else None
+
+    @property
+    def has_passport(self) -> bool:
+        return len(self.passports) > 0
+
+    @property
+    def status_list(self) -> Tuple[str, ...]:
+        return STATUS_LISTS[self.status]
+
+    def copy(self) -> 'PersonEntry':
+        """Return a shallow copy, still sharing the tuples of this entry."""
+        return PersonEntry(*(getattr(self, slot) for slot in self.__slots__))
+
+    def intern_codes(self, interner: CodeInterner):
+        """Share the code tuples with the other entries of an interner, e.g. once received from a worker."""
+        self.nationality = interner.intern(self.nationality)
+        self.countries = interner.intern(self.countries)
+        self.datasets = interner.intern(self.datasets)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the dictionary shape of the JSON output."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'is_latin_name': self.is_latin_name,
+            'first_name': list(self.first_name),
+            'middle_name': list(self.middle_name),
+            'second_name': list(self.second_name),
+            'last_name': list(self.last_name),
+            'aliases': list(self.aliases),
+            'birth_date': self.birth_date,
+            'birth_dates': list(self.birth_dates),
+            'passports': list(self.passports),
+            'nationality': list(self.nationality),
+            'has_passport': self.has_passport,
+            'status': list(self.status_list),
+            'countries': list(self.countries),
+            'datasets': list(self.datasets),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], interner: Optional[CodeInterner] = None) -> 'PersonEntry':
+        """Build an entry from the dictionary shape of the JSON output, sharing its code tuples through an interner."""
+        intern = interner.intern if interner is not None else tuple
+        birth_dates = data.get('birth_dates', [data['birth_date']] if data['birth_date'] else [])
+        return cls(
+            data['id'], data['name'], data['is_latin_name'],
+            tuple(data['first_name']), tuple(data['middle_name']), tuple(data['second_name']),
+            tuple(data['last_name']), tuple(data['aliases']), tuple(birth_dates), tuple(data['passports']),
+            intern(data['nationality']), status_flags(data['status']),
+            intern(data['countries']), intern(data['datasets']),
+        )
+
+    def __reduce__(self):
+        # The tuples are shared between entries, which pickle preserves within a batch
+        return (PersonEntry, tuple(getattr(self, slot) for slot in self.__slots__))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PersonEntry):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"PersonEntry({self.to_dict()!r})"
+
+
+def person_to_dict(person) -> Dict[str, Any]:
+    """Return the dictionary shape of a person entry, which may already be a dictionary."""
+    return person.to_dict() if isinstance(person, PersonEntry) else person
+
+
+def iter_name_combinations(first_names: List[str], middle_names: List[str], second_names: List[str],
+                           last_names: List[str], exclude=()) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily generate the distinct full names made of one of each name part, skipping the
+    names in `exclude`. Yields the index of the combination among all the candidates
+    along with the name, so the caller knows how many are left when it stops early.
+    """
+    seen = set(exclude)
+    candidates = itertools.product(first_names or [''], middle_names or [''], second_names or [''], last_names or [''])
+    for index, parts in enumerate(candidates):
+        full_name = ' '.join(part for part in parts if part)
+        if full_name and full_name not in seen:
+            seen.add(full_name)
+            yield index, full_name
+
+
+def extract_person_data(entity: Dict[str, Any], parser: Optional['OpenSanctionsParser'] = None) -> List[PersonEntry]:
     """
     Extract person data from an FTM entity.
-    Returns a list of person dictionaries, one for each Latin name variant.
+    Returns a list of person entries, one for each Latin name variant.
     
     Args:
         entity: FTM entity dictionary
+        parser: Parser whose configuration, name cache and reports to use, a new one by default
         
     Returns:
-        List of dictionaries with person data (empty list if not a person)
+        List of person entries (empty list if not a person)
     """
-    # Check if this is a Person entity
-    schema = entity.get('schema')
-    if schema != 'Person':
-        return []
-    
+    if parser is None:
+        parser = OpenSanctionsParser()
+    return parser.extract(entity)
+
+
+def _extract_person(entity: Dict[str, Any], parser: 'OpenSanctionsParser') -> List[PersonEntry]:
+    """Extract the person entries of a Person entity, see extract_person_data."""
     properties = entity.get('properties', {})
     
     # Extract all names from various fields
-    names = properties.get('name', [])
+    names = list(properties.get('name', []))
     
     # Also construct names from firstName, middleName, secondName | lastName if available
     first_names = properties.get('firstName', [])
@@ -393,17 +794,21 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
     second_names = properties.get('secondName', [])
     last_names = properties.get('lastName', [])
     
-    # Generate combinations from name parts
+    # Generate combinations from name parts, up to the per-entity cap
     if first_names or second_names or last_names:
-        for first in first_names or ['']:
-            for middle in middle_names or ['']:
-                for second in second_names or ['']:
-                    for last in last_names or ['']:
-                        parts = [p for p in [first, middle, second, last] if p]
-                        if parts:
-                            full_name = ' '.join(parts)
-                            if full_name not in names:
-                                names.append(full_name)
+        generated = 0
+        for index, full_name in iter_name_combinations(first_names, middle_names, second_names, last_names, names):
+            if parser.max_name_combinations and generated == parser.max_name_combinations:
+                # The candidates left out may include duplicates, the count is an upper bound
+                total = math.prod(len(parts) or 1 for parts in (first_names, middle_names, second_names, last_names))
+                parser.entities_with_capped_names.append({
+                    'id': entity.get('id'),
+                    'generated_combinations': generated,
+                    'dropped_combinations': total - index,
+                })
+                break
+            names.append(full_name)
+            generated += 1
     
     if not names:
         return []
@@ -413,38 +818,25 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
     non_latin_names = []
     
     for name in names:
-        if is_latin(name):
+        latin, normalized = parser.normalize(name)
+        if latin:
             # Clean the Latin name for MRZ compatibility
-            cleaned_name = clean_name_for_mrz(name)
-            latin_names.append(cleaned_name)
+            latin_names.append(normalized)
         else:
-            non_latin_names.append(name)
+            non_latin_names.append((name, normalized))
     
     # If no Latin names found, transliterate non-Latin names
     if not latin_names and non_latin_names:
-        entities_without_latin_names.append({
+        parser.entities_without_latin_names.append({
             'id': entity.get('id'),
             'primary_name': names[0],
             'all_names': names
         })
         
-        # Transliterate non-Latin names to create Latin versions
-        for name in non_latin_names:
-            transliterated = None
-            
-            if is_cyrillic(name):
-                transliterated = transliterate_cyrillic(name)
-            elif is_arabic(name):
-                transliterated = transliterate_arabic(name)
-            else:
-                # For other scripts, just clean and uppercase
-                transliterated = name
-            
-            if transliterated:
-                # Clean the transliterated name
-                cleaned = clean_name_for_mrz(transliterated)
-                if cleaned and cleaned not in latin_names:
-                    latin_names.append(cleaned)
+        # Use the transliterated versions of the non-Latin names
+        for name, cleaned in non_latin_names:
+            if cleaned and cleaned not in latin_names:
+                latin_names.append(cleaned)
     
     # If still no names, use the first name as fallback
     if not latin_names and names:
@@ -457,54 +849,56 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
     if 'weakAlias' in properties:
         aliases.extend(properties['weakAlias'])
     # Remove duplicates and any names that are in the main names list
-    aliases = list(set(aliases) - set(names))
+    # (keeping the first-seen order so the output is deterministic)
+    names_set = set(names)
+    aliases = tuple(alias for alias in dict.fromkeys(aliases) if alias not in names_set)
     
-    # Extract birth date
-    birth_dates = properties.get('birthDate', [])
-    birth_date = birth_dates[0] if birth_dates else None
+    # Extract birth dates, each of which makes its own leaves
+    birth_dates = tuple(dict.fromkeys(properties.get('birthDate', [])))
     
     # Extract passport numbers
-    passports = properties.get('passportNumber', [])
+    passports = tuple(properties.get('passportNumber', []))
     
     # Extract topics/status (what the person "is")
     topics = properties.get('topics', [])
     
-    # Build status list based on topics and other indicators
-    status_list = []
+    # Build status flags based on topics and other indicators
+    status = 0
     if 'sanction' in topics:
-        status_list.append('sanctioned')
+        status |= STATUS_SANCTIONED
     if 'debarment' in topics:
-        status_list.append('debarred')
+        status |= STATUS_DEBARRED
     if 'wanted' in topics:
-        status_list.append('wanted')
+        status |= STATUS_WANTED
     if 'crime' in topics:
-        status_list.append('crime-related')
+        status |= STATUS_CRIME_RELATED
     if 'pep' in topics:
-        status_list.append('pep')
+        status |= STATUS_PEP
     if 'poi' in topics:
-        status_list.append('person-of-interest')
+        status |= STATUS_PERSON_OF_INTEREST
     
     # Check datasets for additional status indicators
     datasets = entity.get('datasets', [])
     if any('interpol' in ds.lower() for ds in datasets):
-        if 'interpol-wanted' not in status_list and 'wanted' not in status_list:
-            status_list.append('interpol-notice')
+        if not status & STATUS_WANTED:
+            status |= STATUS_INTERPOL_NOTICE
     if any('pep' in ds.lower() for ds in datasets):
-        if 'pep' not in status_list:
-            status_list.append('pep')
+        if not status & STATUS_PEP:
+            status |= STATUS_PEP_FROM_DATASET
     if any('disqualified' in ds.lower() for ds in datasets):
-        status_list.append('disqualified')
+        status |= STATUS_DISQUALIFIED
     
     # Extract countries (from country, nationality, birthPlace)
-    countries = set()
+    # A dict is used as an insertion-ordered set to keep the output deterministic
+    countries = {}
     
     # Add countries from 'country' property
     if 'country' in properties:
-        countries.update(c.upper() for c in properties['country'])
+        countries.update(dict.fromkeys(c.upper() for c in properties['country']))
     
     # Add countries from 'nationality' property
     if 'nationality' in properties:
-        countries.update(c.upper() for c in properties['nationality'])
+        countries.update(dict.fromkeys(c.upper() for c in properties['nationality']))
     
     # Add countries from birthPlace (extract country codes if present)
     if 'birthPlace' in properties:
@@ -512,7 +906,7 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
         for place in properties['birthPlace']:
             # Check if it's a country code (2-3 letters)
             if isinstance(place, str) and len(place) in [2, 3] and place.isalpha():
-                countries.add(place.upper())
+                countries[place.upper()] = None
     
     # Add countries from address if present
     if 'address' in properties:
@@ -523,9 +917,10 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
                 if parts:
                     last_part = parts[-1].strip()
                     if len(last_part) in [2, 3] and last_part.isalpha():
-                        countries.add(last_part.upper())
+                        countries[last_part.upper()] = None
     
-    countries = list(countries)
+    countries = parser.code_interner.intern(countries)
+    datasets = parser.code_interner.intern(datasets)
     
     # Process individual name fields with transliteration
     processed_first_names = []
@@ -534,31 +929,21 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
     processed_last_names = []
 
     # Helper function to process name field
-    def process_name_field(names_list: List[str]) -> List[str]:
+    def process_name_field(names_list: List[str]) -> Tuple[str, ...]:
         """Process a list of name variants, applying Latin checks and transliteration."""
         if not names_list:
-            return []
+            return ()
+        
+        normalized_list = [parser.normalize(name) for name in names_list]
+        # Only transliterate if no Latin version exists in the list
+        has_latin = any(latin for latin, _ in normalized_list)
         
         processed = []
-        for name in names_list:
-            if is_latin(name):
-                processed.append(clean_name_for_mrz(name))
-            else:
-                # Only transliterate if no Latin version exists in the list
-                has_latin = any(is_latin(n) for n in names_list)
-                if not has_latin:
-                    transliterated = None
-                    if is_cyrillic(name):
-                        transliterated = transliterate_cyrillic(name)
-                    elif is_arabic(name):
-                        transliterated = transliterate_arabic(name)
-                    else:
-                        transliterated = name
-                    
-                    if transliterated:
-                        processed.append(clean_name_for_mrz(transliterated))
-        
-        return list(set(processed))  # Remove duplicates
+        for name, (latin, normalized) in zip(names_list, normalized_list):
+            if latin or (name and not has_latin):
+                processed.append(normalized)
+        
+        return tuple(dict.fromkeys(processed))  # Remove duplicates
     
     # Process each name field
     processed_first_names = process_name_field(first_names)
@@ -567,309 +952,2493 @@ def extract_person_data(entity: Dict[str, Any]) -> List[Dict[str, Any]]:
     processed_last_names = process_name_field(last_names)
     
     # Extract nationality
-    nationalities = [c.upper() for c in properties.get('nationality', [])]
+    nationality = parser.code_interner.intern(c.upper() for c in properties.get('nationality', []))
     
-    # Create an entry for each Latin name
+    # Create an entry for each Latin name, all sharing the same tuples
     person_entries = []
     
     for name in latin_names:
-        person_entry = {
-            'id': entity.get('id'),
-            'name': name,
-            'is_latin_name': is_latin(name),
-            'first_name': processed_first_names,
-            'middle_name': processed_middle_names,
-            'second_name': processed_second_names,
-            'last_name': processed_last_names,
-            #'all_names': names,
-            'aliases': aliases,
-            'birth_date': birth_date,
-            'passports': passports,
-            'nationality': nationalities,
-            'has_passport': len(passports) > 0,
-            'status': status_list,
-            'countries': countries,
-            'datasets': datasets
-        }
+        person_entry = PersonEntry(
+            entity.get('id'), name, is_latin(name),
+            processed_first_names, processed_middle_names, processed_second_names, processed_last_names,
+            aliases, birth_dates, passports, nationality, status, countries, datasets,
+        )
         person_entries.append(person_entry)
     
     return person_entries
 
 
-def parse_opensanctions_file(file_path: str) -> List[Dict[str, Any]]:
+# Size of the chunks read from the input when decoding JSON arrays or objects
+STREAM_CHUNK_SIZE = 1 << 20
+
+
+class _JSONStreamDecoder:
     """
-    Parse the OpenSanctions FTM JSON file and extract person data.
+    Incremental decoder for a single JSON document read from a text stream.
+    Only a bounded window of the input is kept in memory, so top-level arrays
+    and {"entities": [...]} wrappers can be walked one element at a time.
+    """
+
+    def __init__(self, f, chunk_size: int = STREAM_CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read the next chunk into the buffer. Returns False at end of input."""
+        if self._eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ('' at end of input)."""
+        while True:
+            buf_len = len(self._buf)
+            while self._pos < buf_len and self._buf[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos < buf_len:
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        """Consume the next non-whitespace character, which must be `char`."""
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self._buf, self._pos)
+        self._pos += 1
+
+    # Literals a value cut off at the end of the buffer may be the start of
+    LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+    NUMBER_END = re.compile(r'[0-9eE.+-]+')
+
+    def _is_cut_off(self, error: json.JSONDecodeError) -> bool:
+        """Whether a decoding error may only come from the value being cut off at the end of the buffer."""
+        if error.msg.startswith('Unterminated string'):
+            # Strings are only unterminated when they run to the end of the buffer
+            return True
+        if error.msg.startswith('Invalid \\uXXXX escape'):
+            return len(self._buf) - error.pos < 6
+        # Past the end of what was decoded, the rest may be a literal or the end of a number, e.g. `1.` or `2e-`
+        rest = self._buf[error.pos:]
+        return any(literal.startswith(rest) for literal in self.LITERALS) or self.NUMBER_END.fullmatch(rest) is not None
+
+    def decode_value(self) -> Any:
+        """Decode and consume the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                # The value may just be cut off at the end of the buffer, anything else is malformed
+                if not self._is_cut_off(e) or not self._fill():
+                    raise
+                continue
+            # A number cut off at the buffer end may continue in the next chunk
+            if (not self._eof and not isinstance(value, (dict, list, str))
+                    and (end == len(self._buf) or self._buf[end] in '0123456789.eE+-')):
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the elements of the array starting at the current position."""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def iter_entities_in_object(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the entities of an object starting at the current position.
+        The elements of its 'entities' array are streamed, otherwise the object
+        itself is treated as a single entity.
+        """
+        self.expect('{')
+        obj = {}
+        found_entities = False
+        if self.peek() == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self.decode_value()
+                self.expect(':')
+                if key == 'entities' and self.peek() == '[':
+                    found_entities = True
+                    yield from self.iter_array()
+                else:
+                    obj[key] = self.decode_value()
+                if self.peek() == ',':
+                    self._pos += 1
+                    continue
+                self.expect('}')
+                break
+        if not found_entities:
+            if 'entities' in obj:
+                yield from obj['entities']
+            else:
+                yield obj
+
+
+class _ChainedReader:
+    """Minimal read() interface over a string already consumed from a file followed by the file itself."""
+
+    def __init__(self, head: str, f):
+        self._head = head
+        self._f = f
+
+    def read(self, size: int) -> str:
+        if self._head:
+            head, self._head = self._head, ''
+            return head
+        return self._f.read(size)
+
+
+# Magic bytes of the compression formats inputs are detected by
+COMPRESSION_MAGIC_BYTES = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """Detect the compression of a file from its magic bytes. Returns None for plain files."""
+    with open(file_path, 'rb') as f:
+        header = f.read(6)
+    for compression, magic in COMPRESSION_MAGIC_BYTES.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_input(file_path: str):
+    """
+    Open an input file as text, transparently stream-decompressing gzip, bz2, xz
+    and zstd files so the uncompressed content never needs to exist on disk.
+    """
+    compression = detect_compression(file_path)
+    if compression is None:
+        return open(file_path, 'r', encoding='utf-8')
+    if compression == 'gzip':
+        stream = gzip.open(file_path, 'rb')
+    elif compression == 'bz2':
+        stream = bz2.open(file_path, 'rb')
+    elif compression == 'xz':
+        stream = lzma.open(file_path, 'rb')
+    elif zstandard is not None:
+        raw = open(file_path, 'rb')
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True), STREAM_CHUNK_SIZE)
+    elif stdlib_zstd is not None:
+        stream = stdlib_zstd.open(file_path, 'rb')
+    else:
+        raise ValueError(f"'{file_path}' is zstd-compressed, install the zstandard package to read it")
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+class SchemaPrefilter:
+    """
+    Check of the schema of the raw lines of an NDJSON file, so that the lines of the entities
+    of other schemas are skipped without decoding them. Most entities of the OpenSanctions
+    collections are companies, sanctions, ownerships and the like, and decoding their JSON
+    only to discard them is most of the decoding time.
+    A line is only skipped when its schema is certain: "schema" appears once in it, as a
+    key with a plain string value, and there is no escape that could spell another "schema"
+    key. Any other line is decoded, so entities of other schemas may still come through.
+    """
+
+    def __init__(self, schema: str = 'Person'):
+        self.schema = schema
+        # Number of lines skipped without decoding them
+        self.skipped = 0
+        # Lines are text when read through open_input and bytes when read from a memory-mapped shard
+        self._checks = {
+            str: (re.compile(r'"schema"\s*:\s*"([^"\\]*)"'), '"schema"', '\\u00', schema),
+            bytes: (re.compile(rb'"schema"\s*:\s*"([^"\\]*)"'), b'"schema"', b'\\u00', schema.encode('utf-8')),
+        }
+
+    def skip(self, line) -> bool:
+        """Whether a line is certainly an entity of another schema."""
+        pattern, key, escape, schema = self._checks[type(line)]
+        match = pattern.search(line)
+        if match is None or match.group(1) == schema or line.count(key) != 1 or escape in line:
+            return False
+        self.skipped += 1
+        return True
+
+
+def iter_entities(file_path: str, prefilter: Optional[SchemaPrefilter] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the entities of an OpenSanctions FTM file one at a time.
+    gzip, bz2, xz and zstd compressed files are decompressed on the fly.
+    
+    The file might be in different formats:
+    1. Newline-delimited JSON (each line is an entity), read line by line
+    2. Array of entities, decoded incrementally
+    3. Single object with entities, decoded incrementally
     
     Args:
         file_path: Path to entities.ftm.json file
+        prefilter: Schema prefilter skipping the lines of the entities of other schemas in NDJSON files
         
-    Returns:
-        List of person dictionaries
+    Yields:
+        FTM entity dictionaries
     """
-    global entities_without_latin_names
-    entities_without_latin_names = []  # Reset the counter
-    persons = []
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # The file might be in different formats:
-            # 1. Array of entities
-            # 2. Newline-delimited JSON (each line is an entity)
-            # 3. Single object with entities
-            
-            content = f.read().strip()
-            
-            # Try to parse as regular JSON array first
+    with open_input(file_path) as f:
+        # Look at the first line to find out which format we are dealing with
+        first_line = f.readline()
+        while first_line and not first_line.strip():
+            first_line = f.readline()
+        stripped = first_line.strip()
+        if not stripped:
+            return
+        
+        if stripped[0] == '{':
             try:
-                data = json.loads(content)
-                if isinstance(data, list):
-                    entities = data
-                elif isinstance(data, dict):
-                    # Might be wrapped in an object
-                    entities = data.get('entities', [data])
-                else:
-                    entities = []
+                data = json.loads(stripped)
             except json.JSONDecodeError:
-                # Try newline-delimited JSON
-                entities = []
-                for line in content.split('\n'):
+                data = None
+            if isinstance(data, dict):
+                # Newline-delimited JSON (or a whole document on a single line)
+                if isinstance(data.get('entities'), list):
+                    yield from data['entities']
+                else:
+                    yield data
+                for line in f:
                     if line.strip():
+                        if prefilter is not None and prefilter.skip(line):
+                            continue
                         try:
                             entity = json.loads(line)
-                            entities.append(entity)
                         except json.JSONDecodeError:
                             continue
-            
-            # Process each entity
+                        if isinstance(entity, dict):
+                            yield entity
+                return
+        
+        # Pretty-printed array or wrapper object: decode it incrementally
+        decoder = _JSONStreamDecoder(_ChainedReader(first_line, f))
+        first_char = decoder.peek()
+        if first_char == '[':
+            entities = decoder.iter_array()
+        elif first_char == '{':
+            entities = decoder.iter_entities_in_object()
+        else:
+            entities = iter(())
+        yielded = 0
+        try:
             for entity in entities:
-                person_entries = extract_person_data(entity)
-                for person_data in person_entries:
-                    #print(person_data)
-                    persons.append(person_data)
-                    
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        sys.exit(1)
-    
-    return persons
+                yielded += 1
+                yield entity
+            return
+        except json.JSONDecodeError:
+            # Entities already emitted cannot be taken back, so only fall back
+            # to newline-delimited JSON if nothing was decoded yet
+            if yielded:
+                raise
+    
+    # Neither of the above, read it again as newline-delimited JSON
+    with open_input(file_path) as f:
+        for line in f:
+            if line.strip():
+                if prefilter is not None and prefilter.skip(line):
+                    continue
+                try:
+                    entity = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entity, dict):
+                    yield entity
 
 
-def save_to_csv(persons: List[Dict[str, Any]], output_file: str = 'persons_with_passports.csv'):
+def iter_persons(file_path: str, parser: Optional['OpenSanctionsParser'] = None) -> Iterator[PersonEntry]:
     """
-    Save person data to CSV file.
+    Stream the person entries extracted from an OpenSanctions FTM file.
+    Memory usage stays flat regardless of the input size.
     
     Args:
-        persons: List of person dictionaries
-        output_file: Output CSV file path
+        file_path: Path to entities.ftm.json file
+        parser: Parser to run, a new one by default
+        
+    Yields:
+        Person entries
     """
-    if not persons:
-        print("No persons found in the dataset.")
-        return
+    if parser is None:
+        parser = OpenSanctionsParser()
+    return parser.iter_persons([file_path])
+
+
+# Target size of the byte ranges handed to each worker process. Using many
+# more shards than workers keeps the pool balanced and bounds the results
+# each worker holds before they are merged back
+SHARD_TARGET_SIZE = 16 << 20
+
+# Number of shards submitted per worker process that are not consumed yet. The
+# results of the shards in flight are all that the parent holds, however slowly
+# the entries are written
+SHARDS_IN_FLIGHT_PER_WORKER = 2
+
+
+def is_ndjson_file(file_path: str) -> bool:
+    """Check if a file is newline-delimited JSON, i.e. its first line is a complete entity."""
+    with open_input(file_path) as f:
+        for line in f:
+            if line.strip():
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    return False
+                return isinstance(data, dict) and not isinstance(data.get('entities'), list)
+    return False
+
+
+def compute_ndjson_shards(file_path: str, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split an NDJSON file into contiguous byte ranges that start and end on line boundaries.
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['id', 'name', 'is_latin_name', 'first_name', 'middle_name', 'second_name', 'last_name', 
-                      'aliases', 'birth_date', 'passports', 'nationality', 'has_passport', 
-                      'status', 'countries', 'datasets']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+    Args:
+        file_path: Path to the NDJSON file
+        num_shards: Desired number of shards (fewer may be returned for small files)
         
-        writer.writeheader()
-        for person in persons:
-            # Convert lists to semicolon-separated strings for CSV
-            row = person.copy()
-            # Remove all_names field from CSV output
-            #row.pop('all_names', None)
-            row['first_name'] = '; '.join(row.get('first_name', [])) if row.get('first_name') else ''
-            row['middle_name'] = '; '.join(row.get('middle_name', [])) if row.get('middle_name') else ''
-            row['second_name'] = '; '.join(row.get('second_name', [])) if row.get('second_name') else ''
-            row['last_name'] = '; '.join(row.get('last_name', [])) if row.get('last_name') else ''
-            row['aliases'] = '; '.join(row['aliases']) if row['aliases'] else ''
-            row['passports'] = '; '.join(row['passports']) if row['passports'] else ''
-            row['nationality'] = '; '.join(row.get('nationality', [])) if row.get('nationality') else ''
-            row['status'] = '; '.join(row.get('status', [])) if row.get('status') else ''
-            row['countries'] = '; '.join(row.get('countries', [])) if row.get('countries') else ''
-            row['datasets'] = '; '.join(row.get('datasets', [])) if row.get('datasets') else ''
-            writer.writerow(row)
-    
-    print(f"Data saved to {output_file}")
-
-
-def save_to_json(persons: List[Dict[str, Any]], output_file: str = 'persons_with_passports.json'):
+    Returns:
+        List of (start, end) byte offsets covering the whole file in order
     """
-    Save person data to JSON file.
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            shards = []
+            start = 0
+            for i in range(1, num_shards):
+                if start >= size:
+                    break
+                newline = mm.find(b'\n', max(size * i // num_shards, start))
+                end = size if newline == -1 else newline + 1
+                if end > start:
+                    shards.append((start, end))
+                    start = end
+            if start < size:
+                shards.append((start, size))
+    return shards
+
+
+def _iter_shard_entities(file_path: str, start: int, end: int,
+                         prefilter: Optional[SchemaPrefilter] = None) -> Iterator[Dict[str, Any]]:
+    """Decode the entities of one newline-aligned byte range of a memory-mapped NDJSON file."""
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            while pos < end:
+                newline = mm.find(b'\n', pos, end)
+                line_end = end if newline == -1 else newline
+                line = mm[pos:line_end]
+                pos = line_end + 1
+                if not line.strip():
+                    continue
+                if prefilter is not None and prefilter.skip(line):
+                    continue
+                try:
+                    entity = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if isinstance(entity, dict):
+                    yield entity
+
+
+def _extract_shard(task: Tuple['OpenSanctionsParser', str, int, Optional[int]]) -> Tuple[List[PersonEntry], List[Dict[str, Any]],
+                                                                  List[Dict[str, Any]], Tuple[int, int, list],
+                                                                  Optional[Dict[str, Any]]]:
+    """
+    Worker entry point: extract the person entries from one byte range of an NDJSON
+    file, or from a whole file of any layout when the range end is None, with a copy
+    of the parser of the run.
+    Returns the entries along with the entities without Latin names and with capped
+    name combinations found in the range, the name cache hits, misses and new
+    entries it caused, and the stage timings when profiling.
+    """
+    parser, file_path, start, end = task
+    parser.reset()
+    persons = []
+    name_cache = parser.name_cache
+    name_cache.journal = []
+    
+    prefilter = SchemaPrefilter() if parser.schema_prefilter else None
+    if end is None:
+        entities = iter_entities(file_path, prefilter)
+    else:
+        entities = _iter_shard_entities(file_path, start, end, prefilter)
+    for entity in profile_entities(entities, parser.profiler, prefilter):
+        persons.extend(parser.extract(entity))
+    
+    cache_stats = (name_cache.hits, name_cache.misses, name_cache.journal)
+    name_cache.journal = None
+    stages = parser.profiler.take() if parser.profiler is not None else None
+    return persons, parser.entities_without_latin_names, parser.entities_with_capped_names, cache_stats, stages
+
+
+def plan_shards(file_paths: List[str], workers: int) -> List[Tuple[str, int, Optional[int]]]:
+    """
+    Split the input files into the units of work handed to the worker processes, in input order.
+    Uncompressed NDJSON files are split into newline-aligned byte ranges, compressed
+    files and other layouts are processed whole.
+    """
+    shards = []
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(file_path)
+        if detect_compression(file_path) is None and is_ndjson_file(file_path):
+            size = os.path.getsize(file_path)
+            num_shards = max(workers * 4 // len(file_paths), size // SHARD_TARGET_SIZE + 1)
+            shards.extend((file_path, start, end) for start, end in compute_ndjson_shards(file_path, num_shards))
+        else:
+            shards.append((file_path, 0, None))
+    return shards
+
+
+def iter_persons_parallel(file_paths: List[str], workers: int,
+                          parser: Optional['OpenSanctionsParser'] = None) -> Iterator[PersonEntry]:
+    """
+    Extract the person entries of one or more files on several processes.
+    NDJSON files are memory-mapped and split into newline-aligned byte ranges,
+    and the results are merged back in input order so the output is identical
+    to a serial run. Files in other layouts are each handled by one worker.
     
     Args:
-        persons: List of person dictionaries
-        output_file: Output JSON file path
+        file_paths: Paths to entities.ftm.json files
+        workers: Number of worker processes
+        parser: Parser of the run, whose reports and name cache collect those of the workers
+        
+    Yields:
+        Person entries
     """
-    if not persons:
-        print("No persons found in the dataset.")
+    if parser is None:
+        parser = OpenSanctionsParser()
+    
+    shards = plan_shards(file_paths, workers) if workers > 1 else []
+    if len(shards) <= 1:
+        for file_path in file_paths:
+            for entity in parser.iter_entities(file_path, prefilter=parser.schema_prefilter):
+                yield from parser.extract(entity)
         return
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(persons, f, indent=2, ensure_ascii=False)
-    
-    print(f"Data saved to {output_file}")
-    
-    # Also save non-Latin names report if any exist
-    global entities_without_latin_names
-    if entities_without_latin_names:
-        report_file = output_file.replace('.json', '_non_latin_names.json')
-        with open(report_file, 'w', encoding='utf-8') as f:
-            json.dump(entities_without_latin_names, f, indent=2, ensure_ascii=False)
-        print(f"Non-Latin names report saved to {report_file}")
+    name_cache = parser.name_cache
+    shards = iter(shards)
+    with multiprocessing.get_context(parser.start_method).Pool(processes=workers) as pool:
+        # Results are consumed in submission order, i.e. input order, and a shard is only
+        # submitted once one of the window is consumed. Each shard gets a copy of the parser
+        # with its configuration, see OpenSanctionsParser.__getstate__
+        in_flight = deque()
+        for file_path, start, end in itertools.islice(shards, workers * SHARDS_IN_FLIGHT_PER_WORKER):
+            in_flight.append(pool.apply_async(_extract_shard, ((parser, file_path, start, end),)))
+        while in_flight:
+            persons, without_latin_names, capped_names, (hits, misses, new_names), stages = in_flight.popleft().get()
+            for file_path, start, end in itertools.islice(shards, 1):
+                in_flight.append(pool.apply_async(_extract_shard, ((parser, file_path, start, end),)))
+            if stages is not None:
+                parser.profiler.add(stages)
+            parser.entities_without_latin_names.extend(without_latin_names)
+            parser.entities_with_capped_names.extend(capped_names)
+            name_cache.hits += hits
+            name_cache.misses += misses
+            for name, entry in new_names:
+                name_cache.put(name, entry)
+            for person in persons:
+                person.intern_codes(parser.code_interner)
+            yield from persons
 
 
-def print_statistics(persons: List[Dict[str, Any]]):
+def expand_input_paths(paths: List[str]) -> List[str]:
     """
-    Print statistics about the extracted data.
+    Expand the input arguments into a list of files.
+    Directories contribute the files they contain and glob patterns their matches, sorted by name.
+    """
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if not name.startswith('.') and os.path.isfile(os.path.join(path, name))
+            ))
+        elif glob.has_magic(path):
+            file_paths.extend(sorted(p for p in glob.glob(path) if os.path.isfile(p)))
+        else:
+            file_paths.append(path)
+    # The same file listed twice would only duplicate every entry
+    return list(dict.fromkeys(file_paths))
+
+
+# Fields of a person entry holding tuples that are unioned when merging entries
+MERGED_TUPLE_FIELDS = ['first_name', 'middle_name', 'second_name', 'last_name', 'aliases', 'birth_dates', 'passports']
+MERGED_CODE_FIELDS = ['nationality', 'countries', 'datasets']
+
+
+def _dedupe_report(report: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep the first report entry of each entity id."""
+    seen_ids = set()
+    deduped = []
+    for entity in report:
+        if entity['id'] not in seen_ids:
+            seen_ids.add(entity['id'])
+            deduped.append(entity)
+    return deduped
+
+
+def merge_person_entries(persons: Iterator[PersonEntry],
+                         parser: Optional['OpenSanctionsParser'] = None) -> List[PersonEntry]:
+    """
+    Merge the entries describing the same entity, e.g. a person listed in several datasets.
+    Entries sharing an id and name become one entry whose list fields (datasets, birth
+    dates, passports...) are the union of theirs, in first-seen order, and whose status
+    has the flags of all of them. The merged entry has the MRZ preimages of all of them.
     
     Args:
-        persons: List of person dictionaries
-    """
-    global entities_without_latin_names
-    
-    total_persons = len(persons)
-    persons_with_passports = sum(1 for p in persons if p['has_passport'])
-    persons_with_aliases = sum(1 for p in persons if p['aliases'])
-    persons_with_birth_date = sum(1 for p in persons if p['birth_date'])
-    persons_with_countries = sum(1 for p in persons if p.get('countries'))
-    persons_with_latin_names = sum(1 for p in persons if p.get('is_latin_name', False))
-    persons_with_last_name = sum(1 for p in persons if p.get('last_name'))
-    persons_without_last_name = total_persons - persons_with_last_name
-    persons_with_second_name = sum(1 for p in persons if p.get('second_name'))
-    persons_without_second_name = total_persons - persons_with_second_name
-    persons_without_latin_names = total_persons - persons_with_latin_names
-    
-    # Count persons by status
-    status_counts = {}
+        persons: Person entries, possibly coming from several datasets
+        parser: Parser that extracted the entries, whose reports are deduplicated the same way
+            and whose interner shares the merged code tuples
+        
+    Returns:
+        List of merged person entries, in order of first appearance
+    """
+    interner = parser.code_interner if parser is not None else CodeInterner()
+    merged: Dict[Tuple[str, str], PersonEntry] = {}
     for person in persons:
-        for status in person.get('status', []):
-            status_counts[status] = status_counts.get(status, 0) + 1
-    
-    # Count unique entities
-    unique_entities = len(set(p['id'] for p in persons))
-    
-    print("\n" + "="*50)
-    print("STATISTICS")
-    print("="*50)
-    print(f"Total entries: {total_persons:,}")
-    print(f"Unique entities: {unique_entities:,}")
-    print(f"Entries with Latin names: {persons_with_latin_names:,} ({persons_with_latin_names/total_persons*100:.1f}%)")
-    print(f"Entries WITHOUT Latin names: {persons_without_latin_names:,} ({persons_without_latin_names/total_persons*100:.1f}%)")
-    print(f"Entities without any Latin names: {len(entities_without_latin_names):,}")
-    print(f"Persons with passports: {persons_with_passports:,} ({persons_with_passports/total_persons*100:.1f}%)")
-    print(f"Persons with aliases: {persons_with_aliases:,} ({persons_with_aliases/total_persons*100:.1f}%)")
-    print(f"Persons with birth date: {persons_with_birth_date:,} ({persons_with_birth_date/total_persons*100:.1f}%)")
-    print(f"Persons with countries: {persons_with_countries:,} ({persons_with_countries/total_persons*100:.1f}%)")
-    print(f"Persons with last name: {persons_with_last_name:,} ({persons_with_last_name/total_persons*100:.1f}%)")
-    print(f"Persons without last name: {persons_without_last_name:,} ({persons_without_last_name/total_persons*100:.1f}%)")
-    print(f"Persons with second name: {persons_with_second_name:,} ({persons_with_second_name/total_persons*100:.1f}%)")
-    print(f"Persons without second name: {persons_without_second_name:,} ({persons_without_second_name/total_persons*100:.1f}%)")
-    
-    # Show status breakdown
-    if status_counts:
-        print("\nStatus breakdown:")
-        for status, count in sorted(status_counts.items(), key=lambda x: x[1], reverse=True):
-            print(f"  {status}: {count:,} ({count/total_persons*100:.1f}%)")
-    
-    # Show examples of entities without Latin names
-    if entities_without_latin_names:
-        print("\n" + "="*50)
-        print(f"ENTITIES WITHOUT LATIN NAMES (first 10 of {len(entities_without_latin_names)})")
-        print("="*50)
-        for i, entity in enumerate(entities_without_latin_names[:10], 1):
-            print(f"\n{i}. ID: {entity['id']}")
-            print(f"   Selected name: {entity['name']}")
-            #print(f"   All variants: {' | '.join(entity['all_names'][:3])}")
-            #if len(entity['all_names']) > 3:
-            #    print(f"   ... and {len(entity['all_names']) - 3} more variants")
-    
-    # Show some examples
-    if persons_with_passports > 0:
-        print("\n" + "="*50)
-        print("SAMPLE PERSONS WITH PASSPORTS (first 5)")
-        print("="*50)
-        
-        sample_persons = [p for p in persons if p['has_passport']][:5]
-        for i, person in enumerate(sample_persons, 1):
-            print(f"\n{i}. {person['name']}")
-            if person['aliases']:
-                print(f"   Aliases: {', '.join(person['aliases'][:3])}")
-            if person['birth_date']:
-                print(f"   Birth Date: {person['birth_date']}")
-            print(f"   Passports: {', '.join(person['passports'])}")
-            if person.get('status'):
-                print(f"   Status: {', '.join(person['status'])}")
-            if person.get('countries'):
-                print(f"   Countries: {', '.join(person['countries'])}")
-            if person.get('datasets'):
-                print(f"   Datasets: {', '.join(person['datasets'][:3])}")
+        key = (person.id, person.name)
+        existing = merged.get(key)
+        if existing is None:
+            # Copied as the entry may be shared, e.g. with the incremental state
+            merged[key] = person.copy()
+            continue
+        for field in MERGED_TUPLE_FIELDS:
+            values = getattr(existing, field)
+            added = tuple(value for value in getattr(person, field) if value not in values)
+            if added:
+                setattr(existing, field, values + added)
+        for field in MERGED_CODE_FIELDS:
+            codes = getattr(existing, field)
+            added = tuple(code for code in getattr(person, field) if code not in codes)
+            if added:
+                setattr(existing, field, interner.intern(codes + added))
+        existing.status |= person.status
+    
+    if parser is not None:
+        parser.entities_without_latin_names = _dedupe_report(parser.entities_without_latin_names)
+        parser.entities_with_capped_names = _dedupe_report(parser.entities_with_capped_names)
+    
+    return list(merged.values())
 
 
-def main():
-    """Main function to run the parser."""
-    import argparse
-    
-    parser = argparse.ArgumentParser(
-        description='Parse OpenSanctions FTM JSON file to extract persons with passport information.'
-    )
-    parser.add_argument(
-        'input_file',
-        nargs='?',
-        default='entities.ftm.json',
-        help='Path to entities.ftm.json file (default: entities.ftm.json)'
-    )
-    parser.add_argument(
-        '--output-format',
-        choices=['csv', 'json', 'both'],
-        default='both',
-        help='Output format (default: both)'
-    )
-    parser.add_argument(
-        '--output-dir',
-        default='output',
-        help='Output directory (default: output)'
-    )
-    parser.add_argument(
-        '--output-prefix',
-        default='persons_with_passports',
-        help='Output file prefix (default: persons_with_passports)'
-    )
-    parser.add_argument(
-        '--filter-passports',
-        action='store_true',
-        help='Only include persons who have passports'
-    )
-    
-    args = parser.parse_args()
-    
-    print(f"Parsing file: {args.input_file}")
-    print("This may take a moment for large files...")
-    
-    # Parse the file
-    persons = parse_opensanctions_file(args.input_file)
+def entity_fingerprint(entity: Dict[str, Any]) -> str:
+    """Hash the content of an FTM entity, independently of the key order of its serialization."""
+    canonical = json.dumps(entity, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class IncrementalState:
+    """
+    Per-entity fingerprints and outputs of the previous run, kept in a state directory.
+    Only the Person entities whose content changed since the previous run go
+    through extract_person_data, the others reuse the stored entries. The
+    outputs are stored by fingerprint, so an entity appearing in several
+    datasets is extracted once per distinct content.
+    """
+
+    META_FILE = 'state.json'
+    INDEX_FILE = 'index.json'
+    OUTPUTS_FILE = 'outputs.ndjson'
+
+    def __init__(self, state_dir: str, max_name_combinations: int = DEFAULT_MAX_NAME_COMBINATIONS):
+        self.state_dir = state_dir
+        self.max_name_combinations = max_name_combinations
+        # Entity id -> fingerprints of its occurrences
+        self.previous_index: Dict[str, List[str]] = {}
+        self.index: Dict[str, List[str]] = {}
+        # Fingerprint -> (person entries, non-Latin report entry, capped names report entry)
+        self.previous_outputs: Dict[str, Tuple[List[PersonEntry], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+        self.outputs: Dict[str, Tuple[List[PersonEntry], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+        self.reused = 0
+        self.extracted = 0
+        # Shares the code tuples of the loaded entries
+        self.code_interner = CodeInterner()
+
+    def config(self) -> Dict[str, Any]:
+        """Everything besides the entity content that the stored outputs depend on."""
+        return {
+            'parser_version': PARSER_VERSION,
+            'tables_hash': TRANSLITERATION_TABLES_HASH,
+            'max_name_combinations': self.max_name_combinations,
+        }
+
+    def load(self) -> bool:
+        """
+        Load the state of the previous run.
+        
+        Returns:
+            False if there is no usable state, e.g. on the first run or after a parser change
+        """
+        try:
+            with open(os.path.join(self.state_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+                if json.load(f) != self.config():
+                    return False
+            with open(os.path.join(self.state_dir, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                self.previous_index = json.load(f)
+            with open(os.path.join(self.state_dir, self.OUTPUTS_FILE), 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    persons = [PersonEntry.from_dict(person, self.code_interner) for person in record['persons']]
+                    self.previous_outputs[record['fingerprint']] = (persons, record['non_latin'], record['capped'])
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.previous_index = {}
+            self.previous_outputs = {}
+            return False
+        return True
+
+    def iter_persons(self, file_paths: List[str], parser: 'OpenSanctionsParser') -> Iterator[PersonEntry]:
+        """Yield the person entries of the input files, extracting only new or changed entities with the parser."""
+        entities_without_latin_names = parser.entities_without_latin_names
+        entities_with_capped_names = parser.entities_with_capped_names
+        
+        for file_path in file_paths:
+            for entity in parser.iter_entities(file_path, prefilter=parser.schema_prefilter):
+                # Anything but a Person yields no entries, so there is nothing to track
+                if entity.get('schema') != 'Person':
+                    continue
+                fingerprint = entity_fingerprint(entity)
+                self.index.setdefault(entity.get('id'), []).append(fingerprint)
+                
+                output = self.outputs.get(fingerprint) or self.previous_outputs.get(fingerprint)
+                if output is None:
+                    report_size = len(entities_without_latin_names)
+                    capped_size = len(entities_with_capped_names)
+                    persons = parser.extract(entity)
+                    non_latin = entities_without_latin_names[report_size] if len(entities_without_latin_names) > report_size else None
+                    capped = entities_with_capped_names[capped_size] if len(entities_with_capped_names) > capped_size else None
+                    output = (persons, non_latin, capped)
+                    self.extracted += 1
+                else:
+                    persons, non_latin, capped = output
+                    if non_latin is not None:
+                        entities_without_latin_names.append(non_latin)
+                    if capped is not None:
+                        entities_with_capped_names.append(capped)
+                    self.reused += 1
+                self.outputs[fingerprint] = output
+                yield from persons
+
+    def delta(self) -> Dict[str, Any]:
+        """Compare the entity ids and fingerprints of this run with the previous one."""
+        added = [entity_id for entity_id in self.index if entity_id not in self.previous_index]
+        changed = [entity_id for entity_id, fingerprints in self.index.items()
+                   if entity_id in self.previous_index
+                   and sorted(fingerprints) != sorted(self.previous_index[entity_id])]
+        removed = [entity_id for entity_id in self.previous_index if entity_id not in self.index]
+        return {
+            'added': added,
+            'changed': changed,
+            'removed': removed,
+            'unchanged': len(self.index) - len(added) - len(changed),
+        }
+
+    def save(self):
+        """Write the state of this run, replacing the previous one."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        
+        def write(file_name: str, write_content):
+            # Write to a temporary file first so an interrupted run leaves the previous state intact
+            path = os.path.join(self.state_dir, file_name)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                write_content(f)
+            os.replace(path + '.tmp', path)
+        
+        def write_outputs(f):
+            for fingerprint, (persons, non_latin, capped) in self.outputs.items():
+                record = {'fingerprint': fingerprint, 'persons': [person.to_dict() for person in persons],
+                          'non_latin': non_latin, 'capped': capped}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        
+        # The metadata goes last as it is what marks the state as usable
+        write(self.OUTPUTS_FILE, write_outputs)
+        write(self.INDEX_FILE, lambda f: json.dump(self.index, f, ensure_ascii=False))
+        write(self.META_FILE, lambda f: json.dump(self.config(), f))
+
+
+class ParseCache:
+    """
+    Content-addressed cache of the outputs of whole runs, kept in a cache directory.
+    A run is keyed by the sha256 of its input files, the parser version, the
+    transliteration tables and the options that change the outputs, so a rerun
+    on byte-identical inputs links the stored outputs into place instead of parsing.
+    The input hashes are remembered by path, size and modification time, so an
+    unchanged file is not hashed again either.
+    """
+
+    ENTRIES_DIR = 'entries'
+    INPUT_HASHES_FILE = 'inputs.json'
+    MANIFEST_FILE = 'manifest.json'
+    # The cached outputs are named after their suffix, e.g. output.csv or output_mrz.bin
+    OUTPUT_NAME = 'output'
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        # Real path -> size, modification time and sha256 of the input files seen so far
+        self.input_hashes: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(os.path.join(cache_dir, self.INPUT_HASHES_FILE), 'r', encoding='utf-8') as f:
+                self.input_hashes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def hash_input(self, file_path: str) -> str:
+        """sha256 of the raw bytes of an input file, compressed or not."""
+        stat = os.stat(file_path)
+        real_path = os.path.realpath(file_path)
+        known = self.input_hashes.get(real_path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self.input_hashes[real_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                        'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def key(self, input_hashes: List[str], options: Dict[str, Any]) -> str:
+        """Cache key of a run. The inputs are kept in order as it decides the order of the merged entries."""
+        config = {
+            'parser_version': PARSER_VERSION,
+            'tables_hash': TRANSLITERATION_TABLES_HASH,
+            'inputs': input_hashes,
+            'options': options,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, self.ENTRIES_DIR, key)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Manifest of the cached outputs of a run, None if the run is not cached."""
+        try:
+            with open(os.path.join(self._entry_dir(key), self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not all(os.path.isfile(os.path.join(self._entry_dir(key), self.OUTPUT_NAME + suffix)) for suffix in manifest['files']):
+            return None
+        return manifest
+
+    @staticmethod
+    def _link(source: str, destination: str):
+        """Hard link a file, or copy it across file systems."""
+        if os.path.lexists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copyfile(source, destination)
+
+    def serve(self, key: str, manifest: Dict[str, Any], output_path: str) -> List[str]:
+        """Link the cached outputs of a run into place. Returns the output files."""
+        output_files = []
+        for suffix in manifest['files']:
+            output_file = output_path + suffix
+            self._link(os.path.join(self._entry_dir(key), self.OUTPUT_NAME + suffix), output_file)
+            output_files.append(output_file)
+        return output_files
+
+    def store(self, key: str, output_path: str, suffixes: List[str], inputs: List[Dict[str, str]]):
+        """Add the outputs of a run to the cache, keeping only the output files that were written."""
+        entry_dir = self._entry_dir(key)
+        # Fill a temporary directory first so an interrupted run leaves no partial entry
+        temp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        files = []
+        for suffix in suffixes:
+            if os.path.isfile(output_path + suffix):
+                self._link(output_path + suffix, os.path.join(temp_dir, self.OUTPUT_NAME + suffix))
+                files.append(suffix)
+        manifest = {
+            'key': key,
+            'parser_version': PARSER_VERSION,
+            'tables_hash': TRANSLITERATION_TABLES_HASH,
+            'inputs': inputs,
+            'files': files,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(temp_dir, self.MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temp_dir, entry_dir)
+
+    def save(self):
+        """Write the input hashes seen so far."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, self.INPUT_HASHES_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.input_hashes, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process, None where the resource module is missing."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+
+
+def _children_cpu_seconds() -> float:
+    """CPU time of all the child processes reaped so far, 0 where the resource module is missing."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageProfiler:
+    """
+    Wall and CPU time spent in each stage of a run, for --profile and --metrics-out.
+    Stages nest and each one is only charged its own time, e.g. the normalization of
+    names is not counted in the extraction. Time spent outside of any stage goes to
+    `other`. The stages of the worker processes are added up with those of the run.
+    The usage of the child processes is counted from the creation of the profiler, so
+    earlier runs of the process, e.g. the jobs of a server, are left out.
+    """
+
+    STAGES = ['read_decode', 'schema_filter', 'extract', 'normalize', 'merge', 'statistics', 'write', 'other']
+
+    def __init__(self, cprofile: bool = False):
+        # cProfile of the extraction of the entities, for --cprofile
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.reset()
+        self._wall_start, self._cpu_start = self._wall_mark, self._cpu_mark
+        self._children_cpu_start = _children_cpu_seconds()
+
+    def reset(self):
+        """Start over, as worker processes do with the state inherited from the parent."""
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.calls = Counter()
+        self.entities = 0
+        # Largest peak resident set size reported by the worker processes
+        self.peak_rss_children: Optional[int] = None
+        self._stack = []
+        self._wall_mark = time.perf_counter()
+        self._cpu_mark = time.process_time()
+
+    def _charge(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        stage = self._stack[-1] if self._stack else 'other'
+        self.wall[stage] += wall - self._wall_mark
+        self.cpu[stage] += cpu - self._cpu_mark
+        self._wall_mark, self._cpu_mark = wall, cpu
+
+    def push(self, stage: str):
+        """Enter a stage."""
+        self._charge()
+        self._stack.append(stage)
+        self.calls[stage] += 1
+
+    def pop(self):
+        """Leave the current stage."""
+        self._charge()
+        self._stack.pop()
+
+    def extract(self, entity: Dict[str, Any], parser: 'OpenSanctionsParser') -> List[PersonEntry]:
+        """extract_person_data, timing the schema filter and the extraction."""
+        self.push('schema_filter')
+        is_person = entity.get('schema') == 'Person'
+        self.pop()
+        if not is_person:
+            return []
+        self.push('extract')
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        try:
+            return _extract_person(entity, parser)
+        finally:
+            if self.cprofile is not None:
+                self.cprofile.disable()
+            self.pop()
+
+    def take(self) -> Dict[str, Any]:
+        """The timings so far, starting over. Used to hand the timings of a worker back to the parent."""
+        self._charge()
+        stages = {'wall': dict(self.wall), 'cpu': dict(self.cpu), 'calls': dict(self.calls), 'entities': self.entities,
+                  'peak_rss_bytes': _peak_rss_bytes()}
+        self.reset()
+        return stages
+
+    def add(self, stages: Dict[str, Any]):
+        """Add the timings taken from a worker process."""
+        self.wall.update(stages['wall'])
+        self.cpu.update(stages['cpu'])
+        self.calls.update(stages['calls'])
+        self.entities += stages['entities']
+        if stages['peak_rss_bytes'] is not None:
+            self.peak_rss_children = max(self.peak_rss_children or 0, stages['peak_rss_bytes'])
+
+    def metrics(self, input_bytes: int, persons: int) -> Dict[str, Any]:
+        """Metrics of the run so far."""
+        self._charge()
+        wall = self._wall_mark - self._wall_start
+        cpu = self._cpu_mark - self._cpu_start + _children_cpu_seconds() - self._children_cpu_start
+        metrics = {
+            'parser_version': PARSER_VERSION,
+            'timestamp': time.time(),
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'entities': self.entities,
+            'persons': persons,
+            'input_bytes': input_bytes,
+            'entities_per_second': self.entities / wall if wall > 0 else 0.0,
+            'bytes_per_second': input_bytes / wall if wall > 0 else 0.0,
+            'peak_rss_bytes': _peak_rss_bytes(),
+            'peak_rss_children_bytes': self.peak_rss_children,
+            'stages': {
+                stage: {'wall_seconds': self.wall[stage], 'cpu_seconds': self.cpu[stage], 'calls': self.calls[stage]}
+                for stage in self.STAGES
+            },
+        }
+        return metrics
+
+
+def profile_entities(entities: Iterator[Dict[str, Any]], profiler: Optional[StageProfiler] = None,
+                     prefilter: Optional[SchemaPrefilter] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Time the reading and decoding of the entities when profiling, and count them,
+    along with those the schema prefilter skipped.
+    """
+    if profiler is None:
+        return entities
+    return _profile_entities(entities, profiler, prefilter)
+
+
+def _profile_entities(entities: Iterator[Dict[str, Any]], profiler: StageProfiler,
+                      prefilter: Optional[SchemaPrefilter]) -> Iterator[Dict[str, Any]]:
+    skipped = 0
+    while True:
+        profiler.push('read_decode')
+        entity = next(entities, None)
+        profiler.pop()
+        if prefilter is not None:
+            profiler.entities += prefilter.skipped - skipped
+            skipped = prefilter.skipped
+        if entity is None:
+            return
+        profiler.entities += 1
+        yield entity
+
+
+# Prefix of the metrics in the Prometheus textfile
+PROMETHEUS_PREFIX = 'zkpassport_sanctions_parser'
+
+
+def save_metrics(metrics: Dict[str, Any], output_file: str, out: Optional[TextIO] = None):
+    """
+    Save the metrics of a run as JSON, and as a Prometheus textfile next to it with
+    the .prom extension, for the textfile collector of the node exporter.
+    """
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+    print(f"Metrics saved to {output_file}", file=out)
+    
+    lines = []
+    
+    def gauge(name: str, help_text: str, samples: List[Tuple[str, Any]]):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+        lines.extend(f"{PROMETHEUS_PREFIX}_{name}{labels} {value}" for labels, value in samples if value is not None)
+    
+    gauge('wall_seconds', 'Wall time of the run.', [('', metrics['wall_seconds'])])
+    gauge('cpu_seconds', 'CPU time of the run, worker processes included.', [('', metrics['cpu_seconds'])])
+    gauge('entities', 'Entities read.', [('', metrics['entities'])])
+    gauge('persons', 'Person entries written.', [('', metrics['persons'])])
+    gauge('input_bytes', 'Size of the input files.', [('', metrics['input_bytes'])])
+    gauge('entities_per_second', 'Entities read per second of wall time.', [('', metrics['entities_per_second'])])
+    gauge('bytes_per_second', 'Input bytes read per second of wall time.', [('', metrics['bytes_per_second'])])
+    gauge('peak_rss_bytes', 'Peak resident set size of the parser process.', [('', metrics['peak_rss_bytes'])])
+    gauge('peak_rss_children_bytes', 'Peak resident set size of the largest worker process.',
+          [('', metrics['peak_rss_children_bytes'])])
+    gauge('stage_wall_seconds', 'Wall time of each stage, summed over the worker processes.',
+          [(f'{{stage="{stage}"}}', stage_metrics['wall_seconds']) for stage, stage_metrics in metrics['stages'].items()])
+    gauge('stage_cpu_seconds', 'CPU time of each stage, summed over the worker processes.',
+          [(f'{{stage="{stage}"}}', stage_metrics['cpu_seconds']) for stage, stage_metrics in metrics['stages'].items()])
+    gauge('last_run_timestamp_seconds', 'Time the run finished.', [('', metrics['timestamp'])])
+    
+    # The textfile collector may read the file at any time, so it is replaced in one go
+    prom_file = os.path.splitext(output_file)[0] + '.prom'
+    with open(prom_file + '.tmp', 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(prom_file + '.tmp', prom_file)
+    print(f"Prometheus metrics saved to {prom_file}", file=out)
+
+
+def print_profile(metrics: Dict[str, Any], out: Optional[TextIO] = None):
+    """Print the stage timings and throughput of a run."""
+    print("\n=== PROFILE ===", file=out)
+    print(f"{'Stage':<15}{'Wall (s)':>12}{'CPU (s)':>12}{'Calls':>14}", file=out)
+    for stage, stage_metrics in metrics['stages'].items():
+        print(f"{stage:<15}{stage_metrics['wall_seconds']:>12.3f}{stage_metrics['cpu_seconds']:>12.3f}"
+              f"{stage_metrics['calls']:>14,}", file=out)
+    print(f"Total wall time: {metrics['wall_seconds']:.3f}s, CPU time: {metrics['cpu_seconds']:.3f}s", file=out)
+    print(f"Throughput: {metrics['entities_per_second']:,.0f} entities/s, "
+          f"{metrics['bytes_per_second'] / (1 << 20):,.2f} MB/s", file=out)
+    if metrics['peak_rss_bytes'] is not None:
+        workers = ''
+        if metrics['peak_rss_children_bytes'] is not None:
+            workers = f", largest worker: {metrics['peak_rss_children_bytes'] / (1 << 20):,.1f} MB"
+        print(f"Peak RSS: {metrics['peak_rss_bytes'] / (1 << 20):,.1f} MB{workers}", file=out)
+    for allocation in metrics.get('top_allocations', []):
+        print(f"  {allocation['size_bytes'] / 1024:,.1f} KiB in {allocation['count']:,} blocks: {allocation['location']}", file=out)
+
+
+def parse_opensanctions_file(file_path: str, workers: int = 1,
+                             parser: Optional['OpenSanctionsParser'] = None) -> List[PersonEntry]:
+    """
+    Parse the OpenSanctions FTM JSON file and extract person data.
+    
+    Args:
+        file_path: Path to entities.ftm.json file
+        workers: Number of worker processes to extract the entities with
+        parser: Parser to run, a new one by default
+        
+    Returns:
+        List of person entries
+    """
+    return parse_opensanctions_files([file_path], workers, merge=False, parser=parser)
+
+
+def parse_opensanctions_files(file_paths: List[str], workers: int = 1, merge: bool = True,
+                              incremental: Optional[IncrementalState] = None,
+                              parser: Optional['OpenSanctionsParser'] = None) -> List[PersonEntry]:
+    """
+    Parse several OpenSanctions FTM JSON files in one go and extract person data.
+    Exits on unreadable files, see OpenSanctionsParser.parse for a version raising errors.
     
-    # Filter if requested
-    if args.filter_passports:
-        persons = [p for p in persons if p['has_passport']]
-        print(f"Filtered to persons with passports only")
+    Args:
+        file_paths: Paths to entities.ftm.json files
+        workers: Number of worker processes to extract the entities with, unless a parser is given
+        merge: Whether to merge the entries of entities appearing in several files
+        incremental: State of the previous run, to only extract new or changed entities
+        parser: Parser to run, a new one by default
+        
+    Returns:
+        List of person entries
+    """
+    if parser is None:
+        parser = OpenSanctionsParser(workers=workers)
+    try:
+        persons = parser.parse(file_paths, merge, incremental)
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename or e}' not found.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+    
+    return persons
+
+
+# Size of the write buffer of the output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+CSV_FIELDNAMES = ['id', 'name', 'is_latin_name', 'first_name', 'middle_name', 'second_name', 'last_name',
+                  'aliases', 'birth_date', 'passports', 'nationality', 'has_passport',
+                  'status', 'countries', 'datasets']
+
+# Fields holding lists, written as semicolon-separated strings in CSV
+CSV_LIST_FIELDS = {'first_name', 'middle_name', 'second_name', 'last_name', 'aliases',
+                   'passports', 'nationality', 'status', 'countries', 'datasets'}
+
+
+class PersonWriter(abc.ABC):
+    """
+    Incremental writer of person entries to a file.
+    The file is only created once the first entry is written, so that nothing
+    is written when there are no persons, and goes through a large buffer.
+    """
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.count = 0
+        self._f = None
+
+    def _open(self):
+        self._f = open(self.output_file, 'w', encoding='utf-8', newline='', buffering=OUTPUT_BUFFER_SIZE)
+
+    @abc.abstractmethod
+    def _write_entry(self, person: Dict[str, Any]):
+        """Write the dictionary shape of a person entry to the open file."""
+
+    def _finish(self):
+        pass
+
+    def write(self, person):
+        """Write a person entry, or its dictionary shape."""
+        if self._f is None:
+            self._open()
+        self._write_entry(person_to_dict(person))
+        self.count += 1
+
+    def close(self) -> int:
+        """Finish the file. Returns the number of entries written."""
+        if self._f is not None:
+            self._finish()
+            self._f.close()
+            self._f = None
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONPersonWriter(PersonWriter):
+    """Writes the entries as a JSON array, pretty-printed with `indent` spaces or compact if None."""
+
+    def __init__(self, output_file: str, indent: Optional[int] = 2):
+        super().__init__(output_file)
+        self.indent = indent or None
+
+    def _write_entry(self, person: Dict[str, Any]):
+        if self.indent is None:
+            self._f.write(('[' if self.count == 0 else ',')
+                          + json.dumps(person, ensure_ascii=False, separators=(',', ':')))
+            return
+        # Same layout as json.dump of the whole list with the same indent
+        prefix = ' ' * self.indent
+        entry = prefix + json.dumps(person, indent=self.indent, ensure_ascii=False).replace('\n', '\n' + prefix)
+        self._f.write(('[\n' if self.count == 0 else ',\n') + entry)
+
+    def _finish(self):
+        self._f.write(']' if self.indent is None else '\n]')
+
+
+class NDJSONPersonWriter(PersonWriter):
+    """Writes one JSON entry per line."""
+
+    def _write_entry(self, person: Dict[str, Any]):
+        self._f.write(json.dumps(person, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+class CSVPersonWriter(PersonWriter):
+    """Writes the entries as CSV rows, with lists converted to semicolon-separated strings."""
+
+    def _open(self):
+        super()._open()
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(CSV_FIELDNAMES)
+
+    def _write_entry(self, person: Dict[str, Any]):
+        self._writer.writerow([
+            '; '.join(person.get(field) or ()) if field in CSV_LIST_FIELDS else person.get(field)
+            for field in CSV_FIELDNAMES
+        ])
+
+
+# ISO 3166-1 alpha-2 to alpha-3 country codes, plus Kosovo, as converted by
+# countryCodeAlpha2ToAlpha3 for the passport leaves of the sanctions tree
+_COUNTRY_CODES = """
+    AD AND AE ARE AF AFG AG ATG AI AIA AL ALB AM ARM AO AGO AQ ATA AR ARG AS ASM AT AUT AU AUS
+    AW ABW AX ALA AZ AZE BA BIH BB BRB BD BGD BE BEL BF BFA BG BGR BH BHR BI BDI BJ BEN BL BLM
+    BM BMU BN BRN BO BOL BQ BES BR BRA BS BHS BT BTN BV BVT BW BWA BY BLR BZ BLZ CA CAN CC CCK
+    CD COD CF CAF CG COG CH CHE CI CIV CK COK CL CHL CM CMR CN CHN CO COL CR CRI CU CUB CV CPV
+    CW CUW CX CXR CY CYP CZ CZE DE DEU DJ DJI DK DNK DM DMA DO DOM DZ DZA EC ECU EE EST EG EGY
+    EH ESH ER ERI ES ESP ET ETH FI FIN FJ FJI FK FLK FM FSM FO FRO FR FRA GA GAB GB GBR GD GRD
+    GE GEO GF GUF GG GGY GH GHA GI GIB GL GRL GM GMB GN GIN GP GLP GQ GNQ GR GRC GS SGS GT GTM
+    GU GUM GW GNB GY GUY HK HKG HM HMD HN HND HR HRV HT HTI HU HUN ID IDN IE IRL IL ISR IM IMN
+    IN IND IO IOT IQ IRQ IR IRN IS ISL IT ITA JE JEY JM JAM JO JOR JP JPN KE KEN KG KGZ KH KHM
+    KI KIR KM COM KN KNA KP PRK KR KOR KW KWT KY CYM KZ KAZ LA LAO LB LBN LC LCA LI LIE LK LKA
+    LR LBR LS LSO LT LTU LU LUX LV LVA LY LBY MA MAR MC MCO MD MDA ME MNE MF MAF MG MDG MH MHL
+    MK MKD ML MLI MM MMR MN MNG MO MAC MP MNP MQ MTQ MR MRT MS MSR MT MLT MU MUS MV MDV MW MWI
+    MX MEX MY MYS MZ MOZ NA NAM NC NCL NE NER NF NFK NG NGA NI NIC NL NLD NO NOR NP NPL NR NRU
+    NU NIU NZ NZL OM OMN PA PAN PE PER PF PYF PG PNG PH PHL PK PAK PL POL PM SPM PN PCN PR PRI
+    PS PSE PT PRT PW PLW PY PRY QA QAT RE REU RO ROU RS SRB RU RUS RW RWA SA SAU SB SLB SC SYC
+    SD SDN SE SWE SG SGP SH SHN SI SVN SJ SJM SK SVK SL SLE SM SMR SN SEN SO SOM SR SUR SS SSD
+    ST STP SV SLV SX SXM SY SYR SZ SWZ TC TCA TD TCD TF ATF TG TGO TH THA TJ TJK TK TKL TL TLS
+    TM TKM TN TUN TO TON TR TUR TT TTO TV TUV TW TWN TZ TZA UA UKR UG UGA UM UMI US USA UY URY
+    UZ UZB VA VAT VC VCT VE VEN VG VGB VI VIR VN VNM VU VUT WF WLF WS WSM XK XKX YE YEM YT MYT
+    ZA ZAF ZM ZMB ZW ZWE
+""".split()
+COUNTRY_ALPHA2_TO_ALPHA3 = dict(zip(_COUNTRY_CODES[::2], _COUNTRY_CODES[1::2]))
+
+
+class MRZPreimages:
+    """
+    Builds the MRZ preimages of the sanctions tree leaves from the person entries, i.e.
+    the byte rows that trees/utils.ts derives with nameToMRZ and passportToMRZ and
+    then hashes. Rows are kept in four groups, deduplicated exactly in first-seen order:
+    name (39 characters), name + date of birth (YYMMDD), name + year of birth (YY)
+    and passport number + alpha-3 country code.
+
+    The rows follow the JavaScript string semantics of utils.ts, so lengths and
+    truncation are counted in UTF-16 code units. Every code unit is a row element,
+    which fits in one byte unless the group contains non-Latin-1 characters.
+    """
+
+    GROUPS = ('name', 'name_dob', 'name_yob', 'passport_country')
+    MAGIC = b'ZKPMRZ\x00\x01'
+    NAME_LENGTH = 39
+    PASSPORT_NUMBER_LENGTH = 9
+
+    def __init__(self):
+        # Group -> rows as UTF-16-LE bytes, and the same rows as a set for deduplication
+        self.rows: Dict[str, List[bytes]] = {group: [] for group in self.GROUPS}
+        self._seen: Dict[str, set] = {group: set() for group in self.GROUPS}
+
+    def _add(self, group: str, row: str):
+        encoded = row.encode('utf-16-le', 'surrogatepass')
+        if encoded not in self._seen[group]:
+            self._seen[group].add(encoded)
+            self.rows[group].append(encoded)
+
+    @staticmethod
+    def _js_length(text: str) -> int:
+        """Length of a string in UTF-16 code units, as String.length in JavaScript."""
+        return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+    @classmethod
+    def mrz_names(cls, first_names: List[str], last_names: List[str]) -> List[str]:
+        """The MRZ name fields LASTNAME<<FIRSTNAME<<<..., as processName in utils.ts."""
+        first_names = [re.sub('[- ]', '<', name.replace("'", '').replace('.', '')) for name in first_names]
+        last_names = [re.sub('[- ]', '<', name.replace("'", '')).replace('.', '') for name in last_names]
+        names = []
+        for first_name in first_names:
+            for last_name in last_names:
+                name = last_name + '<<' + first_name
+                length = cls._js_length(name)
+                if length > cls.NAME_LENGTH:
+                    units = name.encode('utf-16-le', 'surrogatepass')[:cls.NAME_LENGTH * 2]
+                    name = units.decode('utf-16-le', 'surrogatepass')
+                else:
+                    name += '<' * (cls.NAME_LENGTH - length)
+                names.append(name.upper())
+        return names
+
+    @staticmethod
+    def mrz_dob(birth_date: str) -> Tuple[Optional[str], str]:
+        """The MRZ date of birth YYMMDD, None if incomplete, and the year, as processDob in utils.ts."""
+        if len(birth_date) == 4:
+            return None, birth_date
+        parts = birth_date.split('-')
+        year = parts[0]
+        if len(parts) < 3:
+            return None, year
+        # parseInt of the month, which ignores anything after its leading digits
+        match = re.match(r'\s*([+-]?\d+)', parts[1])
+        month = str(int(match.group(1))) if match else 'NaN'
+        return year[-2:] + month.rjust(2, '0') + parts[2].rjust(2, '0'), year
+
+    @staticmethod
+    def birth_dates(person: Dict[str, Any]) -> List[str]:
+        """The birth dates of a person entry, also of entries written before they were all kept."""
+        if 'birth_dates' in person:
+            return person['birth_dates']
+        return [person['birth_date']] if person['birth_date'] else []
+
+    @classmethod
+    def mrz_passports(cls, person: Dict[str, Any]) -> List[str]:
+        """
+        The passport preimages of a person entry, as passportsNoAndCountry in utils.ts: each
+        passport with each country, nationalities first. A merged entry may have its passports
+        and nationalities from different datasets, so every pair makes a preimage.
+        """
+        if not person['has_passport']:
+            return []
+        countries = list(dict.fromkeys(list(person['nationality']) + list(person['countries'])))
+        passports = []
+        for passport_number in person['passports']:
+            for country in countries:
+                passport = cls.mrz_passport(passport_number, country)
+                if passport is not None:
+                    passports.append(passport)
+        return passports
+
+    @classmethod
+    def mrz_passport(cls, passport_number: str, country: str) -> Optional[str]:
+        """The passport number padded to 9 characters followed by the alpha-3 country, as passportNoAndCountry in utils.ts."""
+        if country and len(country) == 2:
+            country = COUNTRY_ALPHA2_TO_ALPHA3.get(country.upper())
+        if not country:
+            return None
+        length = cls._js_length(passport_number)
+        if length < cls.PASSPORT_NUMBER_LENGTH:
+            passport_number += '<' * (cls.PASSPORT_NUMBER_LENGTH - length)
+        return passport_number + country
+
+    @classmethod
+    def iter_rows(cls, person: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """Yield the group and row of each MRZ preimage of a person entry, in its dictionary shape."""
+        dobs = [cls.mrz_dob(birth_date) for birth_date in cls.birth_dates(person)]
+        for name in cls.mrz_names(person['first_name'], person['last_name']):
+            yield 'name', name
+            for dob, year in dobs:
+                if dob is not None:
+                    yield 'name_dob', name + dob
+                yield 'name_yob', name + year[-2:]
+        for passport in cls.mrz_passports(person):
+            yield 'passport_country', passport
+
+    @staticmethod
+    def row_codes(row: str) -> List[int]:
+        """The character codes of a row, i.e. its UTF-16 code units as charCodeAt in JavaScript."""
+        encoded = row.encode('utf-16-le', 'surrogatepass')
+        return list(struct.unpack(f'<{len(encoded) // 2}H', encoded))
+
+    def add(self, person: Dict[str, Any]):
+        """Add the rows of a person entry, in its dictionary shape."""
+        for group, row in self.iter_rows(person):
+            self._add(group, row)
+
+    def packed(self, group: str) -> Tuple[int, int, List[int], bytes]:
+        """
+        Pack the rows of a group into a flat buffer of fixed-width rows, zero padded.
+
+        Returns:
+            Element size in bytes (1 or 2), row width in elements, length of each row and the buffer
+        """
+        rows = self.rows[group]
+        # Any code unit above 0xFF has a non-zero high byte
+        element_size = 2 if any(any(row[1::2]) for row in rows) else 1
+        lengths = [len(row) // 2 for row in rows]
+        width = max(lengths, default=0)
+        if element_size == 1:
+            rows = [row[::2] for row in rows]
+        row_size = width * element_size
+        return element_size, width, lengths, b''.join(row.ljust(row_size, b'\x00') for row in rows)
+
+    def write_binary(self, f):
+        """
+        Write all the groups to a binary file: the magic bytes and the number of groups,
+        then for each group a 16 bytes zero padded name, the element size, the row width
+        and the row count, the uint16 length of each row and the rows. All integers are
+        little-endian.
+        """
+        f.write(self.MAGIC + struct.pack('<I', len(self.GROUPS)))
+        for group in self.GROUPS:
+            element_size, width, lengths, buffer = self.packed(group)
+            f.write(struct.pack('<16sBHI', group.encode('ascii'), element_size, width, len(lengths)))
+            f.write(struct.pack(f'<{len(lengths)}H', *lengths))
+            f.write(buffer)
+
+    @classmethod
+    def read_binary(cls, f) -> Dict[str, List[Sequence[int]]]:
+        """
+        Read a file written by write_binary.
+
+        Returns:
+            The rows of each group, as bytes or, for groups of 2-byte elements, lists of character codes
+        """
+        data = f.read()
+        if data[:8] != cls.MAGIC:
+            raise ValueError(f"'{getattr(f, 'name', 'input')}' is not an MRZ preimages file")
+        (group_count,) = struct.unpack_from('<I', data, 8)
+        offset = 12
+        groups = {}
+        for _ in range(group_count):
+            group, element_size, width, count = struct.unpack_from('<16sBHI', data, offset)
+            offset += struct.calcsize('<16sBHI')
+            lengths = struct.unpack_from(f'<{count}H', data, offset)
+            offset += 2 * count
+            row_size = width * element_size
+            rows = []
+            for length in lengths:
+                row = data[offset:offset + length * element_size]
+                rows.append(row if element_size == 1 else list(struct.unpack(f'<{length}H', row)))
+                offset += row_size
+            groups[group.rstrip(b'\x00').decode('ascii')] = rows
+        return groups
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """
+        Convert the groups to NumPy arrays: `<group>` holds the rows as a uint8 or uint16
+        matrix, zero padded, and `<group>_lengths` the length of each row.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for the NumPy MRZ output")
+        arrays = {}
+        for group in self.GROUPS:
+            element_size, width, lengths, buffer = self.packed(group)
+            dtype = numpy.uint8 if element_size == 1 else numpy.dtype('<u2')
+            arrays[group] = numpy.frombuffer(buffer, dtype=dtype).reshape(len(lengths), width)
+            arrays[f'{group}_lengths'] = numpy.array(lengths, dtype=numpy.uint16)
+        return arrays
+
+
+class MRZPreimageWriter(PersonWriter):
+    """Writes the MRZ preimages of the entries, as a packed binary file or a NumPy .npz archive."""
+
+    def __init__(self, output_file: str, output_format: str = 'bin'):
+        super().__init__(output_file)
+        self.output_format = output_format
+        self.preimages = MRZPreimages()
+
+    def _open(self):
+        self._f = open(self.output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+
+    def _write_entry(self, person: Dict[str, Any]):
+        self.preimages.add(person)
+
+    def _finish(self):
+        if self.output_format == 'npz':
+            numpy.savez(self._f, **self.preimages.to_numpy())
+        else:
+            self.preimages.write_binary(self._f)
+
+
+def write_persons(persons: Iterator[PersonEntry], writers: List[PersonWriter],
+                  statistics: Optional['PersonStatistics'] = None, profiler: Optional[StageProfiler] = None,
+                  out: Optional[TextIO] = None) -> int:
+    """
+    Write the person entries to several outputs in a single pass, without materializing them.
+    Each entry is converted to its dictionary shape once, here, for all the writers.
     
-    # Print statistics
-    print_statistics(persons)
+    Args:
+        persons: Person entries
+        writers: Writers to send each entry to
+        statistics: Statistics to count each entry in
+        profiler: Stage profiler to time the writing with
+        out: Stream to print the written files to, standard output by default
+        
+    Returns:
+        Number of entries written
+    """
+    count = 0
+    try:
+        for person in persons:
+            if profiler is not None:
+                profiler.push('write')
+            if statistics is not None:
+                statistics.add(person)
+            person = person_to_dict(person)
+            for writer in writers:
+                writer.write(person)
+            if profiler is not None:
+                profiler.pop()
+            count += 1
+    finally:
+        if profiler is not None:
+            profiler.push('write')
+        for writer in writers:
+            writer.close()
+        if profiler is not None:
+            profiler.pop()
+    
+    if count == 0:
+        print("No persons found in the dataset.", file=out)
+    else:
+        for writer in writers:
+            print(f"Data saved to {writer.output_file}", file=out)
+    return count
+
+
+def save_non_latin_names_report(output_file: str, entities_without_latin_names: List[Dict[str, Any]],
+                                out: Optional[TextIO] = None):
+    """Save the report of the entities without Latin names next to the JSON output, if there are any."""
+    if entities_without_latin_names:
+        report_file = output_file.replace('.json', '_non_latin_names.json')
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(entities_without_latin_names, f, indent=2, ensure_ascii=False)
+        print(f"Non-Latin names report saved to {report_file}", file=out)
+
+
+def save_capped_names_report(output_file: str, entities_with_capped_names: List[Dict[str, Any]],
+                             out: Optional[TextIO] = None):
+    """Save the report of the entities whose name combinations were capped next to the JSON output, if there are any."""
+    if entities_with_capped_names:
+        report_file = output_file.replace('.json', '_capped_names.json')
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(entities_with_capped_names, f, indent=2, ensure_ascii=False)
+        print(f"Capped names report saved to {report_file}", file=out)
+
 
-    os.makedirs(args.output_dir, exist_ok=True)
+def save_cache_manifest(output_path: str, key: str, hit: bool, inputs: List[Dict[str, str]],
+                        output_files: List[str], cached: Optional[str] = None, out: Optional[TextIO] = None):
+    """Save the manifest of a run with --cache-dir, recording whether its outputs were served from the cache."""
+    manifest_file = f"{output_path}_cache_manifest.json"
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'key': key,
+            'hit': hit,
+            'cached': cached,
+            'parser_version': PARSER_VERSION,
+            'tables_hash': TRANSLITERATION_TABLES_HASH,
+            'inputs': inputs,
+            'files': output_files,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"Cache manifest saved to {manifest_file}", file=out)
+
+
+def save_to_csv(persons: Iterator[PersonEntry], output_file: str = 'persons_with_passports.csv'):
+    """
+    Save person data to CSV file.
     
-    # Save to files
-    if args.output_format in ['csv', 'both']:
-        save_to_csv(persons, f"{args.output_dir}/{args.output_prefix}.csv")
+    Args:
+        persons: Person entries, consumed as they are written
+        output_file: Output CSV file path
+    """
+    write_persons(persons, [CSVPersonWriter(output_file)])
+
+
+def save_to_json(persons: Iterator[PersonEntry], output_file: str = 'persons_with_passports.json',
+                 indent: Optional[int] = 2, parser: Optional['OpenSanctionsParser'] = None):
+    """
+    Save person data to JSON file.
     
-    if args.output_format in ['json', 'both']:
-        save_to_json(persons, f"{args.output_dir}/{args.output_prefix}.json")
+    Args:
+        persons: Person entries, consumed as they are written
+        output_file: Output JSON file path
+        indent: Indentation of the JSON output, None for compact output
+        parser: Parser that extracted the entries, whose reports are saved along
+    """
+    if write_persons(persons, [JSONPersonWriter(output_file, indent)]) and parser is not None:
+        # Also save non-Latin names and capped names reports if any exist
+        save_non_latin_names_report(output_file, parser.entities_without_latin_names)
+        save_capped_names_report(output_file, parser.entities_with_capped_names)
+
+
+def save_to_ndjson(persons: Iterator[PersonEntry], output_file: str = 'persons_with_passports.ndjson'):
+    """
+    Save person data to a newline-delimited JSON file.
     
-    print("\nDone!")
+    Args:
+        persons: Person entries, consumed as they are written
+        output_file: Output NDJSON file path
+    """
+    write_persons(persons, [NDJSONPersonWriter(output_file)])
+
+
+class HyperLogLog:
+    """
+    Approximate count of distinct strings in fixed memory, 2^precision bytes,
+    with a standard error of about 1.04 / sqrt(2^precision).
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def __len__(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small counts
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class PersonStatistics:
+    """
+    Statistics of the person entries, accumulated one entry at a time as they are
+    written, so that they don't need the entries to be kept or scanned again.
+    Unique entities are counted exactly with a set of ids, or approximately in fixed
+    memory with a HyperLogLog. The sample persons with passports are drawn with a
+    seeded reservoir, so they are the same from one run to the next. The reports and
+    name cache counters are those of the parser of the run, if given.
+    """
+
+    SAMPLE_SIZE = 5
+
+    def __init__(self, unique_count: str = 'exact', sample_size: int = SAMPLE_SIZE, seed: int = 0,
+                 parser: Optional['OpenSanctionsParser'] = None):
+        self.unique_count = unique_count
+        self.parser = parser
+        self.total = 0
+        self.with_passports = 0
+        self.with_aliases = 0
+        self.with_birth_date = 0
+        self.with_countries = 0
+        self.with_latin_names = 0
+        self.with_last_name = 0
+        self.with_second_name = 0
+        # Statuses and datasets are counted per combination of flags or codes, then expanded
+        self.status_flag_counts = Counter()
+        self.dataset_tuple_counts = Counter()
+        self.unique_ids = set() if unique_count == 'exact' else HyperLogLog()
+        self.samples: List[PersonEntry] = []
+        self.sample_size = sample_size
+        self._rng = random.Random(seed)
+        self._last_id = None
+
+    def add(self, p: PersonEntry):
+        """Count an entry."""
+        self.total += 1
+        has_passport = len(p.passports) > 0
+        self.with_passports += has_passport
+        self.with_aliases += len(p.aliases) > 0
+        self.with_birth_date += bool(p.birth_date)
+        self.with_countries += len(p.countries) > 0
+        self.with_latin_names += p.is_latin_name
+        self.with_last_name += len(p.last_name) > 0
+        self.with_second_name += len(p.second_name) > 0
+        self.status_flag_counts[p.status] += 1
+        self.dataset_tuple_counts[p.datasets] += 1
+        # The entries of an entity come one after the other, so its id only needs to be added once
+        if p.id != self._last_id:
+            self.unique_ids.add(p.id)
+            self._last_id = p.id
+        if has_passport:
+            if len(self.samples) < self.sample_size:
+                self.samples.append(p)
+            else:
+                index = self._rng.randrange(self.with_passports)
+                if index < self.sample_size:
+                    self.samples[index] = p
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = {}
+        for flags, count in self.status_flag_counts.items():
+            for status in STATUS_LISTS[flags]:
+                counts[status] = counts.get(status, 0) + count
+        return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+
+    def dataset_counts(self) -> Dict[str, int]:
+        counts = Counter()
+        for datasets, count in self.dataset_tuple_counts.items():
+            for dataset in datasets:
+                counts[dataset] += count
+        return dict(counts.most_common())
+
+    def _reports(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], NameCache]:
+        if self.parser is None:
+            return [], [], NameCache(0)
+        return self.parser.entities_without_latin_names, self.parser.entities_with_capped_names, self.parser.name_cache
+
+    def report(self) -> Dict[str, Any]:
+        """The statistics as a JSON-serializable dictionary."""
+        entities_without_latin_names, entities_with_capped_names, name_cache = self._reports()
+        return {
+            'total_entries': self.total,
+            'unique_entities': len(self.unique_ids),
+            'unique_count': self.unique_count,
+            'entries_with_latin_names': self.with_latin_names,
+            'entries_without_latin_names': self.total - self.with_latin_names,
+            'entities_without_latin_names': len(entities_without_latin_names),
+            'entities_with_capped_names': len(entities_with_capped_names),
+            'persons_with_passports': self.with_passports,
+            'persons_with_aliases': self.with_aliases,
+            'persons_with_birth_date': self.with_birth_date,
+            'persons_with_countries': self.with_countries,
+            'persons_with_last_name': self.with_last_name,
+            'persons_with_second_name': self.with_second_name,
+            'name_cache': {'hits': name_cache.hits, 'misses': name_cache.misses},
+            'status': self.status_counts(),
+            'datasets': self.dataset_counts(),
+            'samples': [person.to_dict() for person in self.samples],
+        }
+
+    def print(self, out: Optional[TextIO] = None):
+        """Print the statistics to a stream, standard output by default."""
+        total_persons = self.total
+        entities_without_latin_names, entities_with_capped_names, name_cache = self._reports()
+        
+        def share(count: int) -> str:
+            return f"{count:,} ({count/total_persons*100 if total_persons else 0:.1f}%)"
+        
+        unique = 'Unique entities' if self.unique_count == 'exact' else 'Unique entities (estimated)'
+        print("\n" + "="*50, file=out)
+        print("STATISTICS", file=out)
+        print("="*50, file=out)
+        print(f"Total entries: {total_persons:,}", file=out)
+        print(f"{unique}: {len(self.unique_ids):,}", file=out)
+        print(f"Entries with Latin names: {share(self.with_latin_names)}", file=out)
+        print(f"Entries WITHOUT Latin names: {share(total_persons - self.with_latin_names)}", file=out)
+        print(f"Entities without any Latin names: {len(entities_without_latin_names):,}", file=out)
+        print(f"Persons with passports: {share(self.with_passports)}", file=out)
+        print(f"Persons with aliases: {share(self.with_aliases)}", file=out)
+        print(f"Persons with birth date: {share(self.with_birth_date)}", file=out)
+        print(f"Persons with countries: {share(self.with_countries)}", file=out)
+        print(f"Persons with last name: {share(self.with_last_name)}", file=out)
+        print(f"Persons without last name: {share(total_persons - self.with_last_name)}", file=out)
+        print(f"Persons with second name: {share(self.with_second_name)}", file=out)
+        print(f"Persons without second name: {share(total_persons - self.with_second_name)}", file=out)
+        
+        # Show name cache efficiency
+        cache_lookups = name_cache.hits + name_cache.misses
+        if cache_lookups:
+            print(f"Name cache: {name_cache.hits:,} hits, {name_cache.misses:,} misses ({name_cache.hits/cache_lookups*100:.1f}% hit rate)", file=out)
+        
+        # Show status breakdown
+        status_counts = self.status_counts()
+        if status_counts:
+            print("\nStatus breakdown:", file=out)
+            for status, count in status_counts.items():
+                print(f"  {status}: {share(count)}", file=out)
+        
+        # Show the largest datasets
+        dataset_counts = self.dataset_counts()
+        if dataset_counts:
+            print(f"\nDataset breakdown (first 10 of {len(dataset_counts)}):", file=out)
+            for dataset, count in list(dataset_counts.items())[:10]:
+                print(f"  {dataset}: {share(count)}", file=out)
+        
+        # Show the entities whose name combinations were capped
+        if entities_with_capped_names:
+            dropped = sum(entity['dropped_combinations'] for entity in entities_with_capped_names)
+            print("\n" + "="*50, file=out)
+            print(f"ENTITIES WITH CAPPED NAME COMBINATIONS (first 10 of {len(entities_with_capped_names)}, "
+                  f"up to {dropped:,} combinations dropped)", file=out)
+            print("="*50, file=out)
+            for entity in entities_with_capped_names[:10]:
+                print(f"  {entity['id']}: {entity['generated_combinations']:,} generated, "
+                      f"up to {entity['dropped_combinations']:,} dropped", file=out)
+        
+        # Show examples of entities without Latin names
+        if entities_without_latin_names:
+            print("\n" + "="*50, file=out)
+            print(f"ENTITIES WITHOUT LATIN NAMES (first 10 of {len(entities_without_latin_names)})", file=out)
+            print("="*50, file=out)
+            for i, entity in enumerate(entities_without_latin_names[:10], 1):
+                print(f"\n{i}. ID: {entity['id']}", file=out)
+                print(f"   Selected name: {entity['primary_name']}", file=out)
+        
+        # Show some examples
+        if self.samples:
+            print("\n" + "="*50, file=out)
+            print(f"SAMPLE PERSONS WITH PASSPORTS ({len(self.samples)} drawn at random)", file=out)
+            print("="*50, file=out)
+            
+            for i, person in enumerate(self.samples, 1):
+                print(f"\n{i}. {person.name}", file=out)
+                if person.aliases:
+                    print(f"   Aliases: {', '.join(person.aliases[:3])}", file=out)
+                if person.birth_date:
+                    print(f"   Birth Date: {person.birth_date}", file=out)
+                print(f"   Passports: {', '.join(person.passports)}", file=out)
+                if person.status:
+                    print(f"   Status: {', '.join(person.status_list)}", file=out)
+                if person.countries:
+                    print(f"   Countries: {', '.join(person.countries)}", file=out)
+                if person.datasets:
+                    print(f"   Datasets: {', '.join(person.datasets[:3])}", file=out)
+
+
+def print_statistics(persons: Iterator[PersonEntry], unique_count: str = 'exact',
+                     parser: Optional['OpenSanctionsParser'] = None, out: Optional[TextIO] = None) -> PersonStatistics:
+    """
+    Print statistics about the extracted data.
+    
+    Args:
+        persons: Person entries
+        unique_count: 'exact' or 'hll' to count the unique entities
+        parser: Parser that extracted the entries, whose reports are included
+        out: Stream to print to, standard output by default
+        
+    Returns:
+        The statistics
+    """
+    statistics = PersonStatistics(unique_count, parser=parser)
+    for person in persons:
+        statistics.add(person)
+    statistics.print(out)
+    return statistics
+
+
+def save_statistics_report(statistics: PersonStatistics, output_file: str, out: Optional[TextIO] = None):
+    """Save the statistics as a JSON report next to the JSON output."""
+    report_file = output_file.replace('.json', '_statistics.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(statistics.report(), f, indent=2, ensure_ascii=False)
+    print(f"Statistics report saved to {report_file}", file=out)
+
+
+class OpenSanctionsParser:
+    """
+    The parser as a library. A parser holds its configuration, its name cache and
+    profiler, and the counters and reports of its current run: the entities without
+    Latin names and the entities whose name combinations were capped. Nothing is kept
+    in module globals, so parsers on the threads of a pool don't share any state, and
+    worker processes get a copy of the configuration. A long-lived worker can keep a
+    parser, and its warm name cache, for run after run. A parser runs on one thread at a time.
+    """
+
+    def __init__(self, max_name_combinations: int = DEFAULT_MAX_NAME_COMBINATIONS, workers: int = 1,
+                 name_cache: Optional[NameCache] = None, profiler: Optional[StageProfiler] = None,
+                 schema_prefilter: bool = True, start_method: Optional[str] = None):
+        """
+        Args:
+            max_name_combinations: Maximum number of full names generated per entity, 0 for no limit
+            workers: Number of worker processes to extract the entities with
+            name_cache: Name cache to go through, a new one by default
+            profiler: Stage profiler to time the runs with
+            schema_prefilter: Whether to skip the NDJSON lines of non-Person entities without decoding them
+            start_method: Start method of the worker processes, e.g. 'spawn' when the parser runs in a
+                process with other threads, which a forked worker would inherit the locks of. The
+                platform default by default
+        """
+        self.max_name_combinations = max_name_combinations
+        self.workers = workers
+        self.name_cache = name_cache if name_cache is not None else NameCache()
+        self.code_interner = CodeInterner()
+        self.profiler = profiler
+        self.schema_prefilter = schema_prefilter
+        self.start_method = start_method
+        self.reset()
+
+    def reset(self):
+        """Start a new run, clearing the reports and the name cache counters of the previous one."""
+        self.entities_without_latin_names: List[Dict[str, Any]] = []
+        self.entities_with_capped_names: List[Dict[str, Any]] = []
+        self.name_cache.hits = self.name_cache.misses = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Copies, e.g. those of the worker processes, only get the configuration. They start
+        # with empty caches and reports, which keeps sending a parser with each shard cheap
+        # and has each shard report only the entities it found
+        state = self.__dict__.copy()
+        state['name_cache'] = NameCache(self.name_cache.max_size)
+        state['code_interner'] = CodeInterner()
+        state['entities_without_latin_names'] = []
+        state['entities_with_capped_names'] = []
+        if self.profiler is not None:
+            # Worker processes only hand their stage timings back, without cProfile
+            state['profiler'] = StageProfiler()
+        return state
+
+    def normalize(self, name: str) -> Tuple[bool, str]:
+        """Normalize a name for the MRZ, see normalize_name."""
+        return normalize_name(name, self.name_cache, self.profiler)
+
+    def extract(self, entity: Dict[str, Any]) -> List[PersonEntry]:
+        """Extract the person entries of an FTM entity, see extract_person_data."""
+        if self.profiler is not None:
+            return self.profiler.extract(entity, self)
+        # Check if this is a Person entity
+        if entity.get('schema') != 'Person':
+            return []
+        return _extract_person(entity, self)
+
+    def iter_entities(self, file_path: str, prefilter: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the entities of an FTM file, see iter_entities.
+        
+        Args:
+            file_path: Path to entities.ftm.json file
+            prefilter: Whether to skip the NDJSON lines of non-Person entities where that is certain,
+                which still lets some entities of other schemas through
+            
+        Yields:
+            FTM entity dictionaries
+        """
+        schema_prefilter = SchemaPrefilter() if prefilter else None
+        return profile_entities(iter_entities(file_path, schema_prefilter), self.profiler, schema_prefilter)
+
+    def iter_persons(self, file_paths: List[str],
+                     incremental: Optional[IncrementalState] = None) -> Iterator[PersonEntry]:
+        """
+        Start a run streaming the person entries extracted from FTM files, on the worker
+        processes of the parser if there are several.
+        
+        Args:
+            file_paths: Paths to entities.ftm.json files, or the path to a single one
+            incremental: State of the previous run, to only extract new or changed entities
+            
+        Yields:
+            Person entries
+        """
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        self.reset()
+        if incremental is not None:
+            yield from incremental.iter_persons(file_paths, self)
+        else:
+            yield from iter_persons_parallel(file_paths, self.workers, self)
+
+    def parse(self, file_paths: List[str], merge: bool = True,
+              incremental: Optional[IncrementalState] = None) -> List[PersonEntry]:
+        """
+        Run on FTM files and collect the person entries.
+        
+        Args:
+            file_paths: Paths to entities.ftm.json files
+            merge: Whether to merge the entries of entities appearing in several files
+            incremental: State of the previous run, to only extract new or changed entities
+            
+        Returns:
+            List of person entries
+        """
+        persons = self.iter_persons(file_paths, incremental)
+        if not merge:
+            return list(persons)
+        if self.profiler is not None:
+            self.profiler.push('merge')
+        persons = merge_person_entries(persons, self)
+        if self.profiler is not None:
+            self.profiler.pop()
+        return persons
+
+    def run(self, input_files: List[str], output_dir: str = 'output', output_prefix: str = 'persons_with_passports',
+            output_format: str = 'both', indent: Optional[int] = 2, filter_passports: bool = False,
+            mrz_output: Optional[str] = None, unique_count: str = 'exact', incremental: Optional[str] = None,
+            cache_dir: Optional[str] = None, name_cache_file: Optional[str] = None, merge: bool = True,
+            out: Optional[TextIO] = None) -> Optional[int]:
+        """
+        Run on FTM files and write the outputs, statistics and reports, as the command line does.
+        The arguments are those of the command line, and out the stream the progress and
+        statistics are printed to, standard output by default.
+        
+        Returns:
+            Number of entries written, None if the outputs were served from the parse cache
+        """
+        # The entries are streamed to the writers, so missing inputs must be found before any output is opened
+        for input_file in input_files:
+            if not os.path.isfile(input_file):
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), input_file)
+        
+        if name_cache_file:
+            loaded = self.name_cache.load(name_cache_file)
+            print(f"Loaded {loaded:,} cached names from {name_cache_file}", file=out)
+        
+        output_path = f"{output_dir}/{output_prefix}"
+        output_suffixes = []
+        if output_format in ['csv', 'both', 'all']:
+            output_suffixes.append('.csv')
+        if output_format in ['json', 'both', 'all']:
+            output_suffixes.append('.json')
+        if output_format in ['ndjson', 'all']:
+            output_suffixes.append('.ndjson')
+        if mrz_output:
+            output_suffixes.append(f'_mrz.{mrz_output}')
+        output_suffixes += ['_statistics.json', '_non_latin_names.json', '_capped_names.json']
+        
+        cache = None
+        if cache_dir:
+            cache = ParseCache(cache_dir)
+            inputs = [{'path': input_file, 'sha256': cache.hash_input(input_file)} for input_file in input_files]
+            cache_key = cache.key([item['sha256'] for item in inputs], {
+                'output_format': output_format,
+                'indent': indent,
+                'filter_passports': filter_passports,
+                'mrz_output': mrz_output,
+                'max_name_combinations': self.max_name_combinations,
+                'unique_count': unique_count,
+                'merge': merge,
+            })
+            cache.save()
+            manifest = cache.lookup(cache_key)
+            if manifest is not None:
+                os.makedirs(output_dir, exist_ok=True)
+                output_files = cache.serve(cache_key, manifest, output_path)
+                save_cache_manifest(output_path, cache_key, True, inputs, output_files, manifest['created'], out)
+                for output_file in output_files:
+                    print(f"Data served from the cache: {output_file}", file=out)
+                return None
+            print(f"Run not cached in {cache_dir}, parsing", file=out)
+        
+        for input_file in input_files:
+            print(f"Parsing file: {input_file}", file=out)
+        print("This may take a moment for large files...", file=out)
+        
+        state = None
+        if incremental:
+            state = IncrementalState(incremental, self.max_name_combinations)
+            if state.load():
+                print(f"Loaded previous run state from {incremental}", file=out)
+            else:
+                print(f"No usable previous run state in {incremental}, processing all entities", file=out)
+        
+        # Parse the files. Unless they are merged, the entries are streamed from the inputs to the
+        # writers and the statistics, so the memory used doesn't grow with the size of the outputs
+        if merge and len(input_files) > 1:
+            persons = self.parse(input_files, merge=True, incremental=state)
+        else:
+            persons = self.iter_persons(input_files, state)
+        
+        # Filter if requested
+        if filter_passports:
+            persons = (p for p in persons if p.has_passport)
+            print(f"Filtering to persons with passports only", file=out)
+        
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # Outputs of a previous run may be hard links into the parse cache, so they are replaced rather than overwritten
+        for suffix in output_suffixes:
+            if os.path.lexists(output_path + suffix):
+                os.remove(output_path + suffix)
+        
+        # Save to files, writing all the formats in a single pass
+        writers = []
+        if output_format in ['csv', 'both', 'all']:
+            writers.append(CSVPersonWriter(f"{output_path}.csv"))
+        if output_format in ['json', 'both', 'all']:
+            writers.append(JSONPersonWriter(f"{output_path}.json", indent))
+        if output_format in ['ndjson', 'all']:
+            writers.append(NDJSONPersonWriter(f"{output_path}.ndjson"))
+        if mrz_output:
+            writers.append(MRZPreimageWriter(f"{output_path}_mrz.{mrz_output}", mrz_output))
+        # The statistics are counted as the entries are written
+        statistics = PersonStatistics(unique_count, parser=self)
+        written = write_persons(persons, writers, statistics, self.profiler, out)
+        if self.profiler is not None:
+            self.profiler.push('statistics')
+        statistics.print(out)
+        if self.profiler is not None:
+            self.profiler.pop()
+        save_statistics_report(statistics, f"{output_path}.json", out)
+        if written:
+            save_non_latin_names_report(f"{output_path}.json", self.entities_without_latin_names, out)
+            save_capped_names_report(f"{output_path}.json", self.entities_with_capped_names, out)
+        
+        if state is not None:
+            delta = state.delta()
+            delta_file = f"{output_dir}/{output_prefix}_delta.json"
+            with open(delta_file, 'w', encoding='utf-8') as f:
+                json.dump(delta, f, indent=2, ensure_ascii=False)
+            print(f"\nEntities extracted: {state.extracted:,}, reused from the previous run: {state.reused:,}", file=out)
+            print(f"Added: {len(delta['added']):,}, changed: {len(delta['changed']):,}, removed: {len(delta['removed']):,}", file=out)
+            print(f"Delta saved to {delta_file}", file=out)
+            state.save()
+        
+        if cache is not None:
+            cache.store(cache_key, output_path, output_suffixes, inputs)
+            output_files = [output_path + suffix for suffix in output_suffixes if os.path.isfile(output_path + suffix)]
+            save_cache_manifest(output_path, cache_key, False, inputs, output_files, out=out)
+            print(f"Outputs cached in {cache_dir}", file=out)
+        
+        if name_cache_file:
+            self.name_cache.save(name_cache_file)
+        
+        return written
+
+
+# Benchmark names of every script handled by the normalizer
+BENCHMARK_NAMES = ["O'Brien-Smith", 'José María', 'Müller', 'Иванов Сергей', 'محمد عبد الله', 'Nguyễn Văn']
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the requests of a connection, one JSON object per line each way."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle_request_object(json.loads(line))
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ParserServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long-running parser answering requests over a Unix socket, so that callers don't pay
+    the interpreter startup, the imports and the construction of the tables on each call.
+    Each connection is served by a thread and can send any number of requests:
+
+    - {"op": "normalize", "names": [...]}: the normalized MRZ form of each name, as in the
+      entries, with whether the name is mostly Latin
+    - {"op": "parse", "args": [...], "cwd": "..."}: run the parser with command line
+      arguments from a working directory, returning its exit code and output
+    - {"op": "ping"} and {"op": "shutdown"}
+
+    Parse jobs resolve their paths against the working directory of the request, print to a
+    buffer of their own and spawn their worker processes, so nothing process-wide changes;
+    --tracemalloc, which traces the whole process, is rejected. They run one at a time as they
+    share a name cache that stays warm from one job to the next. Normalization requests
+    have their own name cache so they are not held up by a running parse job.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, name_cache_size: int = DEFAULT_NAME_CACHE_SIZE):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+        self.socket_path = socket_path
+        self.name_cache = NameCache(name_cache_size)
+        self.job_name_cache = NameCache(name_cache_size)
+        self._name_lock = threading.Lock()
+        self._job_lock = threading.Lock()
+
+    def normalize(self, names: List[str]) -> List[Tuple[bool, str]]:
+        with self._name_lock:
+            return [normalize_name(name, self.name_cache) for name in names]
+
+    def parse(self, args: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
+        output = io.StringIO()
+        parser = build_argument_parser(output)
+        try:
+            parsed_args = parser.parse_args(args)
+            if parsed_args.tracemalloc:
+                parser.error('--tracemalloc traces the whole process and is not available in server jobs')
+            if cwd:
+                resolve_paths(parsed_args, cwd)
+            with self._job_lock:
+                # Worker processes are spawned rather than forked from the threads of the server
+                run(parsed_args, parser, self.job_name_cache, output, start_method='spawn')
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        return {'exit_code': exit_code, 'output': output.getvalue()}
+
+    def handle_request_object(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        if op == 'normalize':
+            return {'ok': True, 'names': self.normalize(request['names'])}
+        if op == 'parse':
+            return {'ok': True, **self.parse(request['args'], request.get('cwd'))}
+        if op == 'ping':
+            return {'ok': True, 'parser_version': PARSER_VERSION}
+        if op == 'shutdown':
+            # shutdown waits for serve_forever to return, so it can't run on the thread of a request
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unknown op: {op}"}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class ParserClient:
+    """Client of a ParserServer, keeping one connection open for all its requests."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._reader = self._socket.makefile('rb')
+
+    def request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request and wait for its response. Raises RuntimeError if the request failed."""
+        self._socket.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("The parser server closed the connection")
+        response = json.loads(line)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response
+
+    def normalize(self, names: List[str]) -> List[Tuple[bool, str]]:
+        """Normalize names for the MRZ, see normalize_name."""
+        return [tuple(entry) for entry in self.request({'op': 'normalize', 'names': names})['names']]
+
+    def parse(self, args: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+        """Run a parse job with command line arguments. Returns its exit code and output."""
+        response = self.request({'op': 'parse', 'args': args, 'cwd': cwd or os.getcwd()})
+        return response['exit_code'], response['output']
+
+    def shutdown(self):
+        """Stop the server."""
+        self.request({'op': 'shutdown'})
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def serve(socket_path: str, name_cache_size: int = DEFAULT_NAME_CACHE_SIZE):
+    """Run a parser server until it is shut down or interrupted."""
+    with ParserServer(socket_path, name_cache_size) as server:
+        print(f"Listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print("Server stopped")
+
+
+def benchmark_server(socket_path: str, rounds: int = 10000):
+    """Print the latency of single-name normalization requests, and the process spawn time it replaces."""
+    with ParserClient(socket_path) as client:
+        client.normalize(BENCHMARK_NAMES)
+        latencies = []
+        for i in range(rounds):
+            name = BENCHMARK_NAMES[i % len(BENCHMARK_NAMES)]
+            start = time.perf_counter()
+            client.normalize([name])
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"Single-name requests: {rounds:,}")
+    for label, quantile in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]:
+        print(f"  {label}: {latencies[int(quantile * (rounds - 1))] * 1000:.3f} ms")
+    print(f"  mean: {sum(latencies) / rounds * 1000:.3f} ms")
+    
+    # What each call cost without the server: a new interpreter importing the parser
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import parse_opensanctions'], check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    print(f"Process spawn and import: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def build_argument_parser(out: Optional[TextIO] = None):
+    """
+    Command line arguments of the parser, shared by the command line and the parse jobs of the server.
+    
+    Args:
+        out: Stream the usage, help and errors are printed to, standard output and error by default
+    """
+    import argparse
+    
+    class ArgumentParser(argparse.ArgumentParser):
+        def _print_message(self, message: str, file=None):
+            super()._print_message(message, out if out is not None else file)
+    
+    parser = ArgumentParser(
+        description='Parse OpenSanctions FTM JSON file to extract persons with passport information.'
+    )
+    parser.add_argument(
+        'input_files',
+        nargs='*',
+        default=['entities.ftm.json'],
+        help='Paths to entities.ftm.json files, directories or glob patterns, optionally gzip, bz2, xz '
+             'or zstd compressed. Entities found in several files are merged (default: entities.ftm.json)'
+    )
+    parser.add_argument(
+        '--no-merge',
+        action='store_true',
+        help='Keep the entries of each input file instead of merging the entities found in several files. '
+             'A merged entry keeps the birth dates, passports and countries of every file, so both make '
+             'the same sanctions tree leaves'
+    )
+    parser.add_argument(
+        '--output-format',
+        choices=['csv', 'json', 'ndjson', 'both', 'all'],
+        default='both',
+        help='Output format, both being csv and json (default: both)'
+    )
+    parser.add_argument(
+        '--indent',
+        type=int,
+        default=2,
+        help='Indentation of the JSON output, 0 for compact JSON (default: 2)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        default='output',
+        help='Output directory (default: output)'
+    )
+    parser.add_argument(
+        '--output-prefix',
+        default='persons_with_passports',
+        help='Output file prefix (default: persons_with_passports)'
+    )
+    parser.add_argument(
+        '--filter-passports',
+        action='store_true',
+        help='Only include persons who have passports'
+    )
+    parser.add_argument(
+        '--name-cache-size',
+        type=int,
+        default=DEFAULT_NAME_CACHE_SIZE,
+        help=f'Maximum number of normalized names kept in memory, 0 to disable (default: {DEFAULT_NAME_CACHE_SIZE})'
+    )
+    parser.add_argument(
+        '--name-cache-file',
+        help='File the name cache is loaded from before parsing and saved to afterwards'
+    )
+    parser.add_argument(
+        '--mrz-output',
+        choices=['bin', 'npz'],
+        help='Also write the MRZ preimages of the sanctions tree leaves (name, name and date of birth, '
+             'name and year of birth, passport number and country), deduplicated, as a packed binary '
+             'file or a NumPy archive'
+    )
+    parser.add_argument(
+        '--max-name-combinations',
+        type=int,
+        default=DEFAULT_MAX_NAME_COMBINATIONS,
+        help='Maximum number of names generated from the first, middle, second and last names of one entity, '
+             f'0 for no limit. Capped entities are listed in a report (default: {DEFAULT_MAX_NAME_COMBINATIONS})'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes used to parse the input files and NDJSON shards (default: 1)'
+    )
+    parser.add_argument(
+        '--incremental',
+        metavar='STATE_DIR',
+        help='Only extract the entities that changed since the previous run using the state kept in STATE_DIR, '
+             'and write a delta file listing the added, changed and removed entity ids (ignores --workers)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help='Cache the outputs of the run in CACHE_DIR, keyed by the sha256 of the input files, the parser version '
+             'and the transliteration tables, and link them into place instead of parsing when the same run is '
+             'cached. A manifest of the outputs served from the cache is written next to them'
+    )
+    parser.add_argument(
+        '--unique-count',
+        choices=['exact', 'hll'],
+        default='exact',
+        help='Count the unique entities of the statistics exactly, or estimate them in fixed memory with a '
+             'HyperLogLog (default: exact)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the wall and CPU time of each stage of the run (reading and decoding, schema filter, extraction, '
+             'name normalization, merge, statistics, writers), the throughput and the peak memory'
+    )
+    parser.add_argument(
+        '--metrics-out',
+        metavar='FILE',
+        help='Save the profile of the run to FILE as JSON, and as a Prometheus textfile with the .prom extension'
+    )
+    parser.add_argument(
+        '--tracemalloc',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Trace the memory allocations and add the N largest allocation sites to the profile (slows the run down)'
+    )
+    parser.add_argument(
+        '--cprofile',
+        metavar='FILE',
+        help='Profile the extraction of the entities with cProfile and save the stats to FILE, '
+             'readable with pstats (only covers the main process, use --workers 1)'
+    )
+    parser.add_argument(
+        '--serve',
+        metavar='SOCKET',
+        help='Run as a server listening on the Unix socket SOCKET for parse jobs and name normalization requests, '
+             'keeping the tables and the name cache warm between requests. The input files are ignored'
+    )
+    parser.add_argument(
+        '--benchmark-server',
+        metavar='SOCKET',
+        help='Measure the latency of name normalization requests to the server listening on SOCKET'
+    )
+    return parser
+
+
+# Command line arguments holding paths, relative to the working directory of the caller
+PATH_ARGUMENTS = ['output_dir', 'name_cache_file', 'incremental', 'cache_dir', 'metrics_out', 'cprofile']
+
+
+def resolve_paths(args, cwd: str):
+    """Make the paths of parsed command line arguments, input patterns included, relative to a working directory."""
+    args.input_files = [os.path.join(cwd, path) for path in args.input_files]
+    for name in PATH_ARGUMENTS:
+        if getattr(args, name):
+            setattr(args, name, os.path.join(cwd, getattr(args, name)))
+
+
+def run(args, parser, name_cache: Optional[NameCache] = None, out: Optional[TextIO] = None,
+        start_method: Optional[str] = None):
+    """
+    Run the parser with parsed command line arguments.
+    
+    Args:
+        args: Parsed command line arguments
+        parser: Argument parser, to report invalid combinations of arguments
+        name_cache: Name cache to keep across runs, e.g. those of a server, a new one by default
+        out: Stream to print to, standard output by default
+        start_method: Start method of the worker processes, see OpenSanctionsParser
+    """
+    if args.cache_dir and args.incremental:
+        parser.error('--cache-dir cannot be combined with --incremental')
+    
+    profiler = None
+    if args.profile or args.metrics_out or args.tracemalloc or args.cprofile:
+        if args.tracemalloc:
+            tracemalloc.start()
+        profiler = StageProfiler(cprofile=bool(args.cprofile))
+    
+    if args.mrz_output == 'npz' and numpy is None:
+        print("Error: NumPy is required for --mrz-output npz, install the numpy package or use --mrz-output bin", file=out)
+        sys.exit(1)
+    
+    if name_cache is None:
+        name_cache = NameCache(args.name_cache_size)
+    else:
+        name_cache.resize(args.name_cache_size)
+    sanctions_parser = OpenSanctionsParser(args.max_name_combinations, args.workers, name_cache, profiler,
+                                           start_method=start_method)
+    
+    input_files = expand_input_paths(args.input_files)
+    if not input_files:
+        print(f"Error: No input files found in {', '.join(args.input_files)}", file=out)
+        sys.exit(1)
+    
+    try:
+        written = sanctions_parser.run(
+            input_files, args.output_dir, args.output_prefix, args.output_format, args.indent,
+            filter_passports=args.filter_passports, mrz_output=args.mrz_output, unique_count=args.unique_count,
+            incremental=args.incremental, cache_dir=args.cache_dir, name_cache_file=args.name_cache_file,
+            merge=not args.no_merge, out=out,
+        )
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename or e}' not found.", file=out)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file: {e}", file=out)
+        sys.exit(1)
+    
+    # Nothing was parsed when the outputs were served from the cache
+    if profiler is not None and written is not None:
+        metrics = profiler.metrics(sum(os.path.getsize(input_file) for input_file in input_files), written)
+        if args.tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            metrics['top_allocations'] = [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:args.tracemalloc]
+            ]
+        if args.profile:
+            print_profile(metrics, out)
+        if args.metrics_out:
+            save_metrics(metrics, args.metrics_out, out)
+        if args.cprofile:
+            profiler.cprofile.dump_stats(args.cprofile)
+            print(f"cProfile stats saved to {args.cprofile}", file=out)
+    
+    print("\nDone!", file=out)
+
+
+def main():
+    """Main function to run the parser."""
+    parser = build_argument_parser()
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.name_cache_size)
+    elif args.benchmark_server:
+        benchmark_server(args.benchmark_server)
+    else:
+        run(args, parser)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+"""
+Poseidon2 hash over the BN254 scalar field, as used by the Noir sanctions exclusion check.
+Computes the sanctions tree leaves from the MRZ preimages written by parse_opensanctions.py,
+in batches spread over a process pool.
+"""
+
+import json
+import multiprocessing
+import sys
+from typing import List, Dict, Optional, Sequence
+
+# BN254 scalar field modulus
+P = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+# Parameters of the permutation used by Noir's Poseidon2::hash: width 4, rate 3,
+# 8 full and 56 partial rounds with the x^5 s-box
+T = 4
+RATE = 3
+ROUNDS_F = 8
+ROUNDS_P = 56
+
+# Diagonal of the internal matrix, minus one: state[i] * d[i] + sum(state)
+INTERNAL_MATRIX_DIAGONAL = [
+    0x10dc6e9c006ea38b04b1e03b4bd9490c0d03f98929ca1d7fb56821fd19d3b6e7,
+    0x0c28145b6a44df3e0149b3d0a30b3bb599df9756d4dd9b84a86b38cfb45a740b,
+    0x00544b8338791518b2c7645a50392798b21f75bb60e3596170067d00141cac15,
+    0x222c01175718386f2e2e82eb122789e352e105a3b8fa852613bc534433ee428b,
+]
+
+# Rows of MRZ preimages hashed per task sent to the worker processes
+HASH_BATCH_SIZE = 2048
+
+
+def _grain_round_constants(count: int) -> List[int]:
+    """
+    Generate the round constants with the Grain LFSR of the Poseidon reference
+    implementation, seeded with the field, s-box and round parameters.
+    """
+    bits = []
+    for value, width in [(1, 2), (0, 4), (P.bit_length(), 12), (T, 12), (ROUNDS_F, 10), (ROUNDS_P, 10)]:
+        bits.extend((value >> (width - 1 - i)) & 1 for i in range(width))
+    bits.extend([1] * 30)
+
+    position = 0
+
+    def next_bit() -> int:
+        nonlocal position
+        bit = (bits[position + 62] ^ bits[position + 51] ^ bits[position + 38]
+               ^ bits[position + 23] ^ bits[position + 13] ^ bits[position])
+        bits.append(bit)
+        position += 1
+        return bit
+
+    for _ in range(160):
+        next_bit()
+
+    def next_output() -> int:
+        # Self-shrinking: each pair of bits outputs its second bit if its first bit is set
+        while not next_bit():
+            next_bit()
+        return next_bit()
+
+    constants = []
+    while len(constants) < count:
+        value = 0
+        for _ in range(P.bit_length()):
+            value = (value << 1) | next_output()
+        if value < P:
+            constants.append(value)
+    return constants
+
+
+# One constant per element in the full rounds and one for the first element in the partial rounds
+ROUND_CONSTANTS = _grain_round_constants(ROUNDS_F * T + ROUNDS_P)
+_FULL_ROUND_CONSTANTS_START = [
+    ROUND_CONSTANTS[i * T:(i + 1) * T] for i in range(ROUNDS_F // 2)
+]
+_PARTIAL_ROUND_CONSTANTS = ROUND_CONSTANTS[ROUNDS_F // 2 * T:ROUNDS_F // 2 * T + ROUNDS_P]
+_FULL_ROUND_CONSTANTS_END = [
+    ROUND_CONSTANTS[ROUNDS_F // 2 * T + ROUNDS_P + i * T:ROUNDS_F // 2 * T + ROUNDS_P + (i + 1) * T]
+    for i in range(ROUNDS_F // 2)
+]
+
+
+def _external_matrix(s0: int, s1: int, s2: int, s3: int):
+    """Multiply by the external matrix [[5,7,1,3],[4,6,1,1],[1,3,5,7],[1,1,4,6]], without reduction."""
+    t0 = s0 + s1
+    t1 = s2 + s3
+    t2 = 2 * s1 + t1
+    t3 = 2 * s3 + t0
+    t4 = 4 * t1 + t3
+    t5 = 4 * t0 + t2
+    return t3 + t5, t5, t2 + t4, t4
+
+
+def permute(state: Sequence[int]) -> List[int]:
+    """Apply the Poseidon2 permutation to a state of 4 field elements."""
+    d0, d1, d2, d3 = INTERNAL_MATRIX_DIAGONAL
+    s0, s1, s2, s3 = _external_matrix(*state)
+
+    for c0, c1, c2, c3 in _FULL_ROUND_CONSTANTS_START:
+        s0, s1, s2, s3 = _external_matrix(pow(s0 + c0, 5, P), pow(s1 + c1, 5, P), pow(s2 + c2, 5, P), pow(s3 + c3, 5, P))
+
+    for c in _PARTIAL_ROUND_CONSTANTS:
+        s0 = pow(s0 + c, 5, P)
+        total = s0 + s1 + s2 + s3
+        s0, s1, s2, s3 = (s0 * d0 + total) % P, (s1 * d1 + total) % P, (s2 * d2 + total) % P, (s3 * d3 + total) % P
+
+    for c0, c1, c2, c3 in _FULL_ROUND_CONSTANTS_END:
+        s0, s1, s2, s3 = _external_matrix(pow(s0 + c0, 5, P), pow(s1 + c1, 5, P), pow(s2 + c2, 5, P), pow(s3 + c3, 5, P))
+
+    return [s0 % P, s1 % P, s2 % P, s3 % P]
+
+
+def poseidon2_hash(inputs: Sequence[int], message_size: Optional[int] = None) -> int:
+    """
+    Hash field elements with the Poseidon2 sponge, as Poseidon2::hash(inputs, message_size) in Noir.
+    The capacity element is initialized with the message size times 2^64.
+    """
+    if message_size is None:
+        message_size = len(inputs)
+    state = [0, 0, 0, (message_size << 64) % P]
+    cache = [0] * RATE
+    cache_size = 0
+
+    def duplex():
+        # Only the elements absorbed since the last permutation are added
+        for i in range(cache_size):
+            state[i] = (state[i] + cache[i]) % P
+        state[:] = permute(state)
+
+    for value in inputs[:message_size]:
+        if cache_size == RATE:
+            duplex()
+            cache[0] = value % P
+            cache_size = 1
+        else:
+            cache[cache_size] = value % P
+            cache_size += 1
+    duplex()
+    return state[0]
+
+
+def hash_leaf(row: Sequence[int]) -> int:
+    """Hash an MRZ preimage row, one field element per character as u8_array_to_fields in Noir."""
+    return poseidon2_hash(row, len(row))
+
+
+def hash_leaves_batch(rows: List[Sequence[int]]) -> List[int]:
+    """Hash a batch of MRZ preimage rows. Worker entry point of hash_leaves."""
+    return [hash_leaf(row) for row in rows]
+
+
+def hash_leaves(rows: List[Sequence[int]], workers: int = 1, batch_size: int = HASH_BATCH_SIZE) -> List[int]:
+    """
+    Hash MRZ preimage rows into sanctions tree leaves, in batches spread over several processes.
+
+    Args:
+        rows: Preimage rows, as sequences of character codes
+        workers: Number of worker processes
+        batch_size: Number of rows per task
+
+    Returns:
+        The leaves, in the order of the rows
+    """
+    batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+    if workers <= 1 or len(batches) <= 1:
+        return [leaf for batch in batches for leaf in hash_leaves_batch(batch)]
+
+    leaves = []
+    with multiprocessing.Pool(processes=workers) as pool:
+        # imap returns the results in submission order, i.e. row order
+        for batch_leaves in pool.imap(hash_leaves_batch, batches):
+            leaves.extend(batch_leaves)
+    return leaves
+
+
+def hash_mrz_preimages(groups: Dict[str, List[Sequence[int]]], workers: int = 1) -> Dict[str, List[int]]:
+    """Hash the rows of each group of MRZ preimages, keeping the groups."""
+    # The groups are hashed in one go so that small groups don't leave workers idle
+    rows = [row for group_rows in groups.values() for row in group_rows]
+    leaves = iter(hash_leaves(rows, workers))
+    return {group: [next(leaves) for _ in group_rows] for group, group_rows in groups.items()}
+
+
+def main():
+    """Hash the MRZ preimages written by parse_opensanctions.py --mrz-output bin into tree leaves."""
+    import argparse
+    from parse_opensanctions import MRZPreimages
+
+    parser = argparse.ArgumentParser(
+        description='Hash the MRZ preimages of parse_opensanctions.py into the leaves of the sanctions tree.'
+    )
+    parser.add_argument(
+        'input_file',
+        help='MRZ preimages file written with --mrz-output bin'
+    )
+    parser.add_argument(
+        '--output',
+        default='leaves.json',
+        help='Output JSON file mapping each group to its leaves as decimal strings (default: leaves.json)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of processes used to hash the leaves (default: number of CPUs)'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.input_file, 'rb') as f:
+            groups = MRZPreimages.read_binary(f)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+
+    print(f"Hashing {sum(len(rows) for rows in groups.values()):,} rows with {args.workers} workers...")
+    leaves = hash_mrz_preimages(groups, args.workers)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({group: [str(leaf) for leaf in group_leaves] for group, group_leaves in leaves.items()}, f)
+    for group, group_leaves in leaves.items():
+        print(f"  {group}: {len(group_leaves):,} leaves")
+    print(f"Leaves saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
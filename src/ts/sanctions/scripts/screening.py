@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+"""
+Exact screening of MRZ data against the sanctions entries, before generating an exclusion proof.
+Indexes the output of parse_opensanctions.py by the same MRZ preimages as the sanctions tree
+leaves (name, name and date of birth, name and year of birth, passport number and country),
+so a query matches an entry exactly when its leaf would be in the tree.
+The index can be exported to a sorted key file that worker processes memory-map and share.
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import re
+import struct
+import sys
+import time
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+
+from parse_opensanctions import MRZPreimages, NameCache, iter_entities, normalize_name
+
+# Header of the key file: magic bytes, key count and entry count, followed by the sorted
+# key records, the uint64 offset of each entry in the entries section, and the entries
+KEY_FILE_MAGIC = b'ZKPSCR\x00\x01'
+KEY_FILE_HEADER = struct.Struct('<8sQQ')
+KEY_FILE_OFFSET = struct.Struct('<Q')
+
+# Key records: digest of the group and MRZ preimage, and the row of the entry
+KEY_SIZE = 16
+KEY_RECORD = struct.Struct(f'<{KEY_SIZE}sI')
+
+# Date of birth of a query already in the YYMMDD form of the MRZ
+MRZ_DOB = re.compile(r'\d{6}')
+
+
+def _as_list(value) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def query_rows(query: Dict[str, Any], name_cache: Optional[NameCache] = None) -> List[Tuple[str, str]]:
+    """
+    The MRZ preimages of a query, as MRZPreimages.iter_rows for an entry.
+
+    The query holds the raw `first_name` and `last_name`, as strings or lists, which are
+    normalized with the rules of the parser, the `birth_date` as YYYY-MM-DD or as the
+    YYMMDD of the MRZ, the `passport_number` and the alpha-2 or alpha-3 `nationality`.
+    The names go through the name cache when one is given.
+    """
+    first_names = [normalize_name(name, name_cache)[1] for name in _as_list(query.get('first_name'))]
+    last_names = [normalize_name(name, name_cache)[1] for name in _as_list(query.get('last_name'))]
+    birth_date = query.get('birth_date') or ''
+    dob = year = None
+    if MRZ_DOB.fullmatch(birth_date):
+        dob, year = birth_date, birth_date[:2]
+    elif birth_date:
+        dob, year = MRZPreimages.mrz_dob(birth_date)
+
+    rows = []
+    for name in MRZPreimages.mrz_names(first_names, last_names):
+        rows.append(('name', name))
+        if dob is not None:
+            rows.append(('name_dob', name + dob))
+        if year is not None:
+            rows.append(('name_yob', name + year[-2:]))
+    passports = MRZPreimages.mrz_passports({
+        'has_passport': bool(query.get('passport_number')),
+        'passports': _as_list(query.get('passport_number')),
+        'nationality': _as_list(query.get('nationality')),
+        'countries': [],
+    })
+    rows.extend(('passport_country', passport) for passport in passports)
+    return rows
+
+
+def key_digest(group: str, key: str) -> bytes:
+    """Fixed-width key of an MRZ preimage of a group in the key file."""
+    return hashlib.blake2b(f"{group}:{key}".encode('utf-8', 'surrogatepass'), digest_size=KEY_SIZE).digest()
+
+
+class ScreeningIndex:
+    """
+    Hash index of the sanctions entries by MRZ preimage.
+    Each group maps its preimages to the rows of the entries that have it, and
+    the entry ids and statuses are kept once per row.
+    The names of the queries go through a name cache, which can be the one of a parser.
+    """
+
+    def __init__(self, name_cache: Optional[NameCache] = None):
+        self.name_cache = name_cache if name_cache is not None else NameCache()
+        self.ids: List[str] = []
+        self.statuses: List[List[str]] = []
+        self.keys: Dict[str, Dict[str, List[int]]] = {group: {} for group in MRZPreimages.GROUPS}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, person: Dict[str, Any]):
+        """Index an entry of parse_opensanctions.py, in its dictionary shape."""
+        row = len(self.ids)
+        self.ids.append(person['id'])
+        self.statuses.append(person.get('status') or [])
+        for group, key in MRZPreimages.iter_rows(person):
+            rows = self.keys[group].setdefault(key, [])
+            if not rows or rows[-1] != row:
+                rows.append(row)
+
+    @classmethod
+    def build(cls, persons_file: str, name_cache: Optional[NameCache] = None) -> 'ScreeningIndex':
+        """Index a persons JSON or NDJSON file written by parse_opensanctions.py."""
+        index = cls(name_cache)
+        for person in iter_entities(persons_file):
+            index.add(person)
+        return index
+
+    def rows(self, group: str, key: str) -> Sequence[int]:
+        """Rows of the entries having an MRZ preimage in a group."""
+        return self.keys[group].get(key, ())
+
+    def entry(self, row: int) -> Dict[str, Any]:
+        """Id and status of the entry of a row."""
+        return {'id': self.ids[row], 'status': self.statuses[row]}
+
+    def lookup_keys(self, group: str, keys: Sequence[str]) -> List[Sequence[int]]:
+        """Rows of the entries matching each MRZ preimage of a group, for keys already in MRZ form."""
+        get = self.keys[group].get
+        return [get(key, ()) for key in keys]
+
+    def screen(self, queries: Sequence[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Screen a batch of queries, see query_rows for their fields.
+        The distinct preimages of the whole batch are looked up with one lookup_keys call per group.
+
+        Returns:
+            For each query, the matching entries with their id, status and the groups they matched in
+        """
+        query_keys = [query_rows(query, self.name_cache) for query in queries]
+        found: Dict[str, Dict[str, Sequence[int]]] = {group: {} for group in MRZPreimages.GROUPS}
+        for rows in query_keys:
+            for group, key in rows:
+                found[group][key] = ()
+        for group, group_found in found.items():
+            if group_found:
+                keys = list(group_found)
+                group_found.update(zip(keys, self.lookup_keys(group, keys)))
+
+        results = []
+        for rows in query_keys:
+            matches: Dict[int, List[str]] = {}
+            for group, key in rows:
+                for row in found[group][key]:
+                    matches.setdefault(row, []).append(group)
+            results.append([{**self.entry(row), 'groups': groups} for row, groups in matches.items()])
+        return results
+
+    def write_key_file(self, f):
+        """
+        Write the index as a key file: the header, the key records sorted by digest,
+        the offsets of the entries and the entries as JSON lines. The integers are
+        little-endian.
+        """
+        records = sorted(
+            (key_digest(group, key), row)
+            for group, group_keys in self.keys.items()
+            for key, rows in group_keys.items()
+            for row in rows
+        )
+        f.write(KEY_FILE_HEADER.pack(KEY_FILE_MAGIC, len(records), len(self.ids)))
+        f.write(b''.join(KEY_RECORD.pack(digest, row) for digest, row in records))
+        entries = [
+            json.dumps(self.entry(row), ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for row in range(len(self.ids))
+        ]
+        offset = 0
+        for entry in entries:
+            f.write(KEY_FILE_OFFSET.pack(offset))
+            offset += len(entry)
+        f.write(KEY_FILE_OFFSET.pack(offset))
+        f.write(b''.join(entries))
+
+    def close(self):
+        """Nothing to release for an index in memory, see MappedScreeningIndex."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _SortedDigests:
+    """The digests of the key records as a sequence, read from the records buffer on demand."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records) // KEY_RECORD.size
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = index * KEY_RECORD.size
+        return bytes(self.records[offset:offset + KEY_SIZE])
+
+
+class MappedScreeningIndex(ScreeningIndex):
+    """
+    Screening index over a memory-mapped key file.
+    Opening it reads nothing but the header, and each lookup is a binary search touching
+    a few pages, so processes on one host share one copy of the index in the page cache.
+    """
+
+    def __init__(self, key_file: str, name_cache: Optional[NameCache] = None):
+        self.name_cache = name_cache if name_cache is not None else NameCache()
+        with open(key_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if len(view) < KEY_FILE_HEADER.size or bytes(view[:len(KEY_FILE_MAGIC)]) != KEY_FILE_MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"'{key_file}' is not a screening key file")
+        _, key_count, self.entry_count = KEY_FILE_HEADER.unpack_from(view)
+        offset = KEY_FILE_HEADER.size
+        self._records = view[offset:offset + key_count * KEY_RECORD.size]
+        offset += key_count * KEY_RECORD.size
+        self._offsets = view[offset:offset + (self.entry_count + 1) * KEY_FILE_OFFSET.size]
+        self._entries = view[offset + (self.entry_count + 1) * KEY_FILE_OFFSET.size:]
+        self._view = view
+        self._digests = _SortedDigests(self._records)
+
+    def __len__(self) -> int:
+        return self.entry_count
+
+    def add(self, person: Dict[str, Any]):
+        raise TypeError("A key file is read-only")
+
+    def _find(self, digest: bytes, start: int = 0) -> Tuple[List[int], int]:
+        """Rows of the records of a digest, searching from a record, and the record after them."""
+        index = bisect.bisect_left(self._digests, digest, start)
+        rows = []
+        while index < len(self._digests) and self._digests[index] == digest:
+            rows.append(KEY_RECORD.unpack_from(self._records, index * KEY_RECORD.size)[1])
+            index += 1
+        return rows, index
+
+    def rows(self, group: str, key: str) -> Sequence[int]:
+        return self._find(key_digest(group, key))[0]
+
+    def entry(self, row: int) -> Dict[str, Any]:
+        start, = KEY_FILE_OFFSET.unpack_from(self._offsets, row * KEY_FILE_OFFSET.size)
+        end, = KEY_FILE_OFFSET.unpack_from(self._offsets, (row + 1) * KEY_FILE_OFFSET.size)
+        return json.loads(bytes(self._entries[start:end]))
+
+    def lookup_keys(self, group: str, keys: Sequence[str]) -> List[Sequence[int]]:
+        # The digests are searched in order, each search starting after the records of the previous one
+        digests = [key_digest(group, key) for key in keys]
+        results: List[Sequence[int]] = [()] * len(keys)
+        start = 0
+        for position in sorted(range(len(keys)), key=digests.__getitem__):
+            results[position], start = self._find(digests[position], start)
+        return results
+
+    def write_key_file(self, f):
+        raise TypeError("A key file can't be exported again")
+
+    def close(self):
+        """Release the memory-mapped key file."""
+        if self._mmap is not None:
+            for view in (self._records, self._offsets, self._entries, self._view):
+                view.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def load_index(index_file: str, name_cache: Optional[NameCache] = None) -> ScreeningIndex:
+    """
+    Open a key file memory-mapped, or build the index of a persons file of parse_opensanctions.py.
+    Either index can be used as a context manager closing it.
+    """
+    with open(index_file, 'rb') as f:
+        is_key_file = f.read(len(KEY_FILE_MAGIC)) == KEY_FILE_MAGIC
+    if is_key_file:
+        return MappedScreeningIndex(index_file, name_cache)
+    return ScreeningIndex.build(index_file, name_cache)
+
+
+def iter_queries(queries_file: str) -> Iterator[Dict[str, Any]]:
+    """Yield the queries of a JSON array or NDJSON file."""
+    yield from iter_entities(queries_file)
+
+
+def main():
+    """Screen a file of queries against the output of parse_opensanctions.py."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Screen MRZ data against the persons extracted by parse_opensanctions.py.'
+    )
+    parser.add_argument(
+        'index_file',
+        help='Persons JSON or NDJSON file written by parse_opensanctions.py, or key file written with --export-keys'
+    )
+    parser.add_argument(
+        'queries_file',
+        nargs='?',
+        help='JSON array or NDJSON file of queries with first_name, last_name, birth_date, passport_number '
+             'and nationality fields'
+    )
+    parser.add_argument(
+        '--output',
+        default='screening.ndjson',
+        help='Output NDJSON file with the matches of each query (default: screening.ndjson)'
+    )
+    parser.add_argument(
+        '--export-keys',
+        metavar='KEY_FILE',
+        help='Write the index to a sorted key file, which screening processes memory-map instead of loading the persons'
+    )
+
+    args = parser.parse_args()
+    if args.queries_file is None and args.export_keys is None:
+        parser.error('a queries file or --export-keys is required')
+
+    try:
+        start = time.perf_counter()
+        index = load_index(args.index_file)
+        print(f"Loaded an index of {len(index):,} entries in {time.perf_counter() - start:.2f}s")
+        queries = list(iter_queries(args.queries_file)) if args.queries_file else []
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+
+    with index:
+        if args.export_keys:
+            if isinstance(index, MappedScreeningIndex):
+                print("Error: the index is already a key file")
+                sys.exit(1)
+            with open(args.export_keys, 'wb') as f:
+                index.write_key_file(f)
+            print(f"Key file saved to {args.export_keys}")
+            if not queries:
+                return
+
+        start = time.perf_counter()
+        results = index.screen(queries)
+        elapsed = time.perf_counter() - start
+        rate = f", {len(queries) / elapsed:,.0f} queries/s" if elapsed > 0 else ""
+        print(f"Screened {len(queries):,} queries in {elapsed:.3f}s{rate}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for query, matches in zip(queries, results):
+            f.write(json.dumps({'query': query, 'matches': matches}, ensure_ascii=False) + '\n')
+
+    print(f"Queries with matches: {sum(1 for matches in results if matches):,}")
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
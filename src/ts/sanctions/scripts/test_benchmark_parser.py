@@ -0,0 +1,39 @@
+# SPDX-License-Identifier: GPL-3.0
+"""
+Tests of the synthetic corpus and benchmark harness of the parser.
+Run with: python -m pytest src/ts/sanctions/scripts
+"""
+
+from collections import Counter
+
+from benchmark_parser import STAGES, CorpusConfig, generate_entities, run_benchmarks, write_corpus
+from parse_opensanctions import is_arabic, is_cyrillic, iter_entities
+
+
+def test_corpus_is_seeded_and_follows_the_mix():
+    config = CorpusConfig(entities=2000, seed=7, latin=0, cyrillic=1, arabic=1, person_ratio=0.5, passport_ratio=1)
+    entities = list(generate_entities(config))
+    assert entities == list(generate_entities(config))
+    assert entities != list(generate_entities(CorpusConfig(entities=2000, seed=8)))
+
+    persons = [entity for entity in entities if entity['schema'] == 'Person']
+    assert 900 < len(persons) < 1100
+    assert all(entity['properties']['passportNumber'] for entity in persons)
+    scripts = Counter('cyrillic' if is_cyrillic(person['properties']['name'][0]) else
+                      'arabic' if is_arabic(person['properties']['name'][0]) else 'latin' for person in persons)
+    assert scripts['latin'] == 0 and scripts['cyrillic'] > 400 and scripts['arabic'] > 400
+
+
+def test_benchmarks_run_every_stage(tmp_path):
+    config = CorpusConfig(entities=200, seed=3)
+    corpus_file = str(tmp_path / 'entities.ftm.json.gz')
+    write_corpus(config, corpus_file)
+    assert list(iter_entities(corpus_file)) == list(generate_entities(config))
+
+    results = run_benchmarks(config, corpus_file, STAGES, repeat=1, sample=50)
+    assert list(results) == STAGES
+    assert results['extract_person_data']['items'] == 50
+    assert results['parse_file']['items'] == 200
+    persons = sum(1 for entity in list(generate_entities(config))[:50] if entity['schema'] == 'Person')
+    assert results['screening']['items'] == 2 * persons
+    assert all(stage['items_per_second'] > 0 and stage['peak_traced_bytes'] > 0 for stage in results.values())
@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: GPL-3.0
+"""
+Tests of the Python ordered Merkle tree builder.
+Run with: python -m pytest src/ts/sanctions/scripts
+"""
+
+import json
+import random
+
+import ordered_mt
+from non_membership import NonMembershipWitnesses
+from ordered_mt import OrderedMerkleTree, hash_pair, load_tree, save_binary_tree, zero_hashes
+from test_poseidon2 import compute_root
+
+
+def test_tree_layout_and_proofs(monkeypatch):
+    rng = random.Random(18)
+    leaves = [rng.randrange(1, 1 << 250) for _ in range(11)]
+    tree = OrderedMerkleTree.build(leaves, depth=5)
+
+    # The 0 leaf comes first, then the sorted leaves, then empty leaves
+    assert [tree.leaf(i) for i in range(14)] == [0] + sorted(leaves) + [0, 0]
+    assert tree.leaf_count == 12
+    zeros = zero_hashes(5)
+    assert tree.node(2, 3) == zeros[2]
+    assert tree.node(2, 2) == hash_pair(hash_pair(tree.leaf(8), tree.leaf(9)), hash_pair(tree.leaf(10), tree.leaf(11)))
+    for index in range(1 << 5):
+        assert compute_root(tree.leaf(index), index, tree.sibling_path(index)) == tree.root
+
+    serialized = tree.serialize()
+    assert [len(level) for level in serialized] == [12, 6, 3, 2, 1, 1]
+    assert OrderedMerkleTree.from_serialized(serialized).root == tree.root
+
+    # Hashing the levels in parallel batches gives the same tree
+    monkeypatch.setattr(ordered_mt, 'HASH_BATCH_SIZE', 2)
+    assert OrderedMerkleTree.build(leaves, depth=5, workers=2).serialize() == serialized
+
+
+def test_non_membership_witnesses():
+    rng = random.Random(15)
+    leaves = [rng.randrange(1, 1 << 250) for _ in range(20)]
+    witnesses = NonMembershipWitnesses(OrderedMerkleTree.build(leaves, depth=6))
+    root = witnesses.tree.root
+
+    queries = [rng.randrange(1, max(leaves)) for _ in range(50)] + [1]
+    for query, proof in zip(queries, witnesses.prove_batch(queries)):
+        # Same checks as ordered_mt_non_membership in ordered_mt.nr
+        left, right = proof['left'], proof['right']
+        for inclusion in (left, right):
+            sibling_path = [int(node, 16) for node in inclusion['sibling_path']]
+            assert compute_root(int(inclusion['leaf'], 16), inclusion['leaf_index'], sibling_path) == root
+        assert int(left['leaf'], 16) < query < int(right['leaf'], 16)
+        assert left['leaf_index'] + 1 == right['leaf_index']
+
+    # Leaves and values above the largest leaf have no non-membership proof
+    assert witnesses.prove_batch([leaves[3], 0, max(leaves) + 1]) == [None, None, None]
+
+
+def test_binary_tree_format(tmp_path):
+    rng = random.Random(16)
+    leaves = [rng.randrange(1, 1 << 250) for _ in range(21)]
+    tree = OrderedMerkleTree.build(leaves, depth=6)
+    json_file = tmp_path / 'tree.json'
+    json_file.write_text(json.dumps(tree.serialize()))
+    binary_file = tmp_path / 'tree.bin'
+    # Converted from the JSON serialization, as ordered_mt.py --convert does
+    save_binary_tree(load_tree(str(json_file)), str(binary_file))
+
+    header_size = ordered_mt.BINARY_HEADER.size + 7 * ordered_mt.BINARY_LEVEL_COUNT.size
+    assert binary_file.stat().st_size == header_size + sum(len(level) for level in tree.levels)
+
+    with load_tree(str(binary_file)) as mapped:
+        assert (mapped.depth, mapped.leaf_count, mapped.root) == (6, 22, tree.root)
+        assert mapped.serialize() == tree.serialize()
+        for index in (0, 5, 21, 22, 63):
+            assert mapped.sibling_path(index) == tree.sibling_path(index)
+
+        queries = [rng.randrange(1, max(leaves)) for _ in range(20)] + [leaves[0]]
+        expected = NonMembershipWitnesses(tree).prove_batch(queries)
+        assert NonMembershipWitnesses(mapped).prove_batch(queries) == expected
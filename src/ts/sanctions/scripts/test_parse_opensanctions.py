@@ -0,0 +1,765 @@
+# SPDX-License-Identifier: GPL-3.0
+"""
+Tests for the OpenSanctions FTM parser.
+Run with: python -m pytest src/ts/sanctions/scripts
+"""
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import random
+import threading
+import unicodedata
+
+import pytest
+
+import parse_opensanctions
+
+from parse_opensanctions import (
+    ARABIC_TRANSLITERATION,
+    CYRILLIC_TRANSLITERATION,
+    HyperLogLog,
+    IncrementalState,
+    LATIN_TRANSLITERATION,
+    MRZPreimages,
+    MRZ_STRIPPED_CHARACTERS,
+    NameCache,
+    OpenSanctionsParser,
+    ParseCache,
+    SchemaPrefilter,
+    ParserClient,
+    ParserServer,
+    StageProfiler,
+    _JSONStreamDecoder,
+    PersonEntry,
+    PersonStatistics,
+    clean_name_for_mrz,
+    detect_compression,
+    extract_person_data,
+    is_arabic,
+    is_cyrillic,
+    is_latin,
+    iter_entities,
+    iter_name_combinations,
+    iter_persons,
+    merge_person_entries,
+    normalize_name,
+    save_metrics,
+    transliterate_arabic,
+    transliterate_cyrillic,
+)
+
+
+# Reference implementations using one str.replace per table entry, as the
+# parser originally did. The compiled tables must produce the same output
+def reference_transliterate_cyrillic(text: str) -> str:
+    if not text:
+        return text
+    result = text
+    for char, replacement in CYRILLIC_TRANSLITERATION.items():
+        result = result.replace(char, replacement)
+        result = result.replace(char.lower(), replacement.lower())
+    return result
+
+
+def reference_transliterate_arabic(text: str) -> str:
+    if not text:
+        return text
+    result = text
+    for char, replacement in ARABIC_TRANSLITERATION.items():
+        result = result.replace(char, replacement)
+    result = result.replace("XTA ", "XAH ").replace("XTA-", "XAH-")
+    if result.endswith("XTA"):
+        result = result[:-3] + "XAH"
+    return result
+
+
+def reference_clean_name_for_mrz(name: str) -> str:
+    if not name:
+        return name
+    cleaned = name
+    for char, replacement in LATIN_TRANSLITERATION.items():
+        cleaned = cleaned.replace(char, replacement)
+    cleaned = cleaned.replace("'", "").replace("'", "").replace("`", "").replace("´", "")
+    cleaned = cleaned.replace("ʼ", "").replace("ʻ", "").replace("ʽ", "")
+    cleaned = cleaned.replace("ʾ", "").replace("ʿ", "").replace("ˈ", "").replace("ˊ", "").replace("ˋ", "")
+    cleaned = cleaned.replace('"', "").replace('"', "").replace('"', "")
+    cleaned = " ".join(cleaned.split())
+    return cleaned.upper()
+
+
+def reference_is_latin(text: str) -> bool:
+    if not text:
+        return False
+    latin_count = 0
+    total_alpha = 0
+    for char in text:
+        if char.isalpha():
+            total_alpha += 1
+            char_name = unicodedata.name(char, '')
+            if 'LATIN' in char_name or char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz':
+                latin_count += 1
+    if total_alpha == 0:
+        return False
+    return (latin_count / total_alpha) > 0.5
+
+
+def reference_has_alpha_in_range(text: str, low: str, high: str) -> bool:
+    return any(char.isalpha() and low <= char <= high for char in text)
+
+
+ALL_TABLE_CHARACTERS = sorted(
+    set(LATIN_TRANSLITERATION)
+    | set(CYRILLIC_TRANSLITERATION)
+    | {char.lower() for char in CYRILLIC_TRANSLITERATION}
+    | set(ARABIC_TRANSLITERATION)
+    | set(MRZ_STRIPPED_CHARACTERS)
+)
+
+
+def sample_inputs():
+    """Every table character alone and in context, plus seeded random mixes."""
+    inputs = ["", " ", "XTA", "XTA XTA-XTA", "John O'Brien"]
+    for char in ALL_TABLE_CHARACTERS:
+        inputs.extend([char, char.lower(), f"A{char}b", f"{char} {char}-{char}", f"x  {char}  "])
+    inputs.append("".join(ALL_TABLE_CHARACTERS))
+
+    rng = random.Random(9303)
+    alphabet = ALL_TABLE_CHARACTERS + list("abcXYZ -'éñ")
+    for _ in range(2000):
+        inputs.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 24))))
+    return inputs
+
+
+def test_clean_name_for_mrz_matches_reference():
+    for text in sample_inputs():
+        assert clean_name_for_mrz(text) == reference_clean_name_for_mrz(text), repr(text)
+
+
+def test_transliterate_cyrillic_matches_reference():
+    for text in sample_inputs():
+        assert transliterate_cyrillic(text) == reference_transliterate_cyrillic(text), repr(text)
+
+
+def test_transliterate_arabic_matches_reference():
+    for text in sample_inputs():
+        assert transliterate_arabic(text) == reference_transliterate_arabic(text), repr(text)
+
+
+def test_teh_marbuta_at_end_of_name_components():
+    assert transliterate_arabic("فاطمة") == "FAXTTMXAH"
+    assert transliterate_arabic("ة ة-ة") == "XAH XAH-XAH"
+
+
+def test_script_detection_matches_reference():
+    rng = random.Random(3166)
+    # Latin, Cyrillic, Arabic, Greek, CJK, digits, punctuation and characters beyond the BMP
+    alphabet = ALL_TABLE_CHARACTERS + list("abcXYZ 019-.ÆøŁΑΩ李明ა\U0001D400\U0001F600\U00020000")
+    texts = ["", " ", "123", "\U0001D400\U0001D401 ab"] + [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 16))) for _ in range(5000)
+    ]
+    for text in texts:
+        assert is_latin(text) == reference_is_latin(text), repr(text)
+        assert is_cyrillic(text) == reference_has_alpha_in_range(text, '\u0400', '\u04FF'), repr(text)
+        assert is_arabic(text) == reference_has_alpha_in_range(text, '\u0600', '\u06FF'), repr(text)
+
+
+def test_person_entry_round_trips():
+    entity = {
+        'id': 'Q1', 'schema': 'Person', 'datasets': ['interpol_red_notices', 'wd_peps'],
+        'properties': {
+            'name': ['John Smith', 'Jon Smith'], 'passportNumber': ['X123'], 'nationality': ['gb'],
+            'country': ['gb', 'us'], 'topics': ['sanction', 'poi'], 'birthDate': ['1970-01-02'],
+        },
+    }
+    entries = extract_person_data(entity)
+    assert [entry.name for entry in entries] == ['JOHN SMITH', 'JON SMITH']
+    # Variants of one entity share their tuples
+    assert entries[0].passports is entries[1].passports
+    assert entries[0].to_dict()['status'] == ['sanctioned', 'person-of-interest', 'interpol-notice', 'pep']
+    for entry in entries:
+        data = entry.to_dict()
+        assert PersonEntry.from_dict(data).to_dict() == data
+        assert pickle.loads(pickle.dumps(entry)).to_dict() == data
+
+
+def test_name_combinations_are_distinct_and_capped():
+    combinations = [name for _, name in iter_name_combinations(['A', 'A'], [], [], ['B', 'C'], exclude=['A C'])]
+    assert combinations == ['A B']
+
+    entity = {
+        'id': 'Q2', 'schema': 'Person',
+        'properties': {'name': ['X Y'], 'firstName': ['A', 'B', 'C'], 'lastName': ['D', 'E', 'F']},
+    }
+    parser = OpenSanctionsParser(max_name_combinations=4)
+    entries = extract_person_data(entity, parser)
+    assert [entry.name for entry in entries] == ['X Y', 'A D', 'A E', 'A F', 'B D']
+    assert entity['properties']['name'] == ['X Y']
+    assert parser.entities_with_capped_names == [
+        {'id': 'Q2', 'generated_combinations': 4, 'dropped_combinations': 5},
+    ]
+
+
+def test_mrz_preimages_match_tree_utils():
+    # Expected rows as built by nameToMRZ and passportToMRZ in trees/utils.ts
+    preimages = MRZPreimages()
+    person = {
+        'first_name': ['John Miller-Junior', 'Jo.'], 'last_name': ["O'Doe"], 'birth_date': '1988-1-05',
+        'has_passport': True, 'passports': ['A1234', 'B5678'], 'nationality': [], 'countries': ['DE'],
+    }
+    preimages.add(person)
+    preimages.add(dict(person, birth_date='1988'))
+    preimages.add({
+        'first_name': ['A' * 40], 'last_name': ['Ä'], 'birth_date': None,
+        'has_passport': True, 'passports': ['X1'], 'nationality': ['ZZ'], 'countries': [],
+    })
+    rows = {group: [row.decode('utf-16-le') for row in rows] for group, rows in preimages.rows.items()}
+    assert rows == {
+        'name': ['ODOE<<JOHN<MILLER<JUNIOR<<<<<<<<<<<<<<<', 'ODOE<<JO' + '<' * 31, 'Ä<<' + 'A' * 36],
+        'name_dob': ['ODOE<<JOHN<MILLER<JUNIOR<<<<<<<<<<<<<<<880105', 'ODOE<<JO' + '<' * 31 + '880105'],
+        'name_yob': ['ODOE<<JOHN<MILLER<JUNIOR<<<<<<<<<<<<<<<88', 'ODOE<<JO' + '<' * 31 + '88'],
+        'passport_country': ['A1234<<<<DEU', 'B5678<<<<DEU'],
+    }
+
+    f = io.BytesIO()
+    preimages.write_binary(f)
+    data = f.getvalue()
+    assert data[:8] == MRZPreimages.MAGIC and struct.unpack_from('<I', data, 8) == (4,)
+    name, element_size, width, count = struct.unpack_from('<16sBHI', data, 12)
+    assert (name.rstrip(b'\x00'), element_size, width, count) == (b'name', 1, 39, 3)
+    offset = 12 + struct.calcsize('<16sBHI')
+    assert struct.unpack_from('<3H', data, offset) == (39, 39, 39)
+    assert data[offset + 6:offset + 6 + 39] == b'ODOE<<JOHN<MILLER<JUNIOR<<<<<<<<<<<<<<<'
+
+    # Every birth date, passport and country of an entry makes its rows
+    name = 'LEE<<ANN' + '<' * 31
+    assert list(MRZPreimages.iter_rows({
+        'first_name': ['Ann'], 'last_name': ['Lee'], 'birth_date': '1970-01-02', 'birth_dates': ['1970-01-02', '1971'],
+        'has_passport': True, 'passports': ['P1'], 'nationality': ['FR'], 'countries': ['FR', 'US'],
+    })) == [
+        ('name', name), ('name_dob', name + '700102'), ('name_yob', name + '70'), ('name_yob', name + '71'),
+        ('passport_country', 'P1<<<<<<<FRA'), ('passport_country', 'P1<<<<<<<USA'),
+    ]
+
+
+def test_parse_cache_serves_stored_outputs(tmp_path):
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_bytes(b'[]')
+    output_path = str(tmp_path / 'out' / 'persons')
+    (tmp_path / 'out').mkdir()
+    (tmp_path / 'out' / 'persons.csv').write_text('id\n1\n')
+
+    cache = ParseCache(str(tmp_path / 'cache'))
+    digest = cache.hash_input(str(entities))
+    key = cache.key([digest], {'output_format': 'csv'})
+    assert cache.lookup(key) is None
+    cache.store(key, output_path, ['.csv', '.json'], [{'path': str(entities), 'sha256': digest}])
+    cache.save()
+
+    # The input hash is remembered, and any change of the inputs or options changes the key
+    cache = ParseCache(str(tmp_path / 'cache'))
+    assert cache.input_hashes[str(entities.resolve())]['sha256'] == digest
+    assert key not in (cache.key([digest], {'output_format': 'json'}), cache.key([digest, digest], {'output_format': 'csv'}))
+    manifest = cache.lookup(key)
+    assert manifest['files'] == ['.csv']
+
+    served_path = str(tmp_path / 'served')
+    assert cache.serve(key, manifest, served_path) == [served_path + '.csv']
+    assert (tmp_path / 'served.csv').read_text() == 'id\n1\n'
+
+
+def test_parser_server(tmp_path, capfd):
+    socket_path = str(tmp_path / 'parser.sock')
+    server = ParserServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        (tmp_path / 'entities.ftm.json').write_text(json.dumps([{
+            'id': 'p1', 'schema': 'Person',
+            'properties': {'firstName': ['Иван'], 'lastName': ['Петров'], 'birthDate': ['1970-01-01']},
+        }]), encoding='utf-8')
+        with ParserClient(socket_path, timeout=30) as client:
+            names = ['Иванов', "O'Brien-Smith", 'محمد']
+            assert client.normalize(names) == [normalize_name(name) for name in names]
+            exit_code, output = client.parse(['entities.ftm.json', '--output-format', 'json'], cwd=str(tmp_path))
+            assert exit_code == 0, output
+            assert json.loads((tmp_path / 'output' / 'persons_with_passports.json').read_text())[0]['id'] == 'p1'
+            exit_code, output = client.parse(['--unknown-option'])
+            assert exit_code == 2 and 'unrecognized arguments: --unknown-option' in output
+            exit_code, output = client.parse(['entities.ftm.json', '--tracemalloc', '5'], cwd=str(tmp_path))
+            assert exit_code == 2 and '--tracemalloc' in output
+            # Worker processes of a job are spawned, not forked from the threads of the server
+            (tmp_path / 'more.ftm.json').write_text(json.dumps([{
+                'id': 'p2', 'schema': 'Person', 'properties': {'name': ['Jon Smith']},
+            }]), encoding='utf-8')
+            exit_code, output = client.parse(['entities.ftm.json', 'more.ftm.json', '--workers', '2',
+                                              '--output-format', 'json', '--output-dir', 'workers'], cwd=str(tmp_path))
+            assert exit_code == 0, output
+            persons = json.loads((tmp_path / 'workers' / 'persons_with_passports.json').read_text())
+            assert [person['id'] for person in persons] == ['p1', 'p2']
+
+        # Jobs from several working directories at once each get their own paths and output
+        cwd = os.getcwd()
+        results = {}
+
+        def parse(job_dir):
+            job_dir.mkdir()
+            (job_dir / 'entities.ftm.json').write_text(json.dumps([{
+                'id': job_dir.name, 'schema': 'Person', 'properties': {'name': ['Jon Smith']},
+            }]), encoding='utf-8')
+            with ParserClient(socket_path, timeout=30) as client:
+                results[job_dir.name] = client.parse(['entities.ftm.json', '--output-format', 'json'], cwd=str(job_dir))
+
+        jobs = [threading.Thread(target=parse, args=(tmp_path / f'job{index}',)) for index in range(4)]
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+        for name, (exit_code, output) in results.items():
+            assert exit_code == 0, output
+            assert output.count('Parsing file:') == 1 and str(tmp_path / name) in output
+            assert json.loads((tmp_path / name / 'output' / 'persons_with_passports.json').read_text())[0]['id'] == name
+        assert len(results) == 4 and os.getcwd() == cwd
+        # Nothing is printed by the server process itself
+        assert capfd.readouterr() == ('', '')
+        with ParserClient(socket_path, timeout=30) as client:
+            client.shutdown()
+    finally:
+        thread.join(timeout=30)
+        server.server_close()
+
+
+def test_stage_profiler_metrics(tmp_path):
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(json.dumps(entity) for entity in [
+        {'id': 'p1', 'schema': 'Person', 'properties': {'name': ['Jon Smith', 'Иван Петров']}},
+        {'id': 'c1', 'schema': 'Company', 'properties': {'name': ['Acme']}},
+    ]), encoding='utf-8')
+    profiler = StageProfiler()
+    persons = list(iter_persons(str(entities), OpenSanctionsParser(profiler=profiler)))
+
+    metrics = profiler.metrics(entities.stat().st_size, len(persons))
+    assert (metrics['entities'], metrics['persons']) == (2, 1)
+    calls = {stage: stage_metrics['calls'] for stage, stage_metrics in metrics['stages'].items()}
+    # The company is skipped by the schema prefilter, before decoding, but still counted
+    assert calls['read_decode'] == 2 and calls['schema_filter'] == 1 and calls['extract'] == 1
+    assert calls['normalize'] == 2
+    # Stages are charged their own time only, so they add up to the time of the run
+    total = sum(stage_metrics['wall_seconds'] for stage_metrics in metrics['stages'].values())
+    assert abs(total - metrics['wall_seconds']) < 1e-6
+
+    save_metrics(metrics, str(tmp_path / 'metrics.json'))
+    assert json.loads((tmp_path / 'metrics.json').read_text())['entities'] == 2
+    prom = (tmp_path / 'metrics.prom').read_text()
+    assert 'zkpassport_sanctions_parser_entities 2\n' in prom
+    assert 'zkpassport_sanctions_parser_stage_wall_seconds{stage="extract"} ' in prom
+
+
+def test_stage_profiler_only_counts_the_children_of_its_run(tmp_path):
+    # A child process reaped before the run, as the workers of an earlier run or server job
+    subprocess.run([sys.executable, '-c', 'sum(range(10 ** 7))'], check=True)
+    profiler = StageProfiler()
+    metrics = profiler.metrics(0, 0)
+    assert metrics['cpu_seconds'] < 0.1 and metrics['peak_rss_children_bytes'] is None
+
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(json.dumps({
+        'id': f'p{index}', 'schema': 'Person', 'properties': {'name': ['Jon Smith']},
+    }) for index in range(10)) + '\n', encoding='utf-8')
+    profiler = StageProfiler()
+    persons = OpenSanctionsParser(workers=2, profiler=profiler).parse([str(entities)])
+    metrics = profiler.metrics(entities.stat().st_size, len(persons))
+    assert metrics['entities'] == 10
+    if metrics['peak_rss_bytes'] is not None:
+        # Reported by the workers themselves
+        assert metrics['peak_rss_children_bytes'] > 0
+
+
+def test_person_statistics_single_pass():
+    entities = [
+        {'id': f'Q{i}', 'schema': 'Person', 'datasets': ['wd_peps'] + (['us_ofac_sdn'] if i % 2 else []),
+         'properties': {'name': [f'John Smith{chr(65 + i % 26)}', f'Jon Smith{chr(65 + i % 26)}'],
+                        'passportNumber': [f'X{i}'] if i % 3 else [], 'topics': ['sanction']}}
+        for i in range(30)
+    ]
+    entries = [entry for entity in entities for entry in extract_person_data(entity)]
+    exact, approximate = PersonStatistics('exact', sample_size=3), PersonStatistics('hll', sample_size=3)
+    for entry in entries:
+        exact.add(entry)
+        approximate.add(entry)
+
+    report = exact.report()
+    assert report['total_entries'] == len(entries) == 60
+    assert report['unique_entities'] == len(approximate.unique_ids) == 30
+    assert report['persons_with_passports'] == 40
+    assert report['status'] == {'sanctioned': 60, 'pep': 60}
+    assert report['datasets'] == {'wd_peps': 60, 'us_ofac_sdn': 30}
+    # The reservoir holds passport holders only, and the same ones for the same seed
+    assert len(report['samples']) == 3 and all(sample['has_passport'] for sample in report['samples'])
+    assert report['samples'] == approximate.report()['samples']
+    json.dumps(report)
+
+
+def test_hyperloglog_estimate():
+    counter = HyperLogLog()
+    for i in range(50000):
+        counter.add(f'Q{i}')
+        counter.add(f'Q{i}')
+    assert abs(len(counter) - 50000) < 50000 * 0.03
+
+
+def test_parsers_keep_their_own_state(tmp_path):
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(json.dumps(entity) for entity in [
+        {'id': 'p1', 'schema': 'Person', 'properties': {'name': ['Иван Петров'], 'passportNumber': ['X1']}},
+        {'id': 'p2', 'schema': 'Person', 'properties': {'firstName': ['A', 'B'], 'lastName': ['C', 'D']}},
+        {'id': 'c1', 'schema': 'Company', 'properties': {'name': ['Acme']}},
+    ]), encoding='utf-8')
+    capped, uncapped = OpenSanctionsParser(max_name_combinations=1), OpenSanctionsParser()
+    results = {}
+
+    def parse(parser):
+        results[parser] = [[entry.name for entry in parser.parse([str(entities)], merge=False)] for _ in range(20)]
+
+    threads = [threading.Thread(target=parse, args=(parser,)) for parser in (capped, uncapped)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results[capped] == [['IVAN PETROV', 'A C']] * 20
+    assert results[uncapped] == [['IVAN PETROV', 'A C', 'A D', 'B C', 'B D']] * 20
+    # Each run starts its reports over
+    assert [entity['id'] for entity in capped.entities_without_latin_names] == ['p1']
+    assert [entity['id'] for entity in capped.entities_with_capped_names] == ['p2']
+    assert uncapped.entities_with_capped_names == []
+    # Worker processes get a copy of the configuration, without the caches
+    copy = pickle.loads(pickle.dumps(OpenSanctionsParser(max_name_combinations=1, profiler=StageProfiler())))
+    assert copy.max_name_combinations == 1 and [entry.name for entry in copy.parse([str(entities)])] == ['IVAN PETROV', 'A C']
+
+
+def test_schema_prefilter_only_skips_certain_lines(tmp_path):
+    lines = [
+        '{"id": "c1", "schema": "Company", "properties": {"name": ["Acme"]}}',
+        '{"id": "p1", "schema" : "Person", "properties": {"name": ["Jon Smith"]}}',
+        # Unsure: "schema" twice, an escaped value, an escape that could spell the key, no schema key
+        '{"id": "p2", "properties": {"name": ["Al Kay"], "notes": [{"schema": "Company"}]}, "schema": "Person"}',
+        '{"id": "p3", "schema": "Pers\\u006fn", "properties": {"name": ["Ann Lee"]}}',
+        '{"id": "p4", "schema": "Company", "sch\\u0065ma": "Person", "properties": {"name": ["Bo Ray"]}}',
+        '{"id": "x1", "properties": {"name": ["Acme"]}}',
+        '{"id": "c2", "schema": "Company", "properties": {"name": ["Acme"]}}',
+    ]
+    prefilter = SchemaPrefilter('Person')
+    assert [prefilter.skip(line) for line in lines] == [True, False, False, False, False, False, True]
+    assert [prefilter.skip(line.encode('utf-8')) for line in lines] == [True, False, False, False, False, False, True]
+
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(lines), encoding='utf-8')
+    prefilter = SchemaPrefilter('Person')
+    decoded = [entity['id'] for entity in iter_entities(str(entities), prefilter)]
+    assert decoded == ['c1', 'p1', 'p2', 'p3', 'p4', 'x1'] and prefilter.skipped == 1
+    # The persons are the same with and without the prefilter, serially and on workers
+    expected = [(entry.id, entry.name) for entry in OpenSanctionsParser(schema_prefilter=False).parse([str(entities)])]
+    assert [entry_id for entry_id, _ in expected] == ['p1', 'p2', 'p3', 'p4']
+    for workers in (1, 2):
+        parser = OpenSanctionsParser(workers=workers)
+        assert [(entry.id, entry.name) for entry in parser.parse([str(entities)])] == expected
+
+
+def _leaves(persons):
+    preimages = MRZPreimages()
+    for person in persons:
+        preimages.add(person.to_dict())
+    return {group: set(rows) for group, rows in preimages.rows.items()}
+
+
+def test_runs_keep_the_leaves_of_every_dataset(tmp_path):
+    datasets = [
+        [{'id': 'Q1', 'schema': 'Person', 'datasets': ['us_ofac_sdn'],
+          'properties': {'name': ['John Smith'], 'firstName': ['John'], 'lastName': ['Smith'],
+                         'birthDate': ['1970-01-02'], 'passportNumber': ['X1'], 'nationality': ['gb']}}],
+        [{'id': 'Q1', 'schema': 'Person', 'datasets': ['un_sc_sanctions'],
+          'properties': {'name': ['John Smith'], 'firstName': ['John'], 'lastName': ['Smith'],
+                         'birthDate': ['1971-03-04'], 'passportNumber': ['Y2'], 'nationality': ['fr']}}],
+    ]
+    files = []
+    for index, entities in enumerate(datasets):
+        path = tmp_path / f'dataset{index}.ftm.json'
+        path.write_text('\n'.join(json.dumps(entity) for entity in entities), encoding='utf-8')
+        files.append(str(path))
+
+    # The trees used to be built from one run per dataset
+    per_dataset = _leaves(entry for file in files for entry in OpenSanctionsParser().parse([file], merge=False))
+    assert _leaves(OpenSanctionsParser().parse(files, merge=False)) == per_dataset
+    assert _leaves(OpenSanctionsParser(workers=2).parse(files, merge=False)) == per_dataset
+    assert len(per_dataset['name_dob']) == len(per_dataset['passport_country']) == 2
+    # Merged entries keep every birth date, passport and country, so they make the same leaves,
+    # plus the passports paired with the nationalities found in the other datasets
+    merged = _leaves(OpenSanctionsParser().parse(files))
+    assert all(merged[group] >= per_dataset[group] for group in MRZPreimages.GROUPS)
+    assert merged['name_dob'] == per_dataset['name_dob'] and len(merged['passport_country']) == 4
+
+
+def test_merge_person_entries():
+    parser = OpenSanctionsParser()
+    sdn = {'id': 'Q1', 'schema': 'Person', 'datasets': ['us_ofac_sdn'],
+           'properties': {'name': ['John Smith'], 'passportNumber': ['X1'], 'nationality': ['gb'],
+                          'topics': ['sanction']}}
+    un = {'id': 'Q1', 'schema': 'Person', 'datasets': ['un_sc_sanctions', 'us_ofac_sdn'],
+          'properties': {'name': ['John Smith', 'Jon Smith'], 'passportNumber': ['Y2', 'X1'], 'nationality': ['fr'],
+                         'topics': ['wanted'], 'birthDate': ['1970-01-02']}}
+    other = {'id': 'Q2', 'schema': 'Person', 'datasets': ['un_sc_sanctions'], 'properties': {'name': ['Ann Lee']}}
+    entries = [entry for entity in (sdn, other, un) for entry in parser.extract(entity)]
+    before = [entry.to_dict() for entry in entries]
+    merged = merge_person_entries(entries, parser)
+
+    # One entry per id and name, in order of first appearance
+    assert [(entry.id, entry.name) for entry in merged] == [('Q1', 'JOHN SMITH'), ('Q2', 'ANN LEE'), ('Q1', 'JON SMITH')]
+    john = merged[0].to_dict()
+    # Lists are unions in first-seen order, statuses have the flags of all the entries
+    assert john['passports'] == ['X1', 'Y2']
+    assert john['nationality'] == ['GB', 'FR']
+    assert john['datasets'] == ['us_ofac_sdn', 'un_sc_sanctions']
+    assert john['status'] == ['sanctioned', 'wanted']
+    # The first known birth date is kept
+    assert john['birth_date'] == '1970-01-02' and john['birth_dates'] == ['1970-01-02']
+    assert merged[2].to_dict() == before[3]
+    # The input entries are left as they were
+    assert [entry.to_dict() for entry in entries] == before
+    # Merged code tuples are shared through the parser's interner
+    assert merged[0].datasets is parser.code_interner.intern(['us_ofac_sdn', 'un_sc_sanctions'])
+
+
+def test_incremental_state_reuses_unchanged_entities(tmp_path):
+    entities = [
+        {'id': 'p1', 'schema': 'Person', 'datasets': ['ds'], 'properties': {'name': ['Jon Smith'], 'passportNumber': ['X1']}},
+        {'id': 'p2', 'schema': 'Person', 'datasets': ['ds'], 'properties': {'name': ['Иван Петров']}},
+        {'id': 'c1', 'schema': 'Company', 'datasets': ['ds'], 'properties': {'name': ['Acme']}},
+    ]
+    path = tmp_path / 'entities.ftm.json'
+    state_dir = str(tmp_path / 'state')
+
+    def run(entities, max_name_combinations=0):
+        path.write_text('\n'.join(json.dumps(entity) for entity in entities), encoding='utf-8')
+        parser = OpenSanctionsParser(max_name_combinations)
+        state = IncrementalState(state_dir, max_name_combinations)
+        loaded = state.load()
+        persons = [entry.to_dict() for entry in parser.iter_persons([str(path)], state)]
+        state.save()
+        full = [entry.to_dict() for entry in OpenSanctionsParser(max_name_combinations).iter_persons([str(path)])]
+        # Reused or not, the entries and reports are those of a full run
+        assert persons == full
+        assert [entity['id'] for entity in parser.entities_without_latin_names] == ['p2']
+        return loaded, state
+
+    loaded, state = run(entities)
+    assert not loaded and (state.extracted, state.reused) == (2, 0)
+    loaded, state = run(entities)
+    assert loaded and (state.extracted, state.reused) == (0, 2)
+    # Only the changed entity is extracted again, the key order of its serialization doesn't matter
+    changed = [dict(reversed(list(entities[0].items()))), {**entities[1], 'datasets': ['other']}, entities[2]]
+    loaded, state = run(changed)
+    assert (state.extracted, state.reused) == (1, 1)
+    assert state.delta() == {'added': [], 'changed': ['p2'], 'removed': [], 'unchanged': 1}
+    loaded, state = run(changed[1:])
+    assert state.delta()['removed'] == ['p1']
+    # A state saved with other options is not used
+    loaded, state = run(changed, max_name_combinations=1)
+    assert not loaded and (state.extracted, state.reused) == (2, 0)
+
+
+def test_workers_write_the_same_outputs_as_a_serial_run(tmp_path):
+    rng = random.Random(7)
+    names = ['John Smith', 'Иван Петров', 'محمد علي', 'Zoë Ängström', 'Ann Lee']
+    inputs = []
+    # JSON arrays are not split into byte ranges, each file is one shard
+    for index in range(3):
+        entities = [
+            {'id': f'p{rng.randrange(40)}', 'schema': rng.choice(['Person', 'Person', 'Company']),
+             'datasets': [f'ds{index}'],
+             'properties': {'name': rng.sample(names, 2), 'passportNumber': [f'X{rng.randrange(99)}'],
+                            'nationality': [rng.choice(['gb', 'ru', 'fr'])], 'birthDate': ['1970-01-02']}}
+            for _ in range(30)
+        ]
+        path = tmp_path / f'dataset{index}.json'
+        path.write_text(json.dumps(entities, indent=2), encoding='utf-8')
+        inputs.append(str(path))
+
+    outputs = {}
+    for workers in (1, 3):
+        output_dir = tmp_path / f'workers{workers}'
+        OpenSanctionsParser(workers=workers).run(inputs, str(output_dir), output_format='all', mrz_output='bin')
+        outputs[workers] = {path.name: path.read_bytes() for path in sorted(output_dir.iterdir())}
+    assert len(outputs[1]) > 1 and outputs[1].keys() == outputs[3].keys()
+    for name, content in outputs[1].items():
+        if name.endswith('_statistics.json'):
+            # Workers don't share their name caches, so only the cache counters may differ
+            serial, parallel = json.loads(content), json.loads(outputs[3][name])
+            serial.pop('name_cache')
+            parallel.pop('name_cache')
+            assert serial == parallel
+        else:
+            assert content == outputs[3][name], name
+
+
+def test_name_cache_evicts_the_least_recently_used_names(tmp_path):
+    cache = NameCache(3)
+    for name in ['A', 'B', 'C']:
+        assert normalize_name(name, cache) == (True, name)
+    assert (cache.hits, cache.misses) == (0, 3)
+    # Using A makes B the least recently used name, evicted by D
+    assert normalize_name('A', cache) == (True, 'A')
+    normalize_name('D', cache)
+    assert len(cache) == 3
+    assert cache.get('B') is None and cache.get('A') == (True, 'A')
+    # Shrinking evicts the least recently used names first
+    cache.resize(2)
+    assert cache.get('C') is None and cache.get('D') == (True, 'D') and len(cache) == 2
+    # Saved and loaded least recently used first, so the order is kept and the bound applies
+    path = str(tmp_path / 'names.json')
+    cache.save(path)
+    smaller = NameCache(1)
+    assert smaller.load(path) == 2
+    assert len(smaller) == 1 and smaller.get('D') == (True, 'D')
+    # A cache of size 0 stores nothing but still counts
+    empty = NameCache(0)
+    assert normalize_name('Иван', empty) == normalize_name('Иван', empty) == (False, 'IVAN')
+    assert len(empty) == 0 and (empty.hits, empty.misses) == (0, 2)
+
+
+def test_worker_reports_list_each_entity_once(tmp_path, monkeypatch):
+    # Many small shards, so later shard tasks are sent while the reports of earlier ones come back
+    monkeypatch.setattr(parse_opensanctions, 'SHARD_TARGET_SIZE', 4096)
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(json.dumps({
+        'id': f'p{index}', 'schema': 'Person',
+        'properties': {'name': ['Иван Петров'], 'firstName': ['Анна', 'Борис'], 'lastName': ['Сидоров', 'Кузнецов']},
+    }) for index in range(1600)) + '\n', encoding='utf-8')
+    serial = OpenSanctionsParser(max_name_combinations=2)
+    serial.parse([str(entities)], merge=False)
+    parser = OpenSanctionsParser(max_name_combinations=2, workers=2)
+    parser.parse([str(entities)], merge=False)
+    for report in ['entities_without_latin_names', 'entities_with_capped_names']:
+        ids = [entity['id'] for entity in getattr(parser, report)]
+        assert len(ids) == len(set(ids)) == 1600, report
+        assert getattr(parser, report) == getattr(serial, report)
+        # Copies sent to the workers leave the reports of the run behind
+        assert getattr(pickle.loads(pickle.dumps(parser)), report) == []
+
+
+class _CountingPool:
+    """In-process stand-in for multiprocessing.Pool, counting the shards submitted and not consumed yet."""
+
+    def __init__(self, processes):
+        self.in_flight = self.max_in_flight = 0
+
+    def apply_async(self, function, args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Tasks are pickled as they would be on their way to a worker
+        result = function(*pickle.loads(pickle.dumps(args)))
+        pool = self
+
+        class Result:
+            def get(self):
+                pool.in_flight -= 1
+                return result
+        return Result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def test_workers_only_have_a_window_of_shards_in_flight(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_opensanctions, 'SHARD_TARGET_SIZE', 1024)
+    pools = []
+    context = type('Context', (), {'Pool': staticmethod(lambda processes: pools.append(_CountingPool(processes)) or pools[-1])})
+    monkeypatch.setattr(parse_opensanctions.multiprocessing, 'get_context', lambda method=None: context)
+    entities = tmp_path / 'entities.ftm.json'
+    entities.write_text('\n'.join(json.dumps({
+        'id': f'p{index}', 'schema': 'Person', 'properties': {'name': [f'Jon Smith{index}']},
+    }) for index in range(500)) + '\n', encoding='utf-8')
+    expected = [entry.to_dict() for entry in OpenSanctionsParser().iter_persons([str(entities)])]
+    assert [entry.to_dict() for entry in OpenSanctionsParser(workers=3).iter_persons([str(entities)])] == expected
+    assert pools[0].in_flight == 0
+    assert pools[0].max_in_flight == 3 * parse_opensanctions.SHARDS_IN_FLIGHT_PER_WORKER
+    assert len(parse_opensanctions.plan_shards([str(entities)], 3)) > pools[0].max_in_flight
+
+
+STREAM_ENTITIES = [
+    {'id': 'p1', 'schema': 'Person', 'properties': {'name': ['Jon "J" Smith', 'Иван'], 'score': [-1.5e3, 0, 12]}},
+    {'id': 'c1', 'schema': 'Company', 'properties': {'active': [True, False, None], 'name': ['A\\B \u00e9']}},
+]
+
+
+class _CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_json_stream_decoder_with_tiny_chunks():
+    array = json.dumps(STREAM_ENTITIES, indent=2)
+    wrapper = json.dumps({'meta': {'n': [1, 2]}, 'entities': STREAM_ENTITIES, 'after': 'x'}, ensure_ascii=False)
+    for chunk_size in range(1, 8):
+        assert list(_JSONStreamDecoder(io.StringIO(array), chunk_size).iter_array()) == STREAM_ENTITIES
+        decoder = _JSONStreamDecoder(io.StringIO(wrapper), chunk_size)
+        assert list(decoder.iter_entities_in_object()) == STREAM_ENTITIES
+    # Literals and escapes cut off anywhere are completed from the next chunks
+    for text in ['[true, false, null, -Infinity, 1.25e-3, "\\u00e9\\\\"]', '{"entities": [{"a": "\\ud83d\\ude00"}]}']:
+        for chunk_size in range(1, 8):
+            decoder = _JSONStreamDecoder(io.StringIO(text), chunk_size)
+            values = list(decoder.iter_array() if text[0] == '[' else decoder.iter_entities_in_object())
+            assert values == (json.loads(text) if text[0] == '[' else json.loads(text)['entities'])
+
+
+def test_json_stream_decoder_fails_fast_on_malformed_input():
+    reader = _CountingReader('[{"id": "p1"}, {"id": x}, ' + ', '.join(['{"id": "p2"}'] * 10000) + ']')
+    entities = _JSONStreamDecoder(reader, 16).iter_array()
+    assert next(entities) == {'id': 'p1'}
+    with pytest.raises(json.JSONDecodeError):
+        next(entities)
+    # The malformed value is reported without reading the rest of the input
+    assert reader.reads < 5
+
+
+def test_iter_entities_layouts(tmp_path):
+    layouts = {
+        'array.json': json.dumps(STREAM_ENTITIES, indent=2),
+        'wrapper.json': json.dumps({'entities': STREAM_ENTITIES}, indent=2),
+        'lines.ndjson': '\n'.join(json.dumps(entity) for entity in STREAM_ENTITIES) + '\n\nnot json\n',
+    }
+    for name, text in layouts.items():
+        path = tmp_path / name
+        path.write_text(text, encoding='utf-8')
+        assert list(iter_entities(str(path))) == STREAM_ENTITIES, name
+
+
+def test_compression_is_detected_from_the_magic_bytes(tmp_path):
+    lines = '\n'.join(json.dumps(entity) for entity in STREAM_ENTITIES).encode('utf-8')
+    array = json.dumps(STREAM_ENTITIES).encode('utf-8')
+    compressors = {'bz2': bz2.compress, 'xz': lzma.compress, 'gzip': gzip.compress, None: bytes}
+    for compression, compress in compressors.items():
+        for layout, content in [('lines', lines), ('array', array)]:
+            # The file names don't tell the compression, or tell a wrong one
+            path = tmp_path / f'{compression}_{layout}.json.gz'
+            path.write_bytes(compress(content))
+            assert detect_compression(str(path)) == compression
+            assert list(iter_entities(str(path))) == STREAM_ENTITIES, (compression, layout)
+    # Only the start of the file counts
+    path = tmp_path / 'late_magic.ndjson'
+    path.write_bytes(b'\n' + bz2.compress(lines))
+    assert detect_compression(str(path)) is None
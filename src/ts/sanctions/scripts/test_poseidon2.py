@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: GPL-3.0
+"""
+Cross-checks of the Python Poseidon2 against the vectors of the Noir sanctions library.
+Run with: python -m pytest src/ts/sanctions/scripts
+"""
+
+import io
+
+from parse_opensanctions import MRZPreimages
+from poseidon2 import ROUND_CONSTANTS, hash_leaf, hash_leaves, hash_mrz_preimages, poseidon2_hash
+
+# Root of the sanctions tree in src/noir/lib/exclusion-check/sanctions/src/lib.nr
+SANCTIONS_TREE_ROOT = 0x06caac33440d8a83b838f07ba0e2bbe7e9889f10915efcb37396534f1feadac5
+
+# Shared top of the sibling paths of the proofs in ordered_mt.nr and tests.nr
+SHARED_PATH_TOP = [
+    18603683295116425944172923198605921892107095987681914655028475372448354804282,
+    3218243980816964110015535469652973420290887819006413761652914020854170460131,
+]
+
+
+def compute_root(leaf: int, leaf_index: int, sibling_path) -> int:
+    """Same as ordered_mt_verify_inclusion in ordered_mt.nr, returning the root."""
+    current = leaf
+    for i, sibling in enumerate(sibling_path):
+        if (leaf_index >> i) & 1:
+            current = poseidon2_hash([sibling, current], 2)
+        else:
+            current = poseidon2_hash([current, sibling], 2)
+    return current
+
+
+def test_round_constants():
+    assert ROUND_CONSTANTS[0] == 0x19b849f69450b06848da1d39bd5e4a4302bb86744edc26238b0878e269ed23e5
+    assert len(ROUND_CONSTANTS) == 8 * 4 + 56
+
+
+def test_ordered_mt_non_membership_vector():
+    # test_ordered_mt_non_membership in ordered_mt.nr: the zero leaf at index 0
+    sibling_path = [
+        2538969154464207075551963849493461100763984781772059631317977345015494,
+        7408567622264251325527675560234305459782199557670748003992045507255676782346,
+        17172503195274368373973764532145219118560142872605990247328955843400030737405,
+        21527630554632879813368054281177817606242864379795907214239176075955007902912,
+        18699126562668176235057823815067222211248876631773067142149349644662028539852,
+        15855547126666558158108890886036128838123609376466069853621349658242826003996,
+        18096792214306805418846341841781764327280296975829390385578507005497037463148,
+        4882445789907605022811992043069539558472414294163826085271470580313337999406,
+        16053354931905793903685412466246134688474814165207331604886125072612196680241,
+        3396847249872894248857523484515784266052422898507254149535419922174645272355,
+        18445344656590747902642614900015537005931447962637142044356671182767079047806,
+        18820138521757667575505291311223932864682153951596251749778606261768461287703,
+        13266561301471257258539044592892442240556507457562242352281174682693065357580,
+        9295065156886282224341478908698448565384819123602296403920973906630830832025,
+        5019181415106207781408050313923556940335758386868045756608045713679758661105,
+        6170047750834888331597810312282160751025283295819884664149158819731763951095,
+    ] + SHARED_PATH_TOP
+    assert compute_root(0, 0, sibling_path) == SANCTIONS_TREE_ROOT
+
+
+def test_sanctioned_name_leaf_vector():
+    # test_of_sanctioned_person in tests.nr: the leaf is the hash of the MRZ name bytes
+    sibling_path = [
+        9917525085591752581815867813532608282359240187823645181665529410618628728607,
+        11024720902279861419707121301282248041705611189334295156511954285840747507681,
+        6093210581771637141817501526156021647071588678207749129795154601225450335984,
+        21557156977843397563230019795454032336154610869060080115810964630067739381775,
+        525152197508306438415845891017264353252280392817907875036646549756386798490,
+        17027532763028032045609667908146807398933878510250484298013381664050338886380,
+        4258851587840297575757919362131042591997712692864410864843044615548236976087,
+        20058026658998762090878767264285225929110573584189252232088241492168476779018,
+        12007708726336644823628535739563288646877732292094648407738365038341516155609,
+        12334012466530044503708088029127195535605883656264922297607521473999562737133,
+        19582666126365533658143192136117783018968407759197979471139451711186714817796,
+        14058483685472431627034796845617326784026902534036835598958196290194680760975,
+        1913885167271226048900869664928774533906534828591045315003513706548389395567,
+        10137962158573734050162686176154332483946400485913588436121049706320967897922,
+        20865758332970325045263219825193635787614754990818729783792516628094684528923,
+        21492147508593555798954276854884538585208918386284299128827770232157281300008,
+    ] + SHARED_PATH_TOP
+    leaf = hash_leaf(b"DAVIS<<MICHAEL<<<<<<<<<<<<<<<<<<<<<<<<<")
+    assert compute_root(leaf, 57070, sibling_path) == SANCTIONS_TREE_ROOT
+
+
+def test_non_sanctioned_name_falls_between_proof_leaves():
+    # test_non_inclusion_of_dg1 in tests.nr: the name hash lies between the two adjacent leaves
+    leaf = hash_leaf(b"DOE<<JOHN<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<")
+    assert 8956333565342100626175684213002399724701754566975930761671412343567175376742 < leaf
+    assert leaf < 8956500318397858565112995016720085659827620516307512068909343396650685795378
+
+
+def test_batched_hashing_matches_single_hashing():
+    preimages = MRZPreimages()
+    for i in range(12):
+        preimages.add({
+            'first_name': [f'JOHN{i}'], 'last_name': ['DOE'], 'birth_date': f'19{i + 50}-01-02',
+            'has_passport': True, 'passports': [f'P{i}'], 'nationality': ['GB'], 'countries': [],
+        })
+    f = io.BytesIO()
+    preimages.write_binary(f)
+    f.seek(0)
+    groups = MRZPreimages.read_binary(f)
+    assert groups == preimages_as_codes(preimages)
+
+    rows = [row for group_rows in groups.values() for row in group_rows]
+    expected = [hash_leaf(row) for row in rows]
+    assert hash_leaves(rows, workers=2, batch_size=5) == expected
+    leaves = hash_mrz_preimages(groups, workers=2)
+    assert [leaf for group_leaves in leaves.values() for leaf in group_leaves] == expected
+    assert [len(group_leaves) for group_leaves in leaves.values()] == [12, 12, 12, 12]
+
+
+def preimages_as_codes(preimages: MRZPreimages):
+    return {group: [row[::2] for row in rows] for group, rows in preimages.rows.items()}
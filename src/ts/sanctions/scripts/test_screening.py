@@ -0,0 +1,103 @@
+# SPDX-License-Identifier: GPL-3.0
+"""
+Tests of the screening index.
+Run with: python -m pytest src/ts/sanctions/scripts
+"""
+
+import json
+
+from parse_opensanctions import MRZPreimages, NameCache, extract_person_data
+from screening import MappedScreeningIndex, ScreeningIndex, load_index, query_rows
+
+
+ENTITIES = [
+        {'id': 'p1', 'schema': 'Person', 'datasets': ['us_ofac_sdn'], 'properties': {
+            'firstName': ['Иван'], 'lastName': ['Петров'], 'birthDate': ['1970-03-04'],
+            'passportNumber': ['AB123'], 'nationality': ['ru'], 'topics': ['sanction'],
+        }},
+        {'id': 'p2', 'schema': 'Person', 'properties': {
+            'firstName': ['Jean-Paul'], 'lastName': ["O'Neil"], 'birthDate': ['1981'],
+        }},
+]
+
+
+def build_index() -> ScreeningIndex:
+    index = ScreeningIndex()
+    for entity in ENTITIES:
+        for person in extract_person_data(entity):
+            index.add(person.to_dict())
+    return index
+
+
+def test_queries_match_the_entry_preimages():
+    index = build_index()
+    query = {'first_name': 'Ivan', 'last_name': 'Petrov', 'birth_date': '700304'}
+    assert query_rows(query) == [('name', 'PETROV<<IVAN' + '<' * 27), ('name_dob', 'PETROV<<IVAN' + '<' * 27 + '700304'),
+                                 ('name_yob', 'PETROV<<IVAN' + '<' * 27 + '70')]
+
+    results = index.screen([
+        query,
+        # Raw names are normalized with the rules of the parser
+        {'first_name': ['Иван'], 'last_name': ['Петров'], 'birth_date': '1971-01-01'},
+        {'passport_number': 'AB123', 'nationality': 'RUS'},
+        {'first_name': 'jean paul', 'last_name': 'ONeil', 'birth_date': '1981-06-07'},
+        {'first_name': 'John', 'last_name': 'Doe'},
+    ])
+    assert results[0] == [{'id': 'p1', 'status': ['sanctioned'], 'groups': ['name', 'name_dob', 'name_yob']}]
+    assert [match['groups'] for match in results[1]] == [['name']]
+    assert [match['groups'] for match in results[2]] == [['passport_country']]
+    assert [(match['id'], match['groups']) for match in results[3]] == [('p2', ['name', 'name_yob'])]
+    assert results[4] == []
+
+    keys = ['AB123<<<<RUS', 'AB123<<<<FRA']
+    assert index.lookup_keys('passport_country', keys) == [[0], ()]
+    assert set(index.keys) == set(MRZPreimages.GROUPS)
+
+
+def test_key_file_answers_like_the_index(tmp_path):
+    index = build_index()
+    key_file = tmp_path / 'keys.bin'
+    with open(key_file, 'wb') as f:
+        index.write_key_file(f)
+
+    queries = [
+        {'first_name': 'Ivan', 'last_name': 'Petrov', 'birth_date': '1970-03-04'},
+        {'passport_number': 'AB123', 'nationality': 'RU'},
+        {'first_name': 'Jean Paul', 'last_name': 'ONeil', 'birth_date': '810101'},
+        {'first_name': 'John', 'last_name': 'Doe'},
+    ]
+    with load_index(str(key_file)) as mapped:
+        assert isinstance(mapped, MappedScreeningIndex)
+        assert len(mapped) == 2
+        assert mapped.screen(queries) == index.screen(queries)
+        keys = ['AB123<<<<RUS', 'AB123<<<<FRA']
+        assert mapped.lookup_keys('passport_country', keys) == [[0], []]
+
+
+def test_batches_screen_like_single_queries(tmp_path):
+    persons_file = tmp_path / 'persons.ndjson'
+    with open(persons_file, 'w', encoding='utf-8') as f:
+        for entity in ENTITIES:
+            for person in extract_person_data(entity):
+                f.write(json.dumps(person.to_dict(), ensure_ascii=False) + '\n')
+    key_file = tmp_path / 'keys.bin'
+    with open(key_file, 'wb') as f:
+        build_index().write_key_file(f)
+
+    queries = [
+        {'first_name': 'John', 'last_name': 'Doe'},
+        {'first_name': ['Иван', 'Jean'], 'last_name': 'Petrov', 'birth_date': '1970-03-04',
+         'passport_number': ['AB123', 'XY999'], 'nationality': ['RU', 'FR']},
+        {'first_name': 'Jean Paul', 'last_name': 'ONeil', 'birth_date': '810101'},
+        {'first_name': 'Ivan', 'last_name': 'Petrov'},
+    ] * 3
+    name_cache = NameCache()
+    # The in-memory index is a context manager too, so either kind of index can be opened the same way
+    with load_index(str(persons_file), name_cache) as index, load_index(str(key_file)) as mapped:
+        assert type(index) is ScreeningIndex and index.name_cache is name_cache
+        expected = [index.screen([query])[0] for query in queries]
+        assert index.screen(queries) == expected
+        assert mapped.screen(queries) == expected
+    assert [match['id'] for match in expected[1]] == ['p1']
+    assert expected[1][0]['groups'] == ['name', 'name_dob', 'name_yob', 'passport_country']
+    assert name_cache.hits > 0 and len(name_cache) == 8
@@ -83,33 +83,37 @@ async function generateSanctionsTrees() {
     }
     
     const pythonScript = path.join(__dirname, "../scripts/parse_opensanctions.py");
-    for (const {entities, datasetName} of openSanctionsResults) {
-        // The Python script expects the entities as a single file, so we need to write them to a file
+    // The Python script expects the entities as files, so we need to write them to disk
+    const entitiesFiles = openSanctionsResults.map(({entities, datasetName}) => {
         const entitiesFile = path.join(__dirname, `../temp/${datasetName}_entities.ftm.json`);
         fs.writeFileSync(entitiesFile, entities);
-        // Run the python script to parse the entities
-        const cmd = await exec(`python ${pythonScript} ${entitiesFile} --output-dir ${path.join(__dirname, `../input/${datasetName}`)}`)
-        const promise = new Promise((resolve, reject) => {
-            cmd.once("close", (code) => {
-                if (code !== 0) {
-                    reject(new Error("Error running python script: " + code));
-                }
-                resolve(true);
-            });
-            cmd.once("error", (error) => {
-                reject(new Error("Error running python script: " + error));
-            });
+        return entitiesFile;
+    });
+    // Run the python script once to parse all the datasets, merging the persons listed in several of them
+    // A merged entry keeps every birth date, passport and country of the datasets, so no leaf is lost
+    // The MRZ preimages are also written so the tree can be cross-checked against the Python builder
+    // The parse cache lives outside of the temp directory, which is cleared on every run, so unchanged datasets hit it
+    const cmd = await exec(`python ${pythonScript} ${entitiesFiles.join(" ")} --workers ${entitiesFiles.length} --mrz-output bin --cache-dir ${path.join(__dirname, `../cache/parse`)} --output-dir ${path.join(__dirname, `../input/all`)}`)
+    const promise = new Promise((resolve, reject) => {
+        cmd.once("close", (code) => {
+            if (code !== 0) {
+                reject(new Error("Error running python script: " + code));
+            }
+            resolve(true);
         });
-        await promise.then(() => {
-            // Delete the entities file
-            console.log(`${datasetName} parsed successfully by the python script`);
-        }).catch((error) => {
-            console.error("Error parsing ", datasetName, " with the python script: ", error);
+        cmd.once("error", (error) => {
+            reject(new Error("Error running python script: " + error));
         });
-        fs.unlinkSync(entitiesFile);
-    }
+    });
+    await promise.then(() => {
+        console.log(`${sanctionsListNames.join(", ")} parsed successfully by the python script`);
+    }).catch((error) => {
+        console.error("Error parsing ", sanctionsListNames.join(", "), " with the python script: ", error);
+    });
+    // Delete the entities files
+    entitiesFiles.forEach((entitiesFile) => fs.unlinkSync(entitiesFile));
 
-    const sanctionsLists = openSanctionsResults.map(({datasetName}) => JSON.parse(fs.readFileSync(path.join(__dirname, `../input/${datasetName}/persons_with_passports.json`), 'utf8')));
+    const sanctionsList: SanctionsEntry[] = JSON.parse(fs.readFileSync(path.join(__dirname, `../input/all/persons_with_passports.json`), 'utf8'));
 
     // Generate the tree for each sanctions list
     /*console.log("Generating Trees for each sanctions list");
@@ -128,12 +132,38 @@ async function generateSanctionsTrees() {
     // Generate the tree for all sanctions lists
     console.log("Generating Tree for all sanctions lists combined");
     try {
-        const singleTreeSerialized = await generateSanctionsTreesForList(sanctionsLists.flat());
+        const singleTreeSerialized = await generateSanctionsTreesForList(sanctionsList);
         fs.writeFileSync(path.join(__dirname, `../output/all_sanctions_tree.json`), JSON.stringify(singleTreeSerialized, null, 2));
         console.log("Tree generated for all sanctions lists");
     } catch (error) {
         console.error("Error generating tree for all sanctions lists", error);
     }
+
+    // Cross-check the root against the one of the tree built by the Python scripts from the same entries
+    console.log("Cross-checking the tree root with the Python tree builder");
+    try {
+        const scriptsDir = path.join(__dirname, "../scripts");
+        const leavesFile = path.join(__dirname, `../temp/leaves.json`);
+        await runCommand(`python ${scriptsDir}/poseidon2.py ${path.join(__dirname, `../input/all/persons_with_passports_mrz.bin`)} --output ${leavesFile}`);
+        await runCommand(`python ${scriptsDir}/ordered_mt.py ${leavesFile} --binary-output ${path.join(__dirname, `../output/all_sanctions_tree.bin`)} --compare ${path.join(__dirname, `../output/all_sanctions_tree.json`)}`);
+        console.log("Tree root matches the Python tree builder");
+    } catch (error) {
+        console.error("Tree root cross-check with the Python tree builder failed", error);
+        process.exitCode = 1;
+    }
+}
+
+function runCommand(command: string): Promise<void> {
+    return new Promise((resolve, reject) => {
+        const child = exec(command);
+        child.once("close", (code) => {
+            if (code !== 0) {
+                reject(new Error(`${command} exited with code ${code}`));
+            }
+            resolve();
+        });
+        child.once("error", reject);
+    });
 }
 
 
@@ -92,29 +92,23 @@ export function nameToMRZ(sanctionsList: SanctionsEntry[]): MRZData[] {
 
     for (const item of sanctionsList) {
         // todo: fix what has it and what does not
-        let processedDob: string | null = null;
-        let processedYear: string | null = null;
-        let processedYearMRZ: bigint[] | null = null;
-        let processedDobMRZ: bigint[] | null = null;
-
-        if (item.birth_date) {
-            const {dob, dobMRZ, year, yearMRZ} = processDob(item.birth_date);
-            processedDob = dob;
-            processedDobMRZ = dobMRZ;
-            processedYear = year.slice(-2);
-            processedYearMRZ = yearMRZ;
-        }
+        // Every birth date makes its own leaves, entries written before birth_dates only have birth_date
+        const birthDates = item.birth_dates ?? (item.birth_date ? [item.birth_date] : []);
+        // An entry without a birth date still makes its name leaves
+        const processedDobs = birthDates.length > 0 ? birthDates.map((birthDate) => processDob(birthDate)) : [null];
         const {nameMRZ, name} = processName(item.first_name, item.last_name);
 
         for (let i = 0; i < nameMRZ.length; i++) {
-            processedList.push({
-                name: name[i],
-                nameMRZ: nameMRZ[i],
-                dob: processedDob,
-                dobMRZ: processedDobMRZ,
-                year: processedYear,
-                yearMRZ: processedYearMRZ,
-            })
+            for (const processedDob of processedDobs) {
+                processedList.push({
+                    name: name[i],
+                    nameMRZ: nameMRZ[i],
+                    dob: processedDob?.dob ?? null,
+                    dobMRZ: processedDob?.dobMRZ ?? null,
+                    year: processedDob ? processedDob.year.slice(-2) : null,
+                    yearMRZ: processedDob?.yearMRZ ?? null,
+                })
+            }
         }
     }
 
@@ -126,9 +120,31 @@ export function passportNoAndCountry(sanctionsEntry: SanctionsEntry): PassportMR
         return null;
     }
 
-    let passportNo = sanctionsEntry.passports[0];
     const passportCountryAlpha2Code = sanctionsEntry.nationality.length > 0 ? sanctionsEntry.nationality[0] : sanctionsEntry.countries[0];
+    return formatPassportNoAndCountry(sanctionsEntry.passports[0], passportCountryAlpha2Code);
+}
 
+// Each passport with each country, nationalities first. A merged entry may have its passports
+// and nationalities from different datasets, so every pair makes a leaf
+export function passportsNoAndCountry(sanctionsEntry: SanctionsEntry): PassportMRZData[] {
+    if (!sanctionsEntry.has_passport) {
+        return [];
+    }
+
+    const countryCodes = [...new Set([...sanctionsEntry.nationality, ...sanctionsEntry.countries])];
+    const passportMRZs: PassportMRZData[] = [];
+    for (const passportNo of sanctionsEntry.passports) {
+        for (const countryCode of countryCodes) {
+            const passportMRZ = formatPassportNoAndCountry(passportNo, countryCode);
+            if (passportMRZ) {
+                passportMRZs.push(passportMRZ);
+            }
+        }
+    }
+    return passportMRZs;
+}
+
+function formatPassportNoAndCountry(passportNo: string, passportCountryAlpha2Code: string): PassportMRZData | null {
     const passportCountry = passportCountryAlpha2Code && passportCountryAlpha2Code.length === 2 ? countryCodeAlpha2ToAlpha3(passportCountryAlpha2Code) : passportCountryAlpha2Code;
     if (!passportCountry) {
         return null;
@@ -152,10 +168,7 @@ export function passportToMRZ(sanctionsList: SanctionsEntry[]): PassportMRZData[
     const processedList: PassportMRZData[] = [];
 
     for (const item of sanctionsList) {
-        const passportMRZ = passportNoAndCountry(item);
-        if (passportMRZ) {
-            processedList.push(passportMRZ);
-        }
+        processedList.push(...passportsNoAndCountry(item));
     }
 
     return processedList;
@@ -14,7 +14,8 @@ export type SanctionsEntry = {
   last_name: string[]
   all_names: string[]
   aliases: string[]
-  birth_date: string // YYYY-MM-DD or YYYY
+  birth_date: string // YYYY-MM-DD or YYYY, the first of birth_dates
+  birth_dates: string[]
   passports: string[]
   nationality: Alpha2Code[]
   has_passport: boolean